@@ -54,6 +54,7 @@ FORM_RENDERER = 'django.forms.renderers.TemplatesSetting'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'march_madness.middleware.InstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -95,6 +96,25 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+# The cache is shared by every worker process and management command on this machine, so a change saved by one process
+# invalidates the cached brackets, seeds and scores of all of them. Use Redis or Memcached when running on more than one
+# machine.
+# Every user has a cached card for every match (63 per user for a 64 team bracket), so MAX_ENTRIES must be well above
+# the number of users times the number of matches or the cards are culled before they are read again.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 200000},
+    }
+}
+
+MARCH_MADNESS_CACHE_TIMEOUT = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.0/ref/settings/#auth-password-validators
 
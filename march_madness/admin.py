@@ -1,9 +1,16 @@
 from django import forms
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models import Count, Prefetch
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from reversion.admin import VersionAdmin
 
 
-from .models import Tournament, Round, Match, UserPrediction, Group, Team, TeamRank
+from .utils import load_results, save_results
+from .models import Tournament, Round, Match, UserPrediction, Group, Team, TeamRank, UserScore, \
+    ScoringRules, RoundPoints, SeedBonus, ScoreSnapshot, SimulationResult
 
 
 @admin.register(Team)
@@ -20,24 +27,49 @@ class TeamRankAdmin(admin.ModelAdmin):
     list_filter = ['year', 'seed', 'team']
     search_fields = ['team__name', 'year', 'seed']
     ordering = ('year', 'seed', 'team__name',)
+    list_select_related = ('team',)
 
 
 @admin.register(Tournament)
 class TournamentAdmin(admin.ModelAdmin):
-    list_display = ("id", "name", 'year')
+    list_display = ("id", "name", 'year', 'round_count')
     list_filter = ['year']
     search_fields = ['name', 'year']
     ordering = ('year', 'name')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(round_count=Count('rounds'))
+
+    def round_count(self, instance):
+        return instance.round_count
+    round_count.admin_order_field = 'round_count'
+    round_count.short_description = 'Rounds'
+
     class RoundInline(admin.StackedInline):
         model = Round
 
     inlines = [RoundInline]
 
 
+@admin.register(ScoringRules)
+class ScoringRulesAdmin(admin.ModelAdmin):
+    list_display = ("id", "tournament", "default_round_points", "default_seed_points", "seed_difference_points")
+    list_filter = ['tournament__year']
+    ordering = ('tournament',)
+    list_select_related = ('tournament',)
+
+    class RoundPointsInline(admin.TabularInline):
+        model = RoundPoints
+
+    class SeedBonusInline(admin.TabularInline):
+        model = SeedBonus
+
+    inlines = [RoundPointsInline, SeedBonusInline]
+
+
 @admin.register(Round)
 class RoundAdmin(admin.ModelAdmin):
-    list_display = ("id", "tournament", "name", 'round_number', 'start_date', 'end_date', "match_names")
+    list_display = ("id", "tournament", "name", 'round_number', 'start_date', 'end_date', "match_count", "match_names")
     list_filter = ['tournament__year', 'round_number', 'start_date']
     search_fields = ['name']
     ordering = ('tournament', 'round_number')
@@ -45,8 +77,32 @@ class RoundAdmin(admin.ModelAdmin):
     class MatchInline(admin.StackedInline):
         model = Match
 
+        def get_queryset(self, request):
+            return super().get_queryset(request).select_related('round__tournament', 'team1', 'team2', 'victor')
+
+        def formfield_for_foreignkey(self, db_field, request, **kwargs):
+            # Load the team choices once for all of the inline forms instead of once for every select
+            field = super().formfield_for_foreignkey(db_field, request, **kwargs)
+            if db_field.name in ('team1', 'team2', 'victor'):
+                choices = getattr(request, '_march_madness_team_choices', None)
+                if choices is None:
+                    request._march_madness_team_choices = choices = list(field.choices)
+                field.choices = choices
+            return field
+
     inlines = [MatchInline]
 
+    def get_queryset(self, request):
+        # Round.match_names formats every match with the round's tournament. The prefetched matches share their round.
+        matches = Match.objects.order_by('match_number')
+        return super().get_queryset(request).select_related('tournament') \
+            .prefetch_related(Prefetch('matches', queryset=matches)).annotate(match_count=Count('matches'))
+
+    def match_count(self, instance):
+        return instance.match_count
+    match_count.admin_order_field = 'match_count'
+    match_count.short_description = 'Matches'
+
 
 @admin.register(Match)
 class MatchAdmin(admin.ModelAdmin):
@@ -54,6 +110,8 @@ class MatchAdmin(admin.ModelAdmin):
     list_filter = ['round__tournament__year', 'round__round_number', 'match_number', 'date']
     search_fields = ['team1__name', 'team2__name', 'victor__name']
     ordering = ('round__tournament', 'round__round_number', 'match_number')
+    list_select_related = ('round__tournament', 'team1', 'team2', 'victor')
+    actions = ['set_results']
 
     class MatchForm(forms.ModelForm):
 
@@ -64,27 +122,151 @@ class MatchAdmin(admin.ModelAdmin):
         def __init__(self, *args, **kwargs):
             super().__init__(*args, **kwargs)
 
-            if self.initial["team1"] and self.initial['team2']:
-                team1 = Team.objects.get(pk=self['team1'].value())
-                team2 = Team.objects.get(pk=self['team2'].value())
-                self.fields['victor'].choices = [(None, self.fields['victor'].empty_label), (team1.id, str(team1)), (team2.id, str(team2))]
+            # The admin loads the instance with its teams, so this does not run a query
+            team1, team2 = self.instance.team1, self.instance.team2
+            if team1 and team2 and 'victor' in self.fields:
+                self.fields['victor'].choices = [(None, self.fields['victor'].empty_label), (team1.id, str(team1)),
+                                                 (team2.id, str(team2))]
 
     form = MatchForm
 
+    class ResultForm(MatchForm):
+        class Meta:
+            model = Match
+            fields = ['team1_score', 'team2_score', 'victor']
+
+        def clean_victor(self):
+            victor = self.cleaned_data['victor']
+            if victor is not None and victor.pk not in (self.instance.team1_id, self.instance.team2_id):
+                raise forms.ValidationError('The victor must be team 1 or team 2.')
+            return victor
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('round__tournament', 'team1', 'team2', 'victor')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        for match in obj.get_bracket():
+            if match.victor_id is not None and match.victor_id not in (match.team1_id, match.team2_id):
+                self.message_user(request, '{} victor {} no longer plays in the match'.format(match, match.victor),
+                                  messages.WARNING)
+
+    def set_results(self, request, queryset):
+        """Edit the scores and victors of the selected matches on one page and save them in one transaction."""
+        ResultFormSet = forms.modelformset_factory(Match, form=self.ResultForm, extra=0)
+        queryset = queryset.order_by('round__tournament', 'round__round_number', 'match_number')
+        formset = ResultFormSet(request.POST if 'apply' in request.POST else None, queryset=queryset, prefix='results')
+
+        if 'apply' in request.POST and formset.is_valid():
+            tournaments = {}
+            for form in formset.forms:
+                if form.has_changed():
+                    match = form.save(commit=False)
+                    tournaments.setdefault(match.round.tournament_id, (match.round.tournament, []))[1].append(match)
+
+            invalid = []
+            with transaction.atomic():
+                for tournament, matches in tournaments.values():
+                    invalid.extend(save_results(tournament, matches))
+            count = sum(len(matches) for _, matches in tournaments.values())
+            self.message_user(request, 'Saved the results of {} matches'.format(count), messages.SUCCESS)
+            for match in invalid:
+                self.message_user(request, '{} victor {} no longer plays in the match'.format(match, match.victor),
+                                  messages.WARNING)
+            return None
+
+        context = dict(self.admin_site.each_context(request), opts=self.model._meta, formset=formset,
+                       action_checkbox_name=admin.helpers.ACTION_CHECKBOX_NAME, title='Set results')
+        return TemplateResponse(request, "admin/march_madness/match/set_results.html", context)
+    set_results.short_description = 'Set the results of the selected matches'
+
+    class UploadResultsForm(forms.Form):
+        results = forms.FileField(help_text="Results csv or json file. The first line of a csv file (or the "
+                                            "\"tournament\" of a json file) is the tournament name and year.")
+        dry_run = forms.BooleanField(required=False, help_text="Show the changes without saving them.")
+
+    change_list_template = "admin/march_madness/match/change_list.html"
+
+    def get_urls(self):
+        return [path('upload_results/', self.admin_site.admin_view(self.upload_results),
+                     name='march_madness_match_upload_results')] + super().get_urls()
+
+    def upload_results(self, request):
+        """Set the scores and victors of many matches from an uploaded results file in one transaction."""
+        if not self.has_change_permission(request):
+            return redirect('admin:march_madness_match_changelist')
+
+        report = None
+        form = self.UploadResultsForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['results']
+            try:
+                report = load_results(upload.name, content=upload.read().decode('utf-8'),
+                                      dry_run=form.cleaned_data['dry_run'])
+            except (ValueError, KeyError, UnicodeDecodeError, Tournament.DoesNotExist) as err:
+                messages.error(request, 'Could not load {}: {}'.format(upload.name, err))
+            else:
+                if not form.cleaned_data['dry_run']:
+                    messages.success(request, 'Loaded {} ({} changes)'.format(upload.name, len(report)))
+                    for line in report:
+                        if line.startswith('Invalid '):
+                            messages.warning(request, line)
+                    return redirect('admin:march_madness_match_changelist')
+
+        context = dict(self.admin_site.each_context(request), opts=self.model._meta, form=form, report=report,
+                       title='Upload results')
+        return TemplateResponse(request, "admin/march_madness/match/upload_results.html", context)
+
+
 @admin.register(UserPrediction)
 class UserPredictionAdmin(VersionAdmin):
     list_display = ("id", "user", "match", "guess", "team1_score", "team2_score")
     list_filter = ['match__round__tournament__year', 'match__round__round_number', 'match__match_number']
     search_fields = ['user__first_name', 'user__username', 'guess__name']
     ordering = ('user', 'match__round__round_number', 'match__match_number')
+    list_select_related = ('user', 'match__round__tournament', 'guess')
+
+
+@admin.register(UserScore)
+class UserScoreAdmin(admin.ModelAdmin):
+    list_display = ("id", "tournament", "user", "points", "correct", "max_points", "eliminated", "updated")
+    list_filter = ['tournament__year', 'eliminated']
+    search_fields = ['user__username', 'user__first_name']
+    ordering = ('tournament', '-points')
+    list_select_related = ('tournament', 'user')
+
+
+@admin.register(ScoreSnapshot)
+class ScoreSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("id", "round", "group", "user", "points", "rank", "created")
+    list_filter = ['round__tournament__year', 'round__round_number']
+    search_fields = ['user__username', 'group__name']
+    list_select_related = ('round__tournament', 'group', 'user')
+
+
+@admin.register(SimulationResult)
+class SimulationResultAdmin(admin.ModelAdmin):
+    list_display = ("id", "tournament", "user", "win", "top3", "group_win", "expected", "samples", "updated")
+    list_filter = ['tournament__year']
+    search_fields = ['user__username', 'user__first_name']
+    list_select_related = ('tournament', 'user')
 
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
-    list_display = ("id", "tournament", "name", "captain", "member_names")
+    list_display = ("id", "tournament", "name", "captain", "member_count", "member_names")
     list_filter = ['tournament__year']
     search_fields = ['name', 'captain__username', 'captain__first_name']
     ordering = ('tournament', 'name',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('tournament', 'captain').prefetch_related('members') \
+            .annotate(member_count=Count('members'))
+
+    def member_count(self, instance):
+        return instance.member_count
+    member_count.admin_order_field = 'member_count'
+    member_count.short_description = 'Members'
+
     def member_names(self, instance):
         return ", ".join((str(mem.username) for mem in instance.members.all()))
@@ -0,0 +1,325 @@
+"""Export and import a tournament's whole state as one compact zip file.
+
+The archive has a JSON file for each table in a columnar layout ({"column": [values, ...]}) and the picks as packed
+arrays. ``picks.bin`` has one little endian int16 array per user (in the order of ``users.json``) with the index of
+the guessed team in ``teams.json`` for every match in ``matches.json``, or -1 without a pick.
+
+Files:
+    meta.json: Format version, tournament name and year, counts.
+    teams.json, seeds.json, rounds.json, matches.json, users.json, groups.json, scoring.json
+    picks.bin: Packed picks.
+    pick_scores.json: The team1/team2 score guesses of the picks that have them.
+
+Users are matched by username when the archive is imported. Passwords are not exported, so new users get an
+unusable password.
+"""
+import collections
+import itertools
+import json
+import sys
+import zipfile
+from array import array
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .caches import clear_teams, clear_seeds, clear_results, clear_tournaments, clear_picks
+from .models import Tournament, Team, TeamRank, Round, Match, Group, UserPrediction, UserScore, ScoreSnapshot, \
+    ScoringRules, RoundPoints, SeedBonus
+
+
+FORMAT_VERSION = 1
+NO_PICK = -1
+
+ROUND_FIELDS = ['id', 'round_number', 'name', 'start_date', 'end_date']
+MATCH_FIELDS = ['id', 'round', 'match_number', 'date', 'team1', 'team2', 'victor', 'team1_score', 'team2_score',
+                'tournament_value', 'team1_probability']
+USER_FIELDS = ['id', 'username', 'first_name', 'last_name', 'email']
+
+
+def to_columns(rows, fields):
+    """Return a dictionary of field: list of values for the rows (tuples in the order of fields)."""
+    columns = {field: [] for field in fields}
+    for row in rows:
+        for field, value in zip(fields, row):
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            columns[field].append(value)
+    return columns
+
+
+def from_columns(columns):
+    """Return a list of row dictionaries for a dictionary of field: list of values."""
+    fields = list(columns)
+    return [dict(zip(fields, row)) for row in zip(*(columns[field] for field in fields))]
+
+
+def write_json(archive, name, data):
+    archive.writestr(name, json.dumps(data, separators=(',', ':')))
+
+
+def read_json(archive, name):
+    return json.loads(archive.read(name).decode('utf-8'))
+
+
+def export_tournament(tournament, filename):
+    """Write the tournament's teams, seeds, bracket, results, scoring rules, groups and picks to a zip file.
+
+    The picks are streamed from the database one user at a time, so memory does not grow with the number of users.
+
+    Args:
+        tournament (Tournament): Tournament to export.
+        filename (str): Zip filename.
+
+    Returns:
+        meta (dict): Contents of meta.json.
+    """
+    rounds = list(Round.objects.filter(tournament=tournament).order_by('round_number').values_list(*ROUND_FIELDS))
+    matches = list(Match.objects.filter(round__tournament=tournament).order_by('round__round_number', 'match_number')
+                   .values_list(*MATCH_FIELDS))
+    match_index = {row[0]: i for i, row in enumerate(matches)}
+
+    predictions = UserPrediction.objects.filter(match__round__tournament=tournament)
+    team_ids = {team_id for row in matches for team_id in row[4:7] if team_id is not None}
+    team_ids.update(predictions.values_list('guess', flat=True).distinct())
+    teams = list(Team.objects.filter(pk__in=team_ids).order_by('name').values_list('id', 'name', 'icon'))
+    team_index = {row[0]: i for i, row in enumerate(teams)}
+    seeds = TeamRank.objects.filter(year=tournament.year, team__in=team_ids).values_list('team', 'seed')
+
+    groups = list(Group.objects.filter(tournament=tournament).order_by('name').prefetch_related('members'))
+    User = get_user_model()
+    users = list(User.objects.filter(pk__in=predictions.values('user')).order_by('pk').values_list(*USER_FIELDS))
+    group_users = User.objects.filter(Q(group__tournament=tournament) | Q(captain_for__tournament=tournament)) \
+        .distinct().values_list(*USER_FIELDS)
+    user_pks = {row[0] for row in users}
+    users.extend(row for row in group_users.order_by('pk') if row[0] not in user_pks)
+    user_index = {row[0]: i for i, row in enumerate(users)}
+
+    rules = ScoringRules.objects.filter(tournament=tournament).first()
+    scoring = None
+    if rules is not None:
+        scoring = {'default_round_points': rules.default_round_points,
+                   'default_seed_points': rules.default_seed_points,
+                   'seed_difference_points': rules.seed_difference_points,
+                   'round_points': to_columns(rules.round_points.values_list('round_number', 'points'),
+                                              ['round_number', 'points']),
+                   'seed_bonuses': to_columns(rules.seed_bonuses.values_list('victor_seed', 'loser_seed', 'points'),
+                                              ['victor_seed', 'loser_seed', 'points'])}
+
+    meta = {'version': FORMAT_VERSION, 'created': timezone.now().isoformat(),
+            'tournament': {'name': tournament.name, 'year': tournament.year},
+            'teams': len(teams), 'rounds': len(rounds), 'matches': len(matches), 'users': len(users),
+            'groups': len(groups)}
+
+    with zipfile.ZipFile(filename, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        write_json(archive, 'meta.json', meta)
+        write_json(archive, 'teams.json', to_columns(teams, ['id', 'name', 'icon']))
+        write_json(archive, 'seeds.json', to_columns(((team_index[team_id], seed) for team_id, seed in seeds),
+                                                     ['team', 'seed']))
+        write_json(archive, 'rounds.json', to_columns(rounds, ROUND_FIELDS))
+
+        # Matches refer to rounds by round number and to teams by index
+        round_numbers = {row[0]: row[1] for row in rounds}
+        write_json(archive, 'matches.json', to_columns(
+            ((row[0], round_numbers[row[1]], *row[2:4], *[team_index.get(team_id, None) for team_id in row[4:7]],
+              *row[7:]) for row in matches), MATCH_FIELDS))
+        write_json(archive, 'users.json', to_columns(users, USER_FIELDS))
+        write_json(archive, 'groups.json', to_columns(
+            ((group.name, user_index[group.captain_id], [user_index[mem.pk] for mem in group.members.all()])
+             for group in groups), ['name', 'captain', 'members']))
+        write_json(archive, 'scoring.json', scoring)
+
+        # Picks, one packed array per user
+        pick_scores = []
+        rows = predictions.order_by('user', 'match').values_list('user', 'match', 'guess', 'team1_score',
+                                                                 'team2_score')
+        pending = collections.deque(row[0] for row in users)
+        with archive.open('picks.bin', 'w') as f:
+            for user_id, user_rows in itertools.groupby(rows.iterator(chunk_size=10000), key=lambda row: row[0]):
+                # Users without picks come after the users with picks
+                while pending[0] != user_id:
+                    f.write(pack_picks(len(matches)))
+                    pending.popleft()
+                pending.popleft()
+
+                picks = {}
+                for _, match_id, guess_id, team1_score, team2_score in user_rows:
+                    picks[match_index[match_id]] = team_index.get(guess_id, NO_PICK)
+                    if team1_score is not None or team2_score is not None:
+                        pick_scores.append((user_index[user_id], match_index[match_id], team1_score, team2_score))
+                f.write(pack_picks(len(matches), picks))
+            for _ in pending:
+                f.write(pack_picks(len(matches)))
+        write_json(archive, 'pick_scores.json', to_columns(pick_scores, ['user', 'match', 'team1_score',
+                                                                          'team2_score']))
+
+    return meta
+
+
+def pack_picks(num_matches, picks=None):
+    """Return the little endian int16 bytes of the team index picked for every match (NO_PICK without a pick).
+
+    Args:
+        num_matches (int): Number of matches.
+        picks (dict)[None]: Match index: team index dictionary.
+    """
+    packed = array('h', [NO_PICK]) * num_matches
+    for i, team in (picks or {}).items():
+        packed[i] = team
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def import_tournament(filename, name=None, year=None, replace=False):
+    """Restore a tournament from an export_tournament zip file with bulk inserts.
+
+    Teams and users are matched by name and username and created if they are missing. The user scores and score
+    snapshots are rebuilt from the restored results and picks. Everything runs in one transaction.
+
+    Args:
+        filename (str): Zip filename.
+        name (str)[None]: Tournament name. Defaults to the exported name.
+        year (int)[None]: Tournament year. Defaults to the exported year. Use another year to make a copy.
+        replace (bool)[False]: If True delete the existing tournament with the name and year first.
+
+    Returns:
+        tournament (Tournament): The restored tournament.
+
+    Raises:
+        ValueError: If the tournament exists and replace is False or the file format is not supported.
+    """
+    with zipfile.ZipFile(filename) as archive, transaction.atomic():
+        meta = read_json(archive, 'meta.json')
+        if meta.get('version', None) != FORMAT_VERSION:
+            raise ValueError('Unsupported archive version {}'.format(meta.get('version', None)))
+        name = name or meta['tournament']['name']
+        year = year or meta['tournament']['year']
+
+        existing = Tournament.objects.filter(year=year).first()
+        if existing is not None:
+            if not replace:
+                raise ValueError('{} already exists. Use replace to overwrite it.'.format(existing))
+            delete_tournament(existing)
+        tournament = Tournament.objects.create(name=name, year=year)
+
+        # Teams and seeds
+        teams = from_columns(read_json(archive, 'teams.json'))
+        names = [team['name'] for team in teams]
+        existing_teams = set(Team.objects.filter(name__in=names).values_list('name', flat=True))
+        Team.objects.bulk_create([Team(name=team['name'], icon=team['icon'] or '') for team in teams
+                                  if team['name'] not in existing_teams])
+        team_ids = dict(Team.objects.filter(name__in=names).values_list('name', 'id'))
+        team_ids = [team_ids[team_name] for team_name in names]
+
+        seeds = {team_ids[row['team']]: row['seed'] for row in from_columns(read_json(archive, 'seeds.json'))}
+        TeamRank.objects.filter(year=year, team__in=seeds).delete()
+        TeamRank.objects.bulk_create([TeamRank(team_id=team_id, year=year, seed=seed)
+                                      for team_id, seed in seeds.items()])
+
+        # Rounds and matches
+        rounds = from_columns(read_json(archive, 'rounds.json'))
+        Round.objects.bulk_create([Round(tournament=tournament, round_number=row['round_number'], name=row['name'],
+                                         start_date=row['start_date'] and parse_date(row['start_date']),
+                                         end_date=row['end_date'] and parse_date(row['end_date']))
+                                   for row in rounds])
+        round_ids = dict(Round.objects.filter(tournament=tournament).values_list('round_number', 'id'))
+
+        def get_team(index):
+            return None if index is None else team_ids[index]
+
+        matches = from_columns(read_json(archive, 'matches.json'))
+        Match.objects.bulk_create([Match(round_id=round_ids[row['round']], match_number=row['match_number'],
+                                         date=row['date'] and parse_datetime(row['date']),
+                                         team1_id=get_team(row['team1']), team2_id=get_team(row['team2']),
+                                         victor_id=get_team(row['victor']), team1_score=row['team1_score'],
+                                         team2_score=row['team2_score'], tournament_value=row['tournament_value'],
+                                         team1_probability=row['team1_probability'])
+                                   for row in matches])
+        match_ids = {(r, m): pk for r, m, pk in Match.objects.filter(round__tournament=tournament)
+                     .values_list('round__round_number', 'match_number', 'id')}
+        match_ids = [match_ids[(row['round'], row['match_number'])] for row in matches]
+
+        # Users and groups
+        User = get_user_model()
+        users = from_columns(read_json(archive, 'users.json'))
+        usernames = [user['username'] for user in users]
+        existing_users = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        password = make_password(None)
+        User.objects.bulk_create([User(username=user['username'], first_name=user['first_name'],
+                                       last_name=user['last_name'], email=user['email'], password=password)
+                                  for user in users if user['username'] not in existing_users])
+        user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        user_ids = [user_ids[username] for username in usernames]
+
+        groups = from_columns(read_json(archive, 'groups.json'))
+        Group.objects.bulk_create([Group(tournament=tournament, name=group['name'],
+                                         captain_id=user_ids[group['captain']]) for group in groups])
+        group_ids = dict(Group.objects.filter(tournament=tournament).values_list('name', 'id'))
+        user_field = Group.members.field.m2m_reverse_field_name()
+        Group.members.through.objects.bulk_create([
+            Group.members.through(**{'group_id': group_ids[group['name']], user_field + '_id': user_ids[i]})
+            for group in groups for i in group['members']])
+
+        # Scoring rules
+        scoring = read_json(archive, 'scoring.json')
+        if scoring is not None:
+            rules = ScoringRules.objects.create(tournament=tournament,
+                                                default_round_points=scoring['default_round_points'],
+                                                default_seed_points=scoring['default_seed_points'],
+                                                seed_difference_points=scoring['seed_difference_points'])
+            RoundPoints.objects.bulk_create([RoundPoints(rules=rules, **row)
+                                             for row in from_columns(scoring['round_points'])])
+            SeedBonus.objects.bulk_create([SeedBonus(rules=rules, **row)
+                                           for row in from_columns(scoring['seed_bonuses'])])
+
+        # Picks
+        pick_scores = {(row['user'], row['match']): (row['team1_score'], row['team2_score'])
+                       for row in from_columns(read_json(archive, 'pick_scores.json'))}
+        num_matches = len(matches)
+        with archive.open('picks.bin') as f:
+            for i, user_id in enumerate(user_ids):
+                picks = array('h')
+                picks.frombytes(f.read(num_matches * picks.itemsize))
+                if sys.byteorder != 'little':
+                    picks.byteswap()
+                predictions = []
+                for j, team in enumerate(picks):
+                    if team != NO_PICK:
+                        team1_score, team2_score = pick_scores.get((i, j), (None, None))
+                        predictions.append(UserPrediction(user_id=user_id, match_id=match_ids[j],
+                                                          guess_id=team_ids[team], team1_score=team1_score,
+                                                          team2_score=team2_score))
+                UserPrediction.objects.bulk_create(predictions)
+
+        UserScore.rebuild(tournament)
+        ScoreSnapshot.capture(tournament)
+
+        clear_picks(tournament=tournament)
+        clear_teams()
+        clear_seeds()
+        clear_tournaments()
+        clear_results()
+    return tournament
+
+
+def delete_tournament(tournament):
+    """Delete the tournament and everything that belongs to it.
+
+    The picks are deleted with one query without the per pick signals, so the user scores are not updated for every
+    pick. The scores are deleted with the tournament and the tournament's cached picks are cleared with one version
+    change.
+    """
+    with transaction.atomic():
+        predictions = UserPrediction.objects.filter(match__round__tournament=tournament)
+        predictions._raw_delete(predictions.db)
+        clear_picks(tournament=tournament)
+        UserScore.objects.filter(tournament=tournament).delete()
+        Match.objects.filter(round__tournament=tournament).delete()
+        ScoreSnapshot.objects.filter(round__tournament=tournament).delete()
+        Round.objects.filter(tournament=tournament).delete()
+        Group.objects.filter(tournament=tournament).delete()
+        tournament.delete()
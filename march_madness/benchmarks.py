@@ -0,0 +1,311 @@
+"""Synthetic tournaments and timings for the bracket views and commands.
+
+``build_tournament`` fills the database with a tournament of a given size. ``run_benchmarks`` times each case through
+the test client and reports the wall time, the number of queries and the peak memory. The results are plain
+dictionaries that can be written as JSON and compared with a saved baseline with ``compare_results``.
+
+Note:
+    Use the run_benchmarks management command. It creates and destroys a separate test database.
+
+    The benchmarks use their own local memory cache (BENCHMARK_CACHES), so they never read, fill or clear the site's
+    shared cache.
+"""
+import io
+import os
+import platform
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+import django
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Tournament, Match, Group, UserPrediction, UserScore
+from .utils import load_csv
+
+
+BENCHMARK_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                'LOCATION': 'march_madness_benchmarks'}}
+
+
+# Seed order of the first round matches in a region
+REGION_SEEDS = [(1, 16), (8, 9), (5, 12), (4, 13), (6, 11), (3, 14), (7, 10), (2, 15)]
+
+DEFAULT_CASES = ["view_bracket", "view_round", "view_group_scores", "tournament_standings", "user_prediction",
+                 "post_points", "load_csv"]
+
+
+def write_csv(filename, name, year, num_teams=64):
+    """Write a load_csv file for a tournament with 64 teams or 68 teams (4 play-in matches).
+
+    The play-in matches are round 1 and their winners are placeholder teams in round 2, like the First Four.
+    """
+    num_play_in = max(num_teams - 64, 0)
+    first_round = 1
+    lines = ["{} {}".format(name, year), "", "Year,Round,Match,Team 1,Team 1 Seed,Team 2,Team 2 Seed,Tournament Value"]
+    if num_play_in:
+        first_round = 2
+        for i in range(1, num_play_in + 1):
+            lines.append("{},1,{},Play In Team {},16,Play In Team {},16,1".format(year, i, i * 2 - 1, i * 2))
+
+    for i in range(32):
+        region, (seed1, seed2) = i // 8, REGION_SEEDS[i % 8]
+        team1 = "Region {} Seed {}".format(region + 1, seed1)
+        team2 = "Region {} Seed {}".format(region + 1, seed2)
+        if i % 8 == 0 and region < num_play_in:
+            team2 = "Play In Winner {}".format(region + 1)
+        lines.append("{},{},{},{},{},{},{},1".format(year, first_round, i + 1, team1, seed1, team2, seed2))
+
+    with open(filename, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def make_picks(bracket, rng, pick_fraction=1.0):
+    """Return a match id: team dictionary for a random bracket with about pick_fraction of the matches picked."""
+    picks = {}
+    for match in bracket:
+        choices = [team for team in (match.team1, match.team2) if team is not None]
+        for team, parent in zip((match.team1, match.team2), bracket.parent_matches(match)):
+            if team is None and parent is not None and parent.pk in picks:
+                choices.append(picks[parent.pk])
+        if choices:
+            picks[match.pk] = rng.choice(choices)
+    return {match_id: team for match_id, team in picks.items() if rng.random() < pick_fraction}
+
+
+def decide_matches(bracket, rng, decided_fraction=0.5):
+    """Set random victors for about decided_fraction of the matches, round by round, and advance the victors."""
+    num_decided = int(len(bracket) * decided_fraction)
+    for rnd in bracket.rounds:
+        decided = []
+        for match in bracket.get_round_matches(rnd):
+            if num_decided <= 0:
+                break
+            if match.team1 is not None and match.team2 is not None:
+                match.victor = rng.choice((match.team1, match.team2))
+                decided.append(match)
+                num_decided -= 1
+        Match.objects.bulk_update(decided, ["victor"])
+        bracket.advance(decided)
+
+
+def build_tournament(name="Benchmark", year=1900, num_teams=64, num_users=100, num_groups=10, pick_fraction=1.0,
+                     decided_fraction=0.5, seed=None):
+    """Create a synthetic tournament with users, groups, picks and results.
+
+    Args:
+        name (str)["Benchmark"]: Tournament name.
+        year (int)[1900]: Tournament year. The year should not be used by a real tournament.
+        num_teams (int)[64]: 64 or 68 teams.
+        num_users (int)[100]: Number of users with picks.
+        num_groups (int)[10]: Number of groups. The users are spread evenly over the groups.
+        pick_fraction (float)[1.0]: Fraction of the matches each user picked.
+        decided_fraction (float)[0.5]: Fraction of the matches with a victor.
+        seed (int)[None]: Random seed.
+
+    Returns:
+        tournament (Tournament): The new tournament.
+    """
+    rng = random.Random(seed)
+    tournament = Tournament.objects.create(name=name, year=year)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "bracket.csv")
+        write_csv(filename, name, year, num_teams)
+        load_csv(filename)
+
+    User = get_user_model()
+    password = make_password(None)
+    User.objects.bulk_create([User(username="{}_{}_user{}".format(name, year, i), password=password)
+                              for i in range(num_users)])
+    users = list(User.objects.filter(username__startswith="{}_{}_user".format(name, year)).order_by("pk"))
+
+    for i in range(min(num_groups, len(users))):
+        members = users[i::num_groups]
+        group = Group.objects.create(tournament=tournament, name="Group {}".format(i + 1), captain=members[0])
+        group.members.set(members)
+
+    bracket = tournament.get_bracket()
+    predictions = [UserPrediction(user=user, match_id=match_id, guess=team)
+                   for user in users for match_id, team in make_picks(bracket, rng, pick_fraction).items()]
+    UserPrediction.objects.bulk_create(predictions)
+
+    decide_matches(bracket, rng, decided_fraction)
+    UserScore.rebuild(tournament)
+    return tournament
+
+
+class BenchmarkContext(object):
+    """Objects that the benchmark cases use."""
+    def __init__(self, tournament, csv_filename):
+        self.tournament = tournament
+        self.csv_filename = csv_filename
+        self.client = Client()
+        self.user = get_user_model().objects.filter(group__tournament=tournament).order_by("pk").first()
+        self.client.force_login(self.user)
+
+        bracket = tournament.get_bracket()
+        self.first_round = max(bracket.rounds, key=lambda rnd: len(bracket.get_round_matches(rnd)))
+        self.open_match = next((match for match in bracket
+                                if match.victor_id is None and match.team1_id and match.team2_id), None)
+
+    def url(self, name, **kwargs):
+        return reverse(name, kwargs=kwargs) + "?tournament={}".format(self.tournament.pk)
+
+
+def bench_view_bracket(ctx):
+    return ctx.client.get(ctx.url("march_madness:bracket", user=ctx.user.username))
+
+
+def bench_view_round(ctx):
+    return ctx.client.get(ctx.url("march_madness:round", pk=ctx.first_round.pk))
+
+
+def bench_view_group_scores(ctx):
+    return ctx.client.get(ctx.url("march_madness:group_scores"))
+
+
+def bench_tournament_standings(ctx):
+    return ctx.client.get(ctx.url("march_madness:tournament_standings"))
+
+
+def bench_user_prediction(ctx):
+    match = ctx.open_match
+    if match is None:
+        return None
+    data = {"user": ctx.user.pk, "match": match.pk, "guess": match.team1_id}
+    return ctx.client.post(reverse("march_madness:user_prediction"), data, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+
+
+def setup_post_points(ctx):
+    Match.objects.filter(round__tournament=ctx.tournament).update(tournament_value=1)
+    UserScore.rebuild(ctx.tournament)
+
+
+def bench_post_points(ctx):
+    call_command("post_points", str(ctx.tournament), stdout=io.StringIO())
+
+
+def bench_load_csv(ctx):
+    # The file is for another tournament year, so every round and match is created and then rolled back
+    return load_csv(ctx.csv_filename, dry_run=True)
+
+
+CASES = {
+    "view_bracket": (None, bench_view_bracket),
+    "view_round": (None, bench_view_round),
+    "view_group_scores": (None, bench_view_group_scores),
+    "tournament_standings": (None, bench_tournament_standings),
+    "user_prediction": (None, bench_user_prediction),
+    "post_points": (setup_post_points, bench_post_points),
+    "load_csv": (None, bench_load_csv),
+}
+
+
+def measure(func, *args, **kwargs):
+    """Run the function once and return (wall time seconds, number of queries, result)."""
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    return elapsed, len(queries), result
+
+
+def measure_memory(func, *args, **kwargs):
+    """Run the function once with tracemalloc and return the peak traced memory in bytes."""
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(tournament, cases=None, repeat=5, warm=False):
+    """Time each benchmark case and return the results.
+
+    The timed runs do not trace memory, because tracemalloc slows Python down a lot. The peak memory comes from one
+    extra run.
+
+    Args:
+        tournament (Tournament): Tournament made by build_tournament.
+        cases (list)[None]: Names of the cases in CASES to run. By default every case is run.
+        repeat (int)[5]: Number of timed runs of each case.
+        warm (bool)[False]: If True keep the cache between runs. Otherwise the cache is cleared before every run. The
+            cases run with BENCHMARK_CACHES, so only the benchmark cache is cleared.
+
+    Returns:
+        results (dict): Case name: {"time" (median seconds), "min_time", "max_time", "queries" (max), "peak_memory"
+            (bytes), "status" (response status code or None)}.
+    """
+    if cases is None:
+        cases = DEFAULT_CASES
+
+    results = {}
+    with override_settings(CACHES=BENCHMARK_CACHES), tempfile.TemporaryDirectory() as tmp_dir:
+        csv_filename = os.path.join(tmp_dir, "load.csv")
+        ctx = BenchmarkContext(tournament, csv_filename)
+        Tournament.objects.get_or_create(name=tournament.name, year=tournament.year + 1)
+        write_csv(csv_filename, tournament.name, tournament.year + 1, len(ctx.tournament.get_bracket().get_teams()))
+
+        def prepare():
+            if setup is not None:
+                setup(ctx)
+            if not warm:
+                cache.clear()
+
+        for name in cases:
+            setup, func = CASES[name]
+            runs = []
+            for _ in range(repeat):
+                prepare()
+                runs.append(measure(func, ctx))
+            prepare()
+            peak = measure_memory(func, ctx)
+
+            times = [run[0] for run in runs]
+            results[name] = {"time": statistics.median(times), "min_time": min(times), "max_time": max(times),
+                             "queries": max(run[1] for run in runs), "peak_memory": peak,
+                             "status": getattr(runs[-1][2], "status_code", None)}
+    return results
+
+
+def get_environment():
+    """Return a dictionary describing where the benchmarks ran."""
+    return {"python": platform.python_version(), "django": django.get_version(), "database": connection.vendor,
+            "machine": platform.machine(), "created": timezone.now().isoformat()}
+
+
+def compare_results(results, baseline, tolerance=0.25):
+    """Return a list of regression descriptions for the results compared to the baseline results.
+
+    A case regresses if it runs more queries than the baseline or if its median time or peak memory is more than
+    ``tolerance`` larger than the baseline.
+
+    Args:
+        results (dict): Case name: result dictionary from run_benchmarks.
+        baseline (dict): Case name: result dictionary from a previous run.
+        tolerance (float)[0.25]: Allowed relative increase for the time and memory.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name, None)
+        if base is None:
+            continue
+        if result["queries"] > base["queries"]:
+            regressions.append("{}: {} queries (baseline {})".format(name, result["queries"], base["queries"]))
+        if result["time"] > base["time"] * (1 + tolerance):
+            regressions.append("{}: {:.2f} ms (baseline {:.2f} ms)".format(name, result["time"] * 1000,
+                                                                          base["time"] * 1000))
+        if result["peak_memory"] > base["peak_memory"] * (1 + tolerance):
+            regressions.append("{}: {:.1f} KiB peak memory (baseline {:.1f} KiB)".format(
+                name, result["peak_memory"] / 1024, base["peak_memory"] / 1024))
+    return regressions
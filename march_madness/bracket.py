@@ -0,0 +1,244 @@
+from .models import Round, Match, UserPrediction
+from .signals import results_changed
+
+
+class BracketIndex(object):
+    """In memory index of every round and match in a tournament.
+
+    The rounds and matches are loaded once and every parent, child and slot lookup afterwards is a dictionary lookup.
+    A match in round ``r`` with match number ``n`` feeds the match ``(n + 1) // 2`` of round ``r + 1``. Odd match
+    numbers fill ``team1`` and even match numbers fill ``team2``.
+
+    Note:
+        Rounds are only linked to the round before them if the round before them has more matches. This keeps a small
+        play-in round from being treated as the parent of the first full round.
+
+    Args:
+        tournament (Tournament): Tournament to index.
+    """
+    def __init__(self, tournament):
+        self.tournament = tournament
+        self.rounds = list(Round.objects.filter(tournament=tournament).order_by('round_number'))
+        self.matches = {}
+        self._predictions = {}
+        self._choices = {}
+        self._positions = {}
+        self._round_matches = {rnd.round_number: [] for rnd in self.rounds}
+
+        rounds = {}
+        for rnd in self.rounds:
+            rnd.tournament = tournament
+            rounds[rnd.pk] = rnd
+
+        matches = Match.objects.filter(round__tournament=tournament).select_related('team1', 'team2', 'victor')
+        for match in matches.order_by('round__round_number', 'match_number'):
+            match.round = rounds[match.round_id]
+            match._bracket = self
+            self.matches[match.pk] = match
+            self._positions[(match.round.round_number, match.match_number)] = match
+            self._round_matches[match.round.round_number].append(match)
+
+    def __iter__(self):
+        """Iterate through every match by round and match number."""
+        for rnd in self.rounds:
+            yield from self._round_matches[rnd.round_number]
+
+    def __len__(self):
+        return len(self.matches)
+
+    def get_match(self, round_number, match_number):
+        """Return the match for the round and match number or None."""
+        return self._positions.get((round_number, match_number), None)
+
+    def get_round_matches(self, rnd):
+        """Return the list of matches for the given Round or round number."""
+        round_number = getattr(rnd, 'round_number', rnd)
+        return self._round_matches.get(round_number, [])
+
+    def is_linked(self, round_number):
+        """Return if the winners of the round before the given round number play in the given round."""
+        prev_matches = self._round_matches.get(round_number - 1, None)
+        return bool(prev_matches) and len(prev_matches) > len(self._round_matches.get(round_number, []))
+
+    def parent_matches(self, match):
+        """Return the two matches whose victors play in the given match. Missing matches are None."""
+        round_number = match.round.round_number
+        if not self.is_linked(round_number):
+            return None, None
+        num = match.match_number * 2
+        return self.get_match(round_number - 1, num - 1), self.get_match(round_number - 1, num)
+
+    def child_match(self, match):
+        """Return the match that the victor of the given match plays in next or None."""
+        round_number = match.round.round_number + 1
+        if not self.is_linked(round_number):
+            return None
+        return self.get_match(round_number, (match.match_number + 1) // 2)
+
+    def get_teams(self):
+        """Return the list of teams playing in the tournament's matches."""
+        teams = {}
+        for match in self:
+            for team in (match.team1, match.team2):
+                if team is not None:
+                    teams[team.pk] = team
+        return sorted(teams.values(), key=lambda team: team.name)
+
+    def get_team_choices(self, guesses):
+        """Return a dictionary of match id: list of teams that can be picked for every match.
+
+        The choices are found in one pass from the first round to the last. A match with both teams set can only be
+        won by those teams. Otherwise each slot is the team guessed for the parent match if it is one of the parent
+        match's choices, the slot's team or the choices of the parent match. A slot without a team or parent match can
+        be any team in the tournament.
+
+        Args:
+            guesses (dict): Match id: guessed team id dictionary.
+        """
+        all_teams = self.get_teams()
+        choices = {}
+        for match in self:
+            if match.team1 and match.team2:
+                choices[match.pk] = [match.team1, match.team2]
+                continue
+
+            match_choices = []
+            for slot, parent in zip(('team1', 'team2'), self.parent_matches(match)):
+                team = getattr(match, slot)
+                guess = parent and guesses.get(parent.pk, None)
+                parent_choices = parent and {team.pk: team for team in choices[parent.pk]}
+                if guess and guess in parent_choices:
+                    match_choices.append(parent_choices[guess])
+                elif team:
+                    match_choices.append(team)
+                elif parent is not None:
+                    match_choices.extend(choices[parent.pk])
+                else:
+                    match_choices.extend(all_teams)
+            choices[match.pk] = match_choices
+        return choices
+
+    def get_possible_teams(self):
+        """Return a dictionary of match id: (team1 ids, team2 ids) of the teams that can still play in each slot.
+
+        A decided match only passes its victor on, so a team is never possible after the match it lost. A slot with a
+        parent match comes from the parent, even if the slot's team was not advanced or cleared yet. A slot without a
+        team or parent match can be any team that has not lost.
+        """
+        alive = {team.pk for team in self.get_teams()}
+        for match in self:
+            if match.victor_id is not None:
+                alive -= {match.team1_id, match.team2_id} - {match.victor_id}
+
+        possible = {}
+        winners = {}
+        for match in self:
+            slots = []
+            for team_id, parent in zip((match.team1_id, match.team2_id), self.parent_matches(match)):
+                if parent is not None:
+                    slots.append(winners[parent.pk])
+                elif team_id is not None:
+                    slots.append({team_id})
+                else:
+                    slots.append(alive)
+            possible[match.pk] = tuple(slots)
+            winners[match.pk] = {match.victor_id} if match.victor_id is not None else slots[0] | slots[1]
+        return possible
+
+    def get_user_team_choices(self, user):
+        """Return a dictionary of match id: list of teams the user can pick for every match.
+
+        The choices are resolved from the user's predictions once and kept for the life of this index.
+        """
+        key = getattr(user, 'pk', None)
+        try:
+            return self._choices[key]
+        except KeyError:
+            pass
+
+        guesses = {match_id: pred.guess_id for match_id, pred in self.get_predictions(user).items()}
+        self._choices[key] = choices = self.get_team_choices(guesses)
+        return choices
+
+    def get_predictions(self, user):
+        """Return a dictionary of match id: UserPrediction for all of the user's predictions in this tournament.
+
+        The predictions are loaded with a single query and kept for the life of this index.
+        """
+        if user is None:
+            return {}
+        try:
+            return self._predictions[user.pk]
+        except KeyError:
+            pass
+
+        predictions = {}
+        query = UserPrediction.objects.filter(user=user, match__round__tournament=self.tournament)
+        for prediction in query.select_related('guess'):
+            prediction.user = user
+            prediction.match = self.matches[prediction.match_id]
+            predictions[prediction.match_id] = prediction
+        self._predictions[user.pk] = predictions
+        return predictions
+
+    @staticmethod
+    def get_slot(match):
+        """Return the child match field ("team1" or "team2") that the victor of the given match fills."""
+        if match.match_number % 2 == 0:
+            return "team2"
+        return "team1"
+
+    def advance(self, matches):
+        """Move the victors of the given matches into the team1/team2 slots of their child matches.
+
+        The slots are recalculated down the whole subtree of each given match, so a cleared victor empties the child
+        slot and a changed victor replaces the old team. A decided match in the subtree whose victor no longer plays in
+        it is not changed. It is returned so the result can be fixed.
+
+        All of the changed child matches are saved with one bulk update without calling ``Match.save``. The
+        ``results_changed`` signal is sent once for the batch.
+
+        Args:
+            matches (list): Matches whose results changed.
+
+        Returns:
+            advanced (list): Child matches whose teams changed.
+            invalid (list): Decided matches after the given matches whose victor is not team1 or team2.
+        """
+        matches = list(matches)
+        given = set()
+        subtree = set()
+        for match in matches:
+            # Keep the indexed match up to date when a different instance was changed
+            indexed = self.matches.get(match.pk, None)
+            if indexed is None:
+                continue
+            if indexed is not match:
+                indexed.team1_score, indexed.team2_score = match.team1_score, match.team2_score
+                indexed.victor = match.victor
+            given.add(match.pk)
+            while indexed is not None and indexed.pk not in subtree:
+                subtree.add(indexed.pk)
+                indexed = self.child_match(indexed)
+
+        advanced = {}
+        invalid = []
+        for match in self:
+            if match.pk not in subtree:
+                continue
+            if match.pk not in given and match.victor_id is not None and \
+                    match.victor_id not in (match.team1_id, match.team2_id):
+                invalid.append(match)
+            child = self.child_match(match)
+            if child is None:
+                continue
+            slot = self.get_slot(match)
+            if getattr(child, slot + '_id') != match.victor_id:
+                setattr(child, slot, match.victor)
+                advanced[child.pk] = child
+
+        advanced = list(advanced.values())
+        if advanced:
+            Match.objects.bulk_update(advanced, ['team1', 'team2'])
+        results_changed.send(sender=Match, tournament=self.tournament, matches=matches, advanced=advanced)
+        return advanced, invalid
@@ -0,0 +1,149 @@
+"""Helpers for values kept in the Django cache.
+
+Cached values are grouped by a version number. Changing a group's version makes every value cached under the old
+version unreachable, so it does not matter how many keys the group has or which ones exist.
+
+The version numbers must be shared by every process that changes or reads the data (web workers, management
+commands), so use a shared cache backend (see the CACHES setting). The versions and values also expire after
+MARCH_MADNESS_CACHE_TIMEOUT seconds, which bounds how stale a process local cache can be.
+
+Settings:
+    MARCH_MADNESS_CACHE_TIMEOUT (int)[60]: Seconds to keep the cached values and version numbers. None keeps them
+        until they are invalidated, which is only safe with a shared cache.
+"""
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .signals import results_changed
+
+
+PREFIX = 'march_madness:'
+TIMEOUT = getattr(settings, "MARCH_MADNESS_CACHE_TIMEOUT", 60)
+
+
+def get_version(name):
+    """Return the current version number of the named cache group."""
+    key = PREFIX + 'version:' + name
+    version = cache.get(key)
+    if version is None:
+        # Start from the time, so a lost version key does not bring back old values
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+def get_versions(*names):
+    """Return a dictionary of name: current version number for the named cache groups with one cache read."""
+    keys = {PREFIX + 'version:' + name: name for name in names}
+    versions = {keys[key]: version for key, version in cache.get_many(list(keys)).items()}
+    for name in names:
+        if name not in versions:
+            versions[name] = get_version(name)
+    return versions
+
+
+def _incr_version(name):
+    key = PREFIX + 'version:' + name
+    try:
+        cache.incr(key)
+    except ValueError:
+        get_version(name)
+
+
+def bump_version(name):
+    """Invalidate every value cached under the named cache group.
+
+    Inside a transaction the group is invalidated again when the transaction commits. Until then other processes still
+    read the old rows and could cache them under the new version.
+    """
+    _incr_version(name)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _incr_version(name))
+
+
+def make_key(name, *parts, version=None):
+    """Return a cache key for the named cache group and its current version (or the given version)."""
+    if version is None:
+        version = get_version(name)
+    return ':'.join([PREFIX + name, str(version)] + [str(part) for part in parts])
+
+
+def get_or_set(name, parts, func, timeout=TIMEOUT, version=None):
+    """Return the cached value for the group and key parts. Call func and cache the result if it is missing.
+
+    Args:
+        name (str): Cache group name.
+        parts (list): Key parts.
+        func (callable): Function that returns the value.
+        timeout (int)[TIMEOUT]: Seconds to keep the value.
+        version (int)[None]: Group version from get_versions. By default the current version is read.
+    """
+    key = make_key(name, *parts, version=version)
+    value = cache.get(key)
+    if value is None:
+        value = func()
+        cache.set(key, value, timeout)
+    return value
+
+
+@receiver(post_save, sender='march_madness.TeamRank')
+@receiver(post_delete, sender='march_madness.TeamRank')
+def clear_seeds(sender=None, **kwargs):
+    bump_version('seeds')
+
+
+@receiver(post_save, sender='march_madness.Team')
+@receiver(post_delete, sender='march_madness.Team')
+def clear_teams(sender=None, **kwargs):
+    bump_version('teams')
+
+
+@receiver(post_save, sender='march_madness.Tournament')
+@receiver(post_delete, sender='march_madness.Tournament')
+@receiver(post_save, sender='march_madness.Round')
+@receiver(post_delete, sender='march_madness.Round')
+def clear_tournaments(sender=None, **kwargs):
+    """Invalidate the cached tournament and round lists. Call this after bulk creating rounds."""
+    bump_version('tournaments')
+
+
+@receiver(results_changed)
+@receiver(post_save, sender='march_madness.Tournament')
+@receiver(post_delete, sender='march_madness.Tournament')
+@receiver(post_save, sender='march_madness.Round')
+@receiver(post_delete, sender='march_madness.Round')
+@receiver(post_save, sender='march_madness.Match')
+@receiver(post_delete, sender='march_madness.Match')
+@receiver(post_save, sender='march_madness.ScoringRules')
+@receiver(post_delete, sender='march_madness.ScoringRules')
+@receiver(post_save, sender='march_madness.RoundPoints')
+@receiver(post_delete, sender='march_madness.RoundPoints')
+@receiver(post_save, sender='march_madness.SeedBonus')
+@receiver(post_delete, sender='march_madness.SeedBonus')
+def clear_results(sender=None, **kwargs):
+    bump_version('results')
+
+
+@receiver(post_save, sender='march_madness.UserPrediction')
+@receiver(post_delete, sender='march_madness.UserPrediction')
+def clear_picks(sender=None, instance=None, user_ids=None, tournament=None, **kwargs):
+    """Invalidate the cached picks for the prediction's user, the given user ids or every user in the tournament.
+
+    Args:
+        sender (object)[None]: Signal sender.
+        instance (UserPrediction)[None]: Saved or deleted prediction.
+        user_ids (list)[None]: Ids of the users whose picks changed.
+        tournament (Tournament)[None]: Tournament whose picks all changed. This is a single version change no matter
+            how many users have picks.
+    """
+    if instance is not None:
+        user_ids = [instance.user_id]
+    for user_id in user_ids or []:
+        bump_version('picks:{}'.format(user_id))
+    if tournament is not None:
+        bump_version('picks:tournament:{}'.format(tournament.pk))
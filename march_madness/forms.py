@@ -1,6 +1,6 @@
 from django import forms
 
-from .models import UserPrediction, Team
+from .models import UserPrediction
 
 
 class UserPredictionForm(forms.ModelForm):
@@ -9,17 +9,16 @@ class UserPredictionForm(forms.ModelForm):
         fields = ["user", "match", "guess", "team1_score", "team2_score"]
         widgets = {"user": forms.HiddenInput(), "match": forms.HiddenInput()}
 
-    def __init__(self, user, match, *args, **kwargs):
-        try:
-            if "initial" not in kwargs:
-                kwargs["initial"] = {"user": user, "match": match}
-            else:
-                kwargs["initial"]["user"] = user
-                kwargs["initial"]["match"] = match
-            if "instance" not in kwargs:
-                kwargs["instance"] = UserPrediction.objects.get(user=user, match=match)
-        except UserPrediction.DoesNotExist:
-            pass
+    def __init__(self, user, match, *args, predictions=None, **kwargs):
+        if "initial" not in kwargs:
+            kwargs["initial"] = {"user": user, "match": match}
+        else:
+            kwargs["initial"]["user"] = user
+            kwargs["initial"]["match"] = match
+        if "instance" not in kwargs:
+            instance = match.prediction(user, predictions)
+            if instance is not None:
+                kwargs["instance"] = instance
 
         super(UserPredictionForm, self).__init__(*args, **kwargs)
         self._match = match
@@ -0,0 +1,97 @@
+import copy
+from django.contrib.auth import get_user_model
+from django.db.models import Q, Count, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Group
+
+
+def set_ranks(items, attr="score"):
+    """Sort the items by the score attribute (high to low) and set their competition rank ("1224" ranking)."""
+    items.sort(key=lambda item: getattr(item, attr), reverse=True)
+    prev_score = None
+    rank = 0
+    for i, item in enumerate(items, 1):
+        score = getattr(item, attr)
+        if score != prev_score:
+            rank = i
+            prev_score = score
+        item.rank = rank
+    return items
+
+
+class GroupStanding(object):
+    """Score and rank for a group and the scores and ranks for its members."""
+    def __init__(self, group, members=None):
+        self.group = group
+        self.members = members or []
+        self.score = sum(mem.score for mem in self.members)
+        self.rank = None
+
+    @property
+    def name(self):
+        return self.group.name
+
+    @property
+    def captain(self):
+        return self.group.captain
+
+    def __str__(self):
+        return self.name
+
+
+class Leaderboard(object):
+    """Scores and ranks of every group and group member in a tournament.
+
+    The member scores, max possible scores and eliminated flags come from one grouped query over the group memberships
+    and the stored user scores. The groups and users are then loaded with one query each.
+
+    Args:
+        tournament (Tournament): Tournament to get the standings for.
+    """
+    def __init__(self, tournament):
+        self.tournament = tournament
+
+        user_field = Group.members.field.m2m_reverse_field_name()
+        membership = Group.members.through.objects.filter(group__tournament=tournament)
+        in_tournament = Q(**{user_field + "__scores__tournament": tournament})
+        is_eliminated = in_tournament & Q(**{user_field + "__scores__eliminated": True})
+        rows = membership.values_list("group", user_field).annotate(
+            score=Coalesce(Sum(user_field + "__scores__points", filter=in_tournament), Value(0)),
+            max_score=Coalesce(Sum(user_field + "__scores__max_points", filter=in_tournament), Value(0)),
+            eliminated=Count(user_field + "__scores", filter=is_eliminated))
+
+        groups = {group.pk: group for group in tournament.groups.select_related("captain")}
+        users = {user.pk: user for user in get_user_model().objects.filter(group__tournament=tournament).distinct()}
+        self.scores = {}
+        members = {pk: [] for pk in groups}
+        for group_id, user_id, score, max_score, eliminated in rows:
+            self.scores[user_id] = score
+
+            # Copy the user, so a user in multiple groups can have a different rank in each group
+            mem = copy.copy(users[user_id])
+            mem.score = score
+            mem.max_score = max_score
+            mem.eliminated = eliminated > 0
+            members[group_id].append(mem)
+
+        self.groups = set_ranks([GroupStanding(group, set_ranks(members[pk])) for pk, group in groups.items()])
+        self._standings = {standing.group.pk: standing for standing in self.groups}
+
+    def __iter__(self):
+        return iter(self.groups)
+
+    def get_user_score(self, user):
+        """Return the user's score or 0."""
+        return self.scores.get(getattr(user, "pk", user), 0)
+
+    def get_standing(self, group):
+        """Return the GroupStanding for the group or None."""
+        return self._standings.get(getattr(group, "pk", group), None)
+
+    def get_group_score(self, group):
+        """Return the total score of the group members."""
+        standing = self.get_standing(group)
+        if standing is None:
+            return 0
+        return standing.score
@@ -0,0 +1,205 @@
+"""Live score events for the group scores page (Server-Sent Events).
+
+Score deltas are published to a broker when a match result is saved. The score_events view streams the tournament's
+events to the connected browsers.
+
+Each open stream holds a server connection (and with sync workers a whole worker) until it times out, so the live scores
+are off unless MARCH_MADNESS_LIVE_SCORES is set. Only turn them on when the server can hold many long-lived connections
+(threaded or async workers).
+
+Settings:
+    MARCH_MADNESS_LIVE_SCORES (bool)[False]: Publish score events and let the group scores page listen to them.
+    MARCH_MADNESS_EVENT_BROKER (str)["march_madness.live.LocalBroker"]: Dotted path of the broker class. The
+        LocalBroker only reaches clients of the same process. Use "march_madness.live.CacheBroker" with a shared
+        cache (Redis, Memcached) when running more than one worker process.
+    MARCH_MADNESS_EVENT_HISTORY (int)[100]: Number of recent events kept so reconnecting clients can catch up.
+    MARCH_MADNESS_EVENT_KEEPALIVE (int)[15]: Seconds between keepalive comments when there are no events.
+    MARCH_MADNESS_EVENT_STREAM_TIMEOUT (int)[300]: Seconds before a stream is closed. The browser reconnects with the
+        Last-Event-ID header and gets the events it missed.
+"""
+import collections
+import json
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .caches import PREFIX
+
+
+ENABLED = getattr(settings, "MARCH_MADNESS_LIVE_SCORES", False)
+BROKER = getattr(settings, "MARCH_MADNESS_EVENT_BROKER", "march_madness.live.LocalBroker")
+HISTORY = getattr(settings, "MARCH_MADNESS_EVENT_HISTORY", 100)
+KEEPALIVE = getattr(settings, "MARCH_MADNESS_EVENT_KEEPALIVE", 15)
+STREAM_TIMEOUT = getattr(settings, "MARCH_MADNESS_EVENT_STREAM_TIMEOUT", 300)
+
+
+class LocalBroker(object):
+    """In process broker. Subscribers in the same process wait on a condition until an event is published."""
+    def __init__(self, history=HISTORY):
+        self._events = collections.deque(maxlen=history)
+        self._last_id = 0
+        self._condition = threading.Condition()
+
+    def publish(self, channel, event, data):
+        with self._condition:
+            self._last_id += 1
+            self._events.append((self._last_id, channel, event, data))
+            self._condition.notify_all()
+        return self._last_id
+
+    def get_last_id(self, channel):
+        return self._last_id
+
+    def get_events(self, channel, last_id, timeout=None):
+        """Return a list of (id, event, data) for the channel after last_id. Wait up to timeout seconds for one."""
+        def find():
+            return [(event_id, event, data) for event_id, event_channel, event, data in self._events
+                    if event_id > last_id and event_channel == channel]
+
+        deadline = time.monotonic() + (timeout or 0)
+        with self._condition:
+            events = find()
+            while not events and time.monotonic() < deadline:
+                self._condition.wait(deadline - time.monotonic())
+                events = find()
+        return events
+
+
+class CacheBroker(object):
+    """Broker that keeps the recent events of each channel in the Django cache and polls it.
+
+    Every worker process that shares the cache sees the events. Each event gets its id from a cache increment and is
+    stored under its own key, so concurrent publishers never overwrite each other's events. The increment must be
+    atomic across processes, which it is for Redis and Memcached.
+
+    Args:
+        history (int)[HISTORY]: Number of recent events a reader catches up on.
+        poll_interval (float)[1]: Seconds between cache reads while waiting for events.
+        event_timeout (int)[3600]: Seconds to keep each event.
+    """
+    def __init__(self, history=HISTORY, poll_interval=1, event_timeout=3600):
+        self.history = history
+        self.poll_interval = poll_interval
+        self.event_timeout = event_timeout
+
+    def get_key(self, channel, *parts):
+        return ':'.join([PREFIX + 'events', channel] + [str(part) for part in parts])
+
+    def publish(self, channel, event, data):
+        id_key = self.get_key(channel, 'id')
+        cache.add(id_key, 0, None)
+        event_id = cache.incr(id_key)
+        cache.set(self.get_key(channel, event_id), (event, data), self.event_timeout)
+        return event_id
+
+    def get_last_id(self, channel):
+        return cache.get(self.get_key(channel, 'id'), 0)
+
+    def get_events(self, channel, last_id, timeout=None):
+        """Return a list of (id, event, data) for the channel after last_id. Wait up to timeout seconds for one.
+
+        An id can be taken before its event is stored. The events stop at the first missing id, unless the id was
+        already missing on the previous poll (the publisher failed or the event expired).
+        """
+        deadline = time.monotonic() + (timeout or 0)
+        missing = None
+        while True:
+            current_id = self.get_last_id(channel)
+            ids = list(range(max(last_id + 1, current_id - self.history + 1), current_id + 1))
+            found = cache.get_many([self.get_key(channel, event_id) for event_id in ids])
+            events = []
+            for event_id in ids:
+                item = found.get(self.get_key(channel, event_id), None)
+                if item is not None:
+                    events.append((event_id,) + tuple(item))
+                elif missing == event_id:
+                    continue
+                else:
+                    missing = event_id
+                    break
+            if events or time.monotonic() >= deadline:
+                return events
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+
+
+_broker = None
+
+
+def get_broker():
+    """Return the broker for this process."""
+    global _broker
+    if _broker is None:
+        _broker = import_string(BROKER)()
+    return _broker
+
+
+def get_channel(tournament):
+    return 'scores:{}'.format(getattr(tournament, 'pk', tournament))
+
+
+def publish(tournament, event, data):
+    """Publish the event to the tournament's channel after the current transaction commits."""
+    if not ENABLED:
+        return
+    transaction.on_commit(lambda: get_broker().publish(get_channel(tournament), event, data))
+
+
+def publish_match_result(match, old_victor_id=None, old_value=None):
+    """Publish the score change of every user who picked the old or new victor of the match.
+
+    The "scores" event data is {"match": id, "round": round number, "victor": [id, name] or null,
+    "deltas": {user id: points}}.
+    """
+    if not ENABLED:
+        return
+    deltas = collections.Counter()
+    teams = [team for team in (old_victor_id, match.victor_id) if team is not None]
+    for user_id, guess_id in match.user_prediction.filter(guess_id__in=teams).values_list('user', 'guess'):
+        if old_victor_id is not None and guess_id == old_victor_id:
+            deltas[user_id] -= old_value
+        if match.victor_id is not None and guess_id == match.victor_id:
+            deltas[user_id] += match.tournament_value
+
+    victor = match.victor
+    publish(match.round.tournament_id, 'scores', {
+        'match': match.pk, 'round': match.round.round_number,
+        'victor': victor and [victor.pk, victor.name],
+        'deltas': {user_id: delta for user_id, delta in deltas.items() if delta}})
+
+
+def publish_reload(tournament):
+    """Tell the connected clients to reload the page (after a rescore or a bulk change)."""
+    publish(tournament, 'reload', {})
+
+
+def format_event(event_id, event, data):
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(event_id, event, json.dumps(data, separators=(',', ':')))
+
+
+def event_stream(channel, last_id=None, keepalive=KEEPALIVE, duration=STREAM_TIMEOUT):
+    """Yield the Server-Sent Events of the channel for duration seconds.
+
+    Args:
+        channel (str): Broker channel.
+        last_id (int)[None]: Send the kept events after this id first. None only sends new events.
+        keepalive (int)[KEEPALIVE]: Seconds between keepalive comments.
+        duration (int)[STREAM_TIMEOUT]: Seconds before the stream ends.
+    """
+    broker = get_broker()
+    current_id = broker.get_last_id(channel)
+    if last_id is None or last_id > current_id:
+        # An id from before the broker restarted cannot be caught up
+        last_id = current_id
+
+    yield 'retry: 3000\n\n'
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        events = broker.get_events(channel, last_id, timeout=min(keepalive, max(deadline - time.monotonic(), 0)))
+        if not events:
+            yield ': keepalive\n\n'
+        for event_id, event, data in events:
+            last_id = event_id
+            yield format_event(event_id, event, data)
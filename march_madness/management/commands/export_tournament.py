@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from march_madness.models import Tournament
+from march_madness.archive import export_tournament
+
+
+class Command(BaseCommand):
+    help = "Write a tournament's teams, bracket, results, groups and every user's picks to a compact zip file."
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument("tournament_name", type=str, help="Tournament name with year (EX: 'March Madness 2019')")
+        parser.add_argument("filename", type=str, help="Zip filename to write.")
+
+    def handle(self, *args, **options):
+        t, y = options['tournament_name'].rsplit(' ', 1)
+        tournament = Tournament.objects.get(name=t, year=int(y))
+
+        meta = export_tournament(tournament, options['filename'])
+        self.stdout.write("{}: exported {} matches, {} users and {} groups to {}".format(
+            tournament, meta['matches'], meta['users'], meta['groups'], options['filename']))
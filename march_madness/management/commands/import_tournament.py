@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from march_madness.archive import import_tournament
+
+
+class Command(BaseCommand):
+    help = "Restore a tournament from an export_tournament zip file."
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument("filename", type=str, help="Zip filename to read.")
+        parser.add_argument("--name", type=str, default=None, help="Tournament name. Defaults to the exported name.")
+        parser.add_argument("--year", type=int, default=None,
+                            help="Tournament year. Defaults to the exported year. Use another year to make a copy.")
+        parser.add_argument("--replace", action="store_true",
+                            help="Delete the existing tournament for the year first.")
+
+    def handle(self, *args, **options):
+        try:
+            tournament = import_tournament(options['filename'], name=options['name'], year=options['year'],
+                                           replace=options['replace'])
+        except ValueError as err:
+            raise CommandError(str(err))
+        self.stdout.write("Imported {}".format(tournament))
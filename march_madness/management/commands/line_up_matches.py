@@ -1,6 +1,3 @@
-import os
-import sys
-
 from django.core.management.base import BaseCommand
 
 from march_madness.models import current_year, Tournament
@@ -17,19 +14,28 @@ class Command(BaseCommand):
         parser.add_argument("--year", "-y", type=int, default=current_year(),
                             help="Year of the tournament to line up matches for. Not needed if tournament is given.")
 
-    @classmethod
-    def handle(cls, *args, **options):
+        parser.add_argument("--all", "-a", action="store_true",
+                            help="Line up the matches for every tournament.")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            tournaments = Tournament.objects.all()
+        else:
+            tourney = None
+            try:
+                if options["tournament"] is not None:
+                    tourney = Tournament.objects.get(name=options["tournament"])
+                if tourney is None:
+                    tourney = Tournament.objects.get(year=options["year"])
+            except Tournament.DoesNotExist:
+                pass
 
-        tourney = None
-        try:
-            if options["tournament"] is not None:
-                tourney = Tournament.objects.get(name=options["tournament"])
             if tourney is None:
                 tourney = Tournament.objects.get(year=options["year"])
-        except Tournament.DoesNotExist:
-            pass
-
-        if tourney is None:
-            tourney = Tournament.objects.get(year=options["year"])
+            tournaments = [tourney]
 
-        line_up_matches(tourney)
+        for tourney in tournaments:
+            report = line_up_matches(tourney)
+            self.stdout.write("{}: {} changes".format(tourney, len(report)))
+            for line in report:
+                self.stdout.write("  " + line)
@@ -1,14 +1,21 @@
 from django.core.management.base import BaseCommand
 
-from march_madness.models import current_year, Tournament
 from march_madness.utils import load_csv
 
 
 class Command(BaseCommand):
     @classmethod
     def add_arguments(cls, parser):
-        parser.add_argument("filename", type=str, help=load_csv.__doc__)
+        parser.add_argument("filename", type=str, nargs="+", help=load_csv.__doc__)
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Report the changes that would be made without saving them.")
 
-    @classmethod
-    def handle(cls, *args, **options):
-        load_csv(options['filename'])
+    def handle(self, *args, **options):
+        for filename in options['filename']:
+            report = load_csv(filename, dry_run=options['dry_run'])
+            if options['dry_run']:
+                self.stdout.write("Dry run {} ({} changes):".format(filename, len(report)))
+            else:
+                self.stdout.write("Loaded {} ({} changes):".format(filename, len(report)))
+            for line in report:
+                self.stdout.write("  " + line)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from march_madness.utils import load_results
+
+
+class Command(BaseCommand):
+    help = "Set the scores and victors of many matches from a results csv or json file."
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument("filename", type=str, nargs="+", help="Results csv or json file (see utils.load_results).")
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Report the changes that would be made without saving them.")
+
+    def handle(self, *args, **options):
+        for filename in options['filename']:
+            try:
+                report = load_results(filename, dry_run=options['dry_run'])
+            except ValueError as err:
+                raise CommandError("{}: {}".format(filename, err))
+
+            if options['dry_run']:
+                self.stdout.write("Dry run {} ({} changes):".format(filename, len(report)))
+            else:
+                self.stdout.write("Loaded {} ({} changes):".format(filename, len(report)))
+            for line in report:
+                self.stdout.write("  " + line)
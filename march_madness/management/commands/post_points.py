@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 
-from march_madness.models import current_year, Tournament, Match
-from march_madness.utils import calculate_points
+from march_madness.models import Tournament, ScoringRules
+from march_madness.utils import rescore_tournament
 
 
 class Command(BaseCommand):
@@ -9,32 +9,15 @@ class Command(BaseCommand):
     def add_arguments(cls, parser):
         parser.add_argument("tournament_name", type=str, help="Tournament name with year (EX: 'March Madness 2019')")
 
-    @classmethod
-    def handle(cls, *args, **options):
-        ROUND_POINTS = {
-            1: 2,
-            2: 2,
-            3: 4,
-            4: 6,
-            5: 8,
-            6: 10
-        }
-
-        SEED_POINTS = {
-            "16 v 1": 8,
-            "15 v 2": 7,
-            "14 v 3": 6,
-            "13 v 4": 5,
-            "12 v 1": 5,
-            "12 v 5": 4,
-            "11 v 6": 3,
-            "10 v 7": 2,
-            "9 v 8": 1,
-        }
-
+    def handle(self, *args, **options):
         t = options['tournament_name']
         t, y = t.rsplit(' ', 1)
         tournament = Tournament.objects.get(name=t, year=int(y))
 
-        for m in Match.objects.filter(round__tournament=tournament):
-            calculate_points(m, ROUND_POINTS, SEED_POINTS)
+        # Save the default rules, so they can be changed in the admin
+        ScoringRules.get_or_create_default(tournament)
+
+        changed = rescore_tournament(tournament)
+        self.stdout.write("{}: {} matches changed".format(tournament, len(changed)))
+        for match, old_value, new_value in changed:
+            self.stdout.write("  {}: {} -> {}".format(match, old_value, new_value))
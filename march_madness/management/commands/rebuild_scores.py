@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from march_madness.models import Tournament, UserScore, ScoreSnapshot
+
+
+class Command(BaseCommand):
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument("tournament_name", type=str, nargs="?", default=None,
+                            help="Tournament name with year (EX: 'March Madness 2019'). "
+                                 "All tournaments are rebuilt if not given.")
+
+    def handle(self, *args, **options):
+        if options['tournament_name']:
+            t, y = options['tournament_name'].rsplit(' ', 1)
+            tournaments = [Tournament.objects.get(name=t, year=int(y))]
+        else:
+            tournaments = Tournament.objects.all()
+
+        for tournament in tournaments:
+            count = UserScore.rebuild(tournament)
+            rounds = ScoreSnapshot.capture(tournament)
+            self.stdout.write("{}: rebuilt {} user scores and the snapshots of {} rounds".format(tournament, count,
+                                                                                              len(rounds)))
@@ -0,0 +1,71 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from march_madness.benchmarks import BENCHMARK_CACHES, CASES, build_tournament, run_benchmarks, get_environment, compare_results
+
+
+class Command(BaseCommand):
+    help = "Time the bracket views and commands against a synthetic tournament in a separate test database."
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument("--teams", type=int, choices=[64, 68], default=64, help="Number of teams.")
+        parser.add_argument("--users", type=int, default=100, help="Number of users.")
+        parser.add_argument("--groups", type=int, default=10, help="Number of groups.")
+        parser.add_argument("--picks", type=float, default=1.0, help="Fraction of the matches each user picked.")
+        parser.add_argument("--decided", type=float, default=0.5, help="Fraction of the matches with a victor.")
+        parser.add_argument("--repeat", "-r", type=int, default=5, help="Number of times to run each case.")
+        parser.add_argument("--case", action="append", choices=sorted(CASES), dest="cases",
+                            help="Case to run. Can be given more than once. Defaults to every case.")
+        parser.add_argument("--warm", action="store_true", help="Keep the cache between runs.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data.")
+        parser.add_argument("--output", "-o", type=str, default=None, help="Write the results to this JSON file.")
+        parser.add_argument("--baseline", "-b", type=str, default=None,
+                            help="Compare the results with this JSON file and fail if any case regressed.")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Allowed relative increase of the time and memory compared to the baseline.")
+
+    def handle(self, *args, **options):
+        config = {key: options[key] for key in ("teams", "users", "groups", "picks", "decided", "repeat", "warm",
+                                                "seed")}
+
+        # The synthetic tournament must not be cached where the site can read it
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES):
+                tournament = build_tournament(num_teams=options["teams"], num_users=options["users"],
+                                              num_groups=options["groups"], pick_fraction=options["picks"],
+                                              decided_fraction=options["decided"], seed=options["seed"])
+                results = run_benchmarks(tournament, cases=options["cases"], repeat=options["repeat"],
+                                         warm=options["warm"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write("{:<22} {:>10} {:>10} {:>8} {:>12}".format("case", "median ms", "min ms", "queries",
+                                                                   "peak KiB"))
+        for name, result in results.items():
+            self.stdout.write("{:<22} {:>10.2f} {:>10.2f} {:>8} {:>12.1f}".format(
+                name, result["time"] * 1000, result["min_time"] * 1000, result["queries"],
+                result["peak_memory"] / 1024))
+
+        data = {"environment": get_environment(), "config": config, "results": results}
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(data, f, indent=2)
+            self.stdout.write("Wrote {}".format(options["output"]))
+
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+            if baseline.get("config", config) != config:
+                self.stderr.write("The baseline was run with a different config: {}".format(baseline["config"]))
+            regressions = compare_results(results, baseline["results"], tolerance=options["tolerance"])
+            if regressions:
+                raise CommandError("Regressions compared to {}:\n  {}".format(options["baseline"],
+                                                                              "\n  ".join(regressions)))
+            self.stdout.write("No regressions compared to {}".format(options["baseline"]))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from march_madness.models import Tournament
+from march_madness.simulate import PoolSimulation, save_results
+
+
+class Command(BaseCommand):
+    help = "Simulate the rest of the tournament to find each user's chance to win their group and the pool."
+
+    @classmethod
+    def add_arguments(cls, parser):
+        parser.add_argument("tournament_name", type=str, help="Tournament name with year (EX: 'March Madness 2019')")
+        parser.add_argument("--samples", "-n", type=int, default=100000, help="Number of tournaments to simulate.")
+        parser.add_argument("--chunk-size", type=int, default=None,
+                            help="Number of samples for each worker task. Defaults to a size that fits the number of "
+                                 "users in MARCH_MADNESS_SIMULATION_MEMORY.")
+        parser.add_argument("--workers", "-w", type=int, default=None,
+                            help="Number of worker processes. Defaults to the number of CPUs.")
+        parser.add_argument("--seed", type=int, default=None, help="Random seed.")
+
+    def handle(self, *args, **options):
+        t, y = options['tournament_name'].rsplit(' ', 1)
+        tournament = Tournament.objects.get(name=t, year=int(y))
+
+        simulation = PoolSimulation(tournament)
+        results = simulation.run(options['samples'], chunk_size=options['chunk_size'], workers=options['workers'],
+                                 seed=options['seed'])
+        save_results(tournament, results)
+        self.stdout.write("{}: simulated {} tournaments for {} users".format(tournament, results['samples'],
+                                                                           len(results['users'])))
@@ -0,0 +1,160 @@
+"""Lightweight per-request SQL and timing instrumentation.
+
+``InstrumentationMiddleware`` samples requests and records the number of queries, the total SQL time, the queries that
+ran more than once with the same SQL (duplicate fingerprints) and the wall time of the request. The numbers are kept as
+rolling aggregates per URL name in memory, so each server process has its own statistics.
+
+Settings:
+    MARCH_MADNESS_INSTRUMENTATION_SAMPLE_RATE (float)[0.1]: Fraction of the requests to record. 0 turns this off.
+    MARCH_MADNESS_INSTRUMENTATION_HISTORY (int)[50]: Number of recent requests to keep for each URL name.
+    MARCH_MADNESS_INSTRUMENTATION_MAX_URLS (int)[100]: Number of URL names to keep. Others are recorded as "(other)".
+    MARCH_MADNESS_INSTRUMENTATION_FINGERPRINTS (int)[10]: Number of duplicate fingerprints to keep for each URL name.
+"""
+import collections
+import contextlib
+import random
+import re
+import threading
+import time
+from django.conf import settings
+from django.db import connections
+
+
+SAMPLE_RATE = getattr(settings, "MARCH_MADNESS_INSTRUMENTATION_SAMPLE_RATE", 0.1)
+HISTORY = getattr(settings, "MARCH_MADNESS_INSTRUMENTATION_HISTORY", 50)
+MAX_URLS = getattr(settings, "MARCH_MADNESS_INSTRUMENTATION_MAX_URLS", 100)
+MAX_FINGERPRINTS = getattr(settings, "MARCH_MADNESS_INSTRUMENTATION_FINGERPRINTS", 10)
+
+OTHER_URL = "(other)"
+UNRESOLVED_URL = "(unresolved)"
+
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+
+
+def get_fingerprint(sql):
+    """Return the SQL with the IN lists collapsed, so the same query with a different number of values matches."""
+    return IN_LIST.sub("IN (...)", sql)
+
+
+class QueryRecorder(object):
+    """Database execute wrapper that counts the queries and SQL time of one request."""
+    def __init__(self):
+        self.count = 0
+        self.sql_time = 0.0
+        self.fingerprints = collections.Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[sql] += 1
+
+    def get_duplicates(self):
+        """Return a dictionary of fingerprint: number of extra times a query with that fingerprint ran."""
+        duplicates = collections.Counter()
+        for sql, count in self.fingerprints.items():
+            duplicates[get_fingerprint(sql)] += count
+        return {fingerprint: count - 1 for fingerprint, count in duplicates.items() if count > 1}
+
+
+class URLStats(object):
+    """Rolling aggregates for the requests of one URL name."""
+    def __init__(self, history=HISTORY):
+        self.requests = 0
+        self.time = 0.0
+        self.max_time = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.sql_time = 0.0
+        self.duplicates = 0
+        self.fingerprints = collections.Counter()
+        self.recent = collections.deque(maxlen=history)
+
+    def add(self, elapsed, recorder, status):
+        duplicates = recorder.get_duplicates()
+        num_duplicates = sum(duplicates.values())
+
+        self.requests += 1
+        self.time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.queries += recorder.count
+        self.max_queries = max(self.max_queries, recorder.count)
+        self.sql_time += recorder.sql_time
+        self.duplicates += num_duplicates
+        self.fingerprints.update(duplicates)
+        if len(self.fingerprints) > MAX_FINGERPRINTS * 2:
+            self.fingerprints = collections.Counter(dict(self.fingerprints.most_common(MAX_FINGERPRINTS)))
+        self.recent.append({"time": time.time(), "elapsed": elapsed, "queries": recorder.count,
+                            "sql_time": recorder.sql_time, "duplicates": num_duplicates, "status": status})
+
+    def summary(self):
+        requests = self.requests or 1
+        return {"requests": self.requests,
+                "avg_time": self.time / requests, "max_time": self.max_time,
+                "avg_queries": self.queries / requests, "max_queries": self.max_queries,
+                "avg_sql_time": self.sql_time / requests,
+                "avg_duplicates": self.duplicates / requests,
+                "duplicates": [{"sql": sql, "count": count}
+                               for sql, count in self.fingerprints.most_common(MAX_FINGERPRINTS)],
+                "recent": list(self.recent)}
+
+
+class RequestStats(object):
+    """Thread safe collection of URLStats by URL name."""
+    def __init__(self, max_urls=MAX_URLS, history=HISTORY):
+        self.max_urls = max_urls
+        self.history = history
+        self.started = time.time()
+        self._urls = {}
+        self._lock = threading.Lock()
+
+    def add(self, url_name, elapsed, recorder, status):
+        with self._lock:
+            try:
+                stats = self._urls[url_name]
+            except KeyError:
+                if len(self._urls) >= self.max_urls:
+                    url_name = OTHER_URL
+                stats = self._urls.setdefault(url_name, URLStats(self.history))
+            stats.add(elapsed, recorder, status)
+
+    def reset(self):
+        with self._lock:
+            self._urls = {}
+            self.started = time.time()
+
+    def summary(self):
+        """Return a JSON serializable dictionary of url name: aggregates sorted by the total number of queries."""
+        with self._lock:
+            urls = sorted(self._urls.items(), key=lambda item: item[1].queries, reverse=True)
+            return {"started": self.started, "sample_rate": SAMPLE_RATE,
+                    "urls": collections.OrderedDict((name, stats.summary()) for name, stats in urls)}
+
+
+request_stats = RequestStats()
+
+
+class InstrumentationMiddleware(object):
+    """Record the queries and wall time of a sample of the requests in ``request_stats``."""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if SAMPLE_RATE <= 0 or (SAMPLE_RATE < 1 and random.random() >= SAMPLE_RATE):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with contextlib.ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(recorder))
+            start = time.perf_counter()
+            response = self.get_response(request)
+            elapsed = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        url_name = match.view_name if match is not None else UNRESOLVED_URL
+        request_stats.add(url_name, elapsed, recorder, response.status_code)
+        return response
@@ -1,11 +1,18 @@
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q, F, Case, When, Value, Sum
+from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db import models, transaction
+from django.db.models import Q, F, Case, When, Value, Sum, Count
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.safestring import mark_safe
 from itertools import chain
+import collections
+
+from .caches import get_versions, get_or_set
+from .scoring import DEFAULT_ROUND_POINTS, DEFAULT_SEED_POINTS, ScoringTable
 
 
 def validate_year(value):
@@ -39,10 +46,7 @@ class Team(models.Model):
         if year is None:
             year = current_year()
 
-        try:
-            return self.rankings.get(year=year).seed
-        except:
-            return None
+        return TeamRank.get_seeds(year).get(self.pk, None)
 
     def get_name_with_icon(self, tournament=None):
         text = self.name
@@ -58,7 +62,7 @@ class Team(models.Model):
             except:
                 pass
         try:
-            seed = self.rankings.get(year=tournament.year).seed
+            seed = TeamRank.get_seeds(tournament.year)[self.pk]
             text += " (%d)" % seed
         except:
             pass
@@ -82,6 +86,15 @@ class TeamRank(models.Model):
     class Meta:
         ordering = ("year", "seed")
 
+    @classmethod
+    def get_seeds(cls, year):
+        """Return a dictionary of team id: seed for the year.
+
+        The seeds are loaded with one query and kept in the Django cache until a TeamRank is saved or deleted.
+        """
+        return get_or_set('seeds', [year], lambda: dict(cls.objects.filter(year=year, seed__isnull=False)
+                                                       .values_list('team', 'seed')))
+
     def __str__(self):
         return "".join((str(self.year), " ", self.team.name, " - ", str(self.seed)))
 
@@ -103,12 +116,138 @@ class Tournament(models.Model):
                                                  default=Value(0), output_field=models.IntegerField()))
         return ann.aggregate(score=Sum("success"))["score"] or 0
 
+    @classmethod
+    def get_index(cls):
+        """Return the tournament lookup index.
+
+        The index is loaded with one query and kept in the Django cache until a tournament or round is saved or deleted.
+
+        Returns:
+            index (dict): {"tournaments": {pk: Tournament} newest first, "names": {lower case name and str(): pk},
+                "years": {year: pk}, "current": pk of the newest tournament or None}
+        """
+        def build():
+            # Newest first, so a name shared by several years resolves to the newest tournament
+            tournaments = {t.pk: t for t in cls.objects.order_by("-year")}
+            names = {}
+            for t in tournaments.values():
+                names.setdefault(t.name.lower(), t.pk)
+                names.setdefault(str(t).lower(), t.pk)
+            return {"tournaments": tournaments, "names": names,
+                    "years": {t.year: t.pk for t in tournaments.values()},
+                    "current": next(iter(tournaments), None)}
+        return get_or_set("tournaments", ["index"], build)
+
+    @classmethod
+    def resolve(cls, value=None):
+        """Return the tournament for the name, pk or year, or the newest tournament if nothing matches.
+
+        The tournament comes from the cached index, so every call returns a new instance without running a query.
+
+        Args:
+            value (str/int)[None]: Tournament name (case insensitive), pk or year. A name used by several
+                tournaments resolves to the newest one.
+
+        Returns:
+            tournament (Tournament): Matching tournament, the newest tournament or None if there are no tournaments.
+        """
+        index = cls.get_index()
+        pk = None
+        if value is not None:
+            value = str(value).strip()
+            pk = index["names"].get(value.lower(), None)
+            if pk is None and value.isdigit():
+                pk = int(value) if int(value) in index["tournaments"] else index["years"].get(int(value), None)
+        if pk is None:
+            pk = index["current"]
+        return index["tournaments"].get(pk, None)
+
+    def get_eliminated_teams(self):
+        """Return the set of team ids that lost a match in this tournament."""
+        matches = Match.objects.filter(round__tournament=self, victor__isnull=False)
+        return {team1 if victor == team2 else team2
+                for team1, team2, victor in matches.values_list("team1", "team2", "victor")} - {None}
+
+    def get_remaining_values(self, bracket=None):
+        """Return a dictionary of (match id, team id): the most points a pick of the team can still earn.
+
+        Every undecided match is priced from the scoring rules at the best seed value the team can still get against
+        the teams that can still reach the other slot. A team without a seed gets the best value of the round.
+
+        Args:
+            bracket (BracketIndex)[None]: Bracket to price. By default the values are priced from a fresh BracketIndex,
+                so they see results saved since this tournament's bracket was loaded, and cached with the results.
+        """
+        if bracket is None:
+            from .bracket import BracketIndex
+            versions = get_versions('results', 'seeds')
+            return get_or_set('results', ['remaining', self.pk, versions['seeds']],
+                              lambda: self.get_remaining_values(BracketIndex(self)), version=versions['results'])
+
+        table = self.get_scoring_table()
+        seeds = TeamRank.get_seeds(self.year)
+        round_max = {}
+        values = {}
+        for match_id, slots in bracket.get_possible_teams().items():
+            match = bracket.matches[match_id]
+            if match.victor_id is not None:
+                continue
+            round_number = match.round.round_number
+            if round_number not in round_max:
+                round_max[round_number] = max(table.get_value(round_number, victor, loser)
+                                              for victor in range(1, table.num_seeds)
+                                              for loser in range(1, table.num_seeds))
+
+            for teams, opponents in (slots, slots[::-1]):
+                opponent_seeds = {seeds.get(team_id, None) for team_id in opponents}
+                for team_id in teams:
+                    seed = seeds.get(team_id, None)
+                    if not opponent_seeds:
+                        value = 0
+                    elif seed is None or None in opponent_seeds:
+                        value = round_max[round_number]
+                    else:
+                        value = max(table.get_value(round_number, seed, loser) for loser in opponent_seeds)
+                    values[(match_id, team_id)] = max(values.get((match_id, team_id), 0), value)
+        return values
+
+    def get_bracket(self, refresh=False):
+        """Return the BracketIndex of this tournament's rounds and matches. The index is kept on this instance."""
+        bracket = getattr(self, '_bracket', None)
+        if bracket is None or refresh:
+            from .bracket import BracketIndex
+            self._bracket = bracket = BracketIndex(self)
+        return bracket
+
+    def get_scoring_table(self, refresh=False):
+        """Return the compiled ScoringTable for this tournament's ScoringRules. The table is kept on this instance."""
+        table = getattr(self, '_scoring_table', None)
+        if table is None or refresh:
+            try:
+                rules = self.scoring_rules
+            except ScoringRules.DoesNotExist:
+                rules = ScoringRules(tournament=self)
+            self._scoring_table = table = rules.compile()
+        return table
+
+    def get_captain_for_user(self, user):
+        """Return the captain of the user's group in this tournament or None."""
+        try:
+            return self.groups.select_related('captain').get(members__in=[user]).captain
+        except (Group.DoesNotExist, AttributeError, Exception):
+            return None
+
+    def get_leaderboard(self, refresh=False):
+        """Return the Leaderboard of group and member scores. The leaderboard is kept on this instance."""
+        leaderboard = getattr(self, '_leaderboard', None)
+        if leaderboard is None or refresh:
+            from .leaderboard import Leaderboard
+            self._leaderboard = leaderboard = Leaderboard(self)
+        return leaderboard
+
     def get_group_score(self, group):
         """Return the group score."""
-        value = 0
-        for user in group.members.all():
-            value += self.get_user_score(user)
-        return value
+        return self.get_leaderboard().get_group_score(group)
 
     def __str__(self):
         if str(self.year) not in self.name:
@@ -172,83 +311,52 @@ class Match(models.Model):
     victor = models.ForeignKey(Team, on_delete=models.PROTECT, null=True, blank=True, related_name="match_set_won")
 
     tournament_value = models.IntegerField(default=1)
+    team1_probability = models.FloatField(null=True, blank=True,
+                                          validators=[MinValueValidator(0), MaxValueValidator(1)],
+                                          help_text="Chance that team 1 wins for pool simulations. "
+                                                    "Calculated from the seeds if not given.")
 
     class Meta:
         unique_together = ("round", "match_number")
         ordering = ("round__round_number", "match_number",)
 
-    # def child_match(self):
-    #     try:
-    #         next_round = Round.objects.get(tournament=self.round.tournament, round_number=self.round.round_number+1)
-    #         return Match.objects.get(Q(teams__in=self.teams), round=next_round)
-    #     except (Match.DoesNotExist, Round.DoesNotExist):
-    #         pass
+    def get_bracket(self):
+        """Return the BracketIndex for this match's tournament."""
+        bracket = getattr(self, '_bracket', None)
+        if bracket is None:
+            self._bracket = bracket = self.round.tournament.get_bracket()
+        return bracket
 
     def get_team_choices(self, user=None):
-        team1_choices = None
-        team2_choices = None
-        if self.team1 and self.team2:
-            return [self.team1, self.team2]
+        """Return the list of teams the user can pick for this match.
 
-        match1, match2 = self.parent_matches()
-        try:
-            predict1 = match1.user_prediction.get(user=user)
-            if predict1.guess:
-                team1_choices = [predict1.guess]
-        except UserPrediction.DoesNotExist:
-            pass
-        try:
-            predict2 = match2.user_prediction.get(user=user)
-            if predict2.guess:
-                team2_choices = [predict2.guess]
-        except UserPrediction.DoesNotExist:
-            pass
-
-        if team1_choices is None:
-            if self.team1:
-                team1_choices = [self.team1]
-            elif match1 is None:
-                team1_choices = Team.objects.all()
-            else:
-                team1_choices = match1.get_team_choices(user=user)
-
-        if team2_choices is None:
-            if self.team2:
-                team2_choices = [self.team2]
-            elif match2 is None:
-                team2_choices = Team.objects.all()
-            else:
-                team2_choices = match2.get_team_choices(user=user)
-
-        return chain(team1_choices, team2_choices)
+        The choices for every match in the user's bracket are resolved together and kept on the BracketIndex, so all
+        of the forms on a page share them.
+        """
+        return self.get_bracket().get_user_team_choices(user).get(self.pk, [])
 
     def parent_matches(self):
-        num = int(self.match_number * 2)
-        match_nums = [num - 1, num]
-        try:
-            match1 = Match.objects.get(round__tournament=self.round.tournament,
-                                       round__round_number=self.round.round_number-1, match_number=match_nums[0])
-        except Match.DoesNotExist:
-            match1 = None
+        return self.get_bracket().parent_matches(self)
 
-        try:
-            match2 = Match.objects.get(round__tournament=self.round.tournament,
-                                       round__round_number=self.round.round_number-1, match_number=match_nums[1])
-        except Match.DoesNotExist:
-            match2 = None
-        return match1, match2
+    def child_match(self):
+        return self.get_bracket().child_match(self)
+
+    def prediction(self, user, predictions=None):
+        """Return the user's prediction for this match or None.
 
-    def prediction(self, user):
+        Args:
+            user (User): User who made the prediction.
+            predictions (dict)[None]: Preloaded match id: UserPrediction dictionary to use instead of a query.
+        """
+        if predictions is not None:
+            return predictions.get(self.pk, None)
         try:
             return self.user_prediction.get(user=user)
         except UserPrediction.DoesNotExist:
             return None
 
     def get_captain_for_user(self, user):
-        try:
-            return self.round.tournament.groups.get(members__in=[user]).captain
-        except (Group.DoesNotExist, AttributeError, Exception):
-            return None
+        return self.round.tournament.get_captain_for_user(user)
 
     def get_absolute_url(self):
         return reverse('march_madness:round', args=[self.id])
@@ -258,26 +366,36 @@ class Match(models.Model):
             return '{} R {} M {}'.format(self.round.tournament, self.round.round_number, self.match_number)
         return 'M {}'.format(self.match_number)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+
+        # Remember the saved result so the scores can be updated when it changes
+        instance._saved_result = (instance.__dict__.get('victor_id', None),
+                                  instance.__dict__.get('tournament_value', None))
+        return instance
+
     def save(self, *args, **kwargs):
+        old_victor_id, old_value = getattr(self, '_saved_result', (None, None))
         ret = super().save(*args, **kwargs)
 
+        result_changed = (old_victor_id, old_value) != (self.victor_id, self.tournament_value)
+
+        # Update the scores of the users who predicted this match and push the changes to the live score pages
+        if result_changed:
+            from .live import publish_match_result
+            UserScore.update_for_match(self, old_victor_id, old_value)
+            publish_match_result(self, old_victor_id, old_value)
+
         # When the victor is chosen set team1 or team2 match options for the child match
-        if self.victor:
-            try:
-                num = int(self.match_number // 2)
-                if self.match_number % 2 == 0:
-                    # Even team 2
-                    child = Match.objects.get(round__tournament=self.round.tournament,
-                                              round__round_number=self.round.round_number+1, match_number=num)
-                    child.team2 = self.victor
-                else:
-                    # Odd team 1
-                    child = Match.objects.get(round__tournament=self.round.tournament,
-                                              round__round_number=self.round.round_number+1, match_number=num+1)
-                    child.team1 = self.victor
-                child.save()
-            except (Match.DoesNotExist, Match.MultipleObjectsReturned):
-                pass
+        if result_changed or self.victor_id is not None:
+            self.get_bracket().advance([self])
+
+        # Recapture the score history of this round and the rounds after it
+        if result_changed:
+            ScoreSnapshot.capture(self.round.tournament, self.round.round_number)
+
+        self._saved_result = (self.victor_id, self.tournament_value)
 
         return ret
 
@@ -300,6 +418,451 @@ class UserPrediction(models.Model):
         unique_together = ("user", "match")
         ordering = ("match__date", )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+
+        # Remember the saved pick so the score can be moved by the difference when it changes
+        instance._saved_pick = (instance.__dict__.get('match_id', None), instance.__dict__.get('guess_id', None))
+        return instance
+
     def check_date(self):
         if self.match.round.start_date and self.match.round.start_date < timezone.now():
             raise ValidationError("You cannot set or change a prediction after the round has started!")
+
+
+class UserScore(models.Model):
+    """Stored tournament score for a user.
+
+    The score is updated when a match victor or tournament value changes and when the user's predictions change. Use
+    ``rebuild`` (or the rebuild_scores command) to recalculate the scores from the predictions.
+
+    ``max_points`` is the score plus the most each pick of an undecided match can still earn under the scoring rules
+    (see Tournament.get_remaining_values). A user is ``eliminated`` when their max points are less than the leader's
+    points in every group they are in.
+    """
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name="scores")
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE, related_name="user_scores")
+    points = models.IntegerField(default=0)
+    correct = models.IntegerField(default=0, verbose_name="Correct Picks")
+    max_points = models.IntegerField(default=0, verbose_name="Max Possible Points")
+    eliminated = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("user", "tournament")
+        ordering = ("tournament__year", "-points")
+
+    def __str__(self):
+        return "{} {} - {}".format(self.tournament, self.user, self.points)
+
+    @classmethod
+    def calculate(cls, tournament, users=None):
+        """Return a list of unsaved UserScores calculated from the predictions.
+
+        The points come from one grouped query. The max points add the remaining value of each undecided pick from
+        Tournament.get_remaining_values.
+
+        Args:
+            tournament (Tournament): Tournament to calculate the scores for.
+            users (list/QuerySet)[None]: Only calculate the scores for these users. By default all users who made a
+                prediction in the tournament are calculated.
+        """
+        predictions = UserPrediction.objects.filter(match__round__tournament=tournament)
+        if users is not None:
+            predictions = predictions.filter(user__in=users)
+
+        is_correct = Q(guess=F("match__victor"))
+        rows = predictions.values("user").annotate(
+            points=Sum(Case(When(is_correct, then=F("match__tournament_value")),
+                            default=Value(0), output_field=models.IntegerField())),
+            correct=Count("id", filter=is_correct))
+
+        values = tournament.get_remaining_values()
+        remaining = collections.Counter()
+        undecided = predictions.filter(match__victor__isnull=True).values_list("user", "match", "guess")
+        for user_id, match_id, guess_id in undecided.iterator():
+            remaining[user_id] += values.get((match_id, guess_id), 0)
+
+        return [cls(user_id=row["user"], tournament=tournament, points=row["points"] or 0, correct=row["correct"],
+                    max_points=(row["points"] or 0) + remaining[row["user"]])
+                for row in rows]
+
+    @classmethod
+    def update_eliminated(cls, tournament, users=None):
+        """Set eliminated for the user scores of the tournament and save the scores that changed.
+
+        A user is eliminated when their max points are less than the leader's points in every group they are in.
+
+        Args:
+            tournament (Tournament): Tournament of the scores.
+            users (list)[None]: User ids whose points or max points changed. Only the scores of these users and the
+                other members of their groups are updated. By default every score is updated.
+        """
+        user_field = Group.members.field.m2m_reverse_field_name()
+        membership = Group.members.through.objects.filter(group__tournament=tournament)
+        scores = cls.objects.filter(tournament=tournament)
+        if users is not None:
+            # A changed score can only change the leaders of the user's groups. The members of those groups are
+            # checked against every group they are in.
+            members = membership.filter(group__in=membership.filter(**{user_field + "__in": users}).values("group"))
+            users = set(users) | set(members.values_list(user_field, flat=True))
+            membership = membership.filter(group__in=membership.filter(**{user_field + "__in": users}).values("group"))
+            scores = scores.filter(Q(user__in=users) | Q(user__in=membership.values(user_field)))
+        scores = {score.user_id: score for score in scores}
+
+        groups = {}
+        for group_id, user_id in membership.values_list("group", user_field):
+            groups.setdefault(group_id, []).append(user_id)
+
+        can_win = {}
+        for members in groups.values():
+            leader = max(scores[user_id].points if user_id in scores else 0 for user_id in members)
+            for user_id in members:
+                max_points = scores[user_id].max_points if user_id in scores else 0
+                can_win[user_id] = can_win.get(user_id, False) or max_points >= leader
+
+        changed = []
+        for user_id, score in scores.items():
+            if users is not None and user_id not in users:
+                continue
+            eliminated = not can_win.get(user_id, True)
+            if score.eliminated != eliminated:
+                score.eliminated = eliminated
+                changed.append(score)
+        cls.objects.bulk_update(changed, ["eliminated"])
+
+    @classmethod
+    def rebuild(cls, tournament):
+        """Recalculate and save every user score for the tournament. Return the number of scores saved."""
+        scores = cls.calculate(tournament)
+        with transaction.atomic():
+            cls.objects.filter(tournament=tournament).delete()
+            cls.objects.bulk_create(scores)
+            cls.update_eliminated(tournament)
+        return len(scores)
+
+    @classmethod
+    def update_users(cls, tournament, users):
+        """Recalculate and save the scores of the given user ids after their predictions changed.
+
+        The other users' scores do not change, so only the eliminated flags of the given users' groups are updated.
+        """
+        users = list(users)
+        scores = {score.user_id: score for score in cls.calculate(tournament, users)}
+        with transaction.atomic():
+            changed = []
+            for score in cls.objects.filter(tournament=tournament, user__in=users):
+                new = scores.pop(score.user_id, None) or cls(user_id=score.user_id, tournament=tournament)
+                if (score.points, score.correct, score.max_points) != (new.points, new.correct, new.max_points):
+                    score.points, score.correct, score.max_points = new.points, new.correct, new.max_points
+                    changed.append(score)
+            cls.objects.bulk_update(changed, ["points", "correct", "max_points"])
+            cls.objects.bulk_create(scores.values())
+            cls.update_eliminated(tournament, users)
+
+    @classmethod
+    def update_prediction(cls, user_id, old, new):
+        """Update a user's stored score after one of their picks changed.
+
+        The score moves by the difference between the old and new pick. A decided match is worth its points and an
+        undecided match its remaining value (see Tournament.get_remaining_values), so the rest of the user's picks are
+        not read. A user without a stored score is calculated in full.
+
+        Args:
+            user_id (int): User of the pick.
+            old (tuple)[None]: Saved (match id, guess id) or None for a new pick.
+            new (tuple)[None]: New (match id, guess id) or None for a deleted pick. It must be the same match as old.
+        """
+        match_id = (new or old)[0]
+        match = Match.objects.filter(pk=match_id).select_related("round__tournament").first()
+        if match is None:
+            return
+        tournament = match.round.tournament
+
+        def get_score(pick):
+            if pick is None:
+                return 0, 0, 0
+            if match.victor_id is None:
+                return 0, 0, values.get(pick, 0)
+            if pick[1] == match.victor_id:
+                return match.tournament_value, 1, match.tournament_value
+            return 0, 0, 0
+
+        values = tournament.get_remaining_values() if match.victor_id is None else {}
+        delta = [b - a for a, b in zip(get_score(old), get_score(new))]
+        if not any(delta):
+            return
+
+        with transaction.atomic():
+            updated = cls.objects.filter(tournament=tournament, user=user_id).update(
+                points=F("points") + delta[0], correct=F("correct") + delta[1], max_points=F("max_points") + delta[2])
+            if not updated:
+                cls.objects.bulk_create(cls.calculate(tournament, [user_id]))
+            cls.update_eliminated(tournament, [user_id])
+
+    @classmethod
+    def update_for_match(cls, match, old_victor_id=None, old_value=None):
+        """Update the scores of the users who predicted the match after the victor or tournament value changed.
+
+        Only the users who predicted the match are touched. Users without a stored score are calculated in full. The
+        result only changes the remaining values of the match and the later matches its teams can reach, so the
+        remaining values are priced before and after the result from one BracketIndex and only the users with a pick
+        whose value changed get new max points. The eliminated flags of the changed users' groups are updated.
+
+        Args:
+            match (Match): Match that was saved.
+            old_victor_id (int)[None]: Previous victor id.
+            old_value (int)[None]: Previous tournament value.
+        """
+        if old_victor_id == match.victor_id and (old_victor_id is None or old_value == match.tournament_value):
+            return
+
+        from .bracket import BracketIndex
+
+        tournament = match.round.tournament
+        scores = cls.objects.filter(tournament=tournament)
+        with transaction.atomic():
+            missing = set(match.user_prediction.exclude(user__in=scores.values("user"))
+                          .values_list("user", flat=True))
+
+            # Remove the old result then add the new result
+            if old_victor_id is not None:
+                old_users = match.user_prediction.filter(guess_id=old_victor_id).values("user")
+                scores.filter(user__in=old_users).update(points=F("points") - old_value, correct=F("correct") - 1)
+            if match.victor_id is not None:
+                new_users = match.user_prediction.filter(guess_id=match.victor_id).values("user")
+                scores.filter(user__in=new_users).update(points=F("points") + match.tournament_value,
+                                                         correct=F("correct") + 1)
+            changed_users = set(match.user_prediction.filter(guess_id__in=[old_victor_id, match.victor_id])
+                                .values_list("user", flat=True))
+
+            # Price the picks with the old and the new result
+            bracket = BracketIndex(tournament)
+            indexed = bracket.matches[match.pk]
+            new_values = tournament.get_remaining_values(bracket)
+            indexed.victor_id = old_victor_id
+            old_values = tournament.get_remaining_values(bracket)
+            indexed.victor_id = match.victor_id
+
+            def get_value(values, victor_id, value, key):
+                if key[0] != match.pk or victor_id is None:
+                    return values.get(key, 0)
+                return value if key[1] == victor_id else 0
+
+            later = {key[0] for key in set(old_values) | set(new_values)
+                     if old_values.get(key, 0) != new_values.get(key, 0)}
+            deltas = collections.Counter()
+            picks = UserPrediction.objects.filter(match__in=later | {match.pk}).values_list("user", "match", "guess")
+            for user_id, match_id, guess_id in picks.iterator():
+                if user_id not in missing:
+                    key = (match_id, guess_id)
+                    deltas[user_id] += (get_value(new_values, match.victor_id, match.tournament_value, key) -
+                                        get_value(old_values, old_victor_id, old_value, key))
+            deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+            changed = list(scores.filter(user__in=deltas))
+            for score in changed:
+                score.max_points += deltas[score.user_id]
+            cls.objects.bulk_update(changed, ["max_points"])
+
+            if missing:
+                cls.objects.bulk_create(cls.calculate(tournament, missing))
+            cls.update_eliminated(tournament, changed_users | set(deltas) | missing)
+
+
+@receiver(post_save, sender=UserPrediction)
+@receiver(post_delete, sender=UserPrediction)
+def update_prediction_score(sender, instance=None, raw=False, created=False, signal=None, **kwargs):
+    """Update the user's stored score and max points after one of their predictions is saved or deleted."""
+    if raw:
+        return
+    old = None if created else getattr(instance, '_saved_pick', None)
+    new = None if signal is post_delete else (instance.match_id, instance.guess_id)
+    instance._saved_pick = new
+    if (created or old is not None) and (old is None or new is None or old[0] == new[0]):
+        UserScore.update_prediction(instance.user_id, old, new)
+        return
+
+    # The saved pick is not known or it moved to another match
+    tournament = Tournament.objects.filter(rounds__matches=instance.match_id).first()
+    if tournament is not None:
+        UserScore.update_users(tournament, [instance.user_id])
+
+
+class ScoreSnapshot(models.Model):
+    """Points and rank after a round is complete.
+
+    Each complete round has a row for every user in the pool (no group), a row for every group member (rank in the
+    group) and a row for every group total (no user, rank among the groups). The snapshots are recaptured when a
+    match result changes, so a group's history is one indexed read.
+    """
+    round = models.ForeignKey(Round, on_delete=models.CASCADE, related_name="score_snapshots")
+    group = models.ForeignKey(Group, on_delete=models.CASCADE, null=True, blank=True, related_name="score_snapshots")
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, null=True, blank=True,
+                             related_name="score_snapshots")
+    points = models.IntegerField(default=0)
+    rank = models.PositiveIntegerField(default=1)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["group", "round"]), models.Index(fields=["user", "round"])]
+
+    def __str__(self):
+        return "{} {} {} - {}".format(self.round, self.group or "Pool", self.user or "Total", self.points)
+
+    @classmethod
+    def capture(cls, tournament, round_number=None):
+        """Recapture the snapshots of the tournament's complete rounds.
+
+        The points of every user in every round come from one grouped query over the predictions. The snapshots are
+        then built in memory and saved with one bulk insert.
+
+        Args:
+            tournament (Tournament): Tournament to capture.
+            round_number (int)[None]: Only recapture this round and the rounds after it. By default every round is
+                recaptured.
+
+        Returns:
+            rounds (list): The complete rounds that were captured.
+        """
+        from .leaderboard import set_ranks
+
+        rounds = tournament.rounds.annotate(num_matches=Count("matches"),
+                                            undecided=Count("matches", filter=Q(matches__victor__isnull=True)))
+        if round_number is not None:
+            rounds = rounds.filter(round_number__gte=round_number)
+        rounds = list(rounds.order_by("round_number"))
+        complete = [rnd for rnd in rounds if rnd.num_matches and not rnd.undecided]
+
+        snapshots = []
+        if complete:
+            # Points of each user in each round
+            round_points = collections.defaultdict(dict)
+            rows = UserPrediction.objects.filter(match__round__tournament=tournament) \
+                .values_list("user", "match__round__round_number").order_by() \
+                .annotate(points=Sum(Case(When(guess=F("match__victor"), then=F("match__tournament_value")),
+                                          default=Value(0), output_field=models.IntegerField())))
+            for user_id, number, points in rows:
+                round_points[user_id][number] = points or 0
+
+            user_field = Group.members.field.m2m_reverse_field_name()
+            groups = collections.defaultdict(list)
+            for group_id, user_id in Group.members.through.objects.filter(group__tournament=tournament) \
+                    .values_list("group", user_field):
+                groups[group_id].append(user_id)
+
+            for rnd in complete:
+                points = {user_id: sum(p for number, p in user_points.items() if number <= rnd.round_number)
+                          for user_id, user_points in round_points.items()}
+                snapshots.extend(set_ranks([cls(round=rnd, user_id=user_id, points=p)
+                                            for user_id, p in points.items()], "points"))
+                totals = []
+                for group_id, members in groups.items():
+                    snapshots.extend(set_ranks([cls(round=rnd, group_id=group_id, user_id=user_id,
+                                                    points=points.get(user_id, 0)) for user_id in members], "points"))
+                    totals.append(cls(round=rnd, group_id=group_id, points=sum(points.get(user_id, 0)
+                                                                               for user_id in members)))
+                snapshots.extend(set_ranks(totals, "points"))
+
+        with transaction.atomic():
+            cls.objects.filter(round__in=rounds).delete()
+            cls.objects.bulk_create(snapshots)
+        return complete
+
+
+class SimulationResult(models.Model):
+    """A user's chances from the last pool simulation of a tournament (see the simulate_pool command)."""
+    tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE, related_name="simulation_results")
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name="simulation_results")
+    samples = models.PositiveIntegerField(default=0)
+    win = models.FloatField(default=0, verbose_name="Win Pool")
+    top3 = models.FloatField(default=0, verbose_name="Top 3")
+    group_win = models.FloatField(default=0, verbose_name="Win Group",
+                                  help_text="Best chance to win one of the user's groups.")
+    expected = models.FloatField(default=0, verbose_name="Expected Points")
+    std = models.FloatField(default=0, verbose_name="Points Standard Deviation")
+    updated = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ("user", "tournament")
+        ordering = ("tournament__year", "-win", "-expected")
+
+    def __str__(self):
+        return "{} {} - {:.1%}".format(self.tournament, self.user, self.win)
+
+
+class ScoringRules(models.Model):
+    """Rules for the tournament value of a match. See ScoringTable for how the points are combined.
+
+    A tournament without saved rules uses the default round and seed points.
+    """
+    tournament = models.OneToOneField(Tournament, on_delete=models.CASCADE, related_name="scoring_rules")
+    default_round_points = models.IntegerField(default=1, help_text="Points for rounds without round points.")
+    default_seed_points = models.IntegerField(default=1, help_text="Multiplier for seed pairs without a bonus.")
+    seed_difference_points = models.IntegerField(default=0,
+                                                 help_text="Upset multiplier per seed of difference for seed pairs "
+                                                           "without a bonus. 0 turns this off.")
+
+    class Meta:
+        verbose_name_plural = "scoring rules"
+
+    def __str__(self):
+        return "{} Scoring Rules".format(self.tournament)
+
+    @classmethod
+    def get_or_create_default(cls, tournament):
+        """Return the tournament's rules. If the tournament has no rules save the default rules."""
+        rules, created = cls.objects.get_or_create(tournament=tournament)
+        if created:
+            RoundPoints.objects.bulk_create([RoundPoints(rules=rules, round_number=num, points=points)
+                                             for num, points in DEFAULT_ROUND_POINTS.items()])
+            SeedBonus.objects.bulk_create([SeedBonus(rules=rules, victor_seed=victor, loser_seed=loser, points=points)
+                                           for (victor, loser), points in DEFAULT_SEED_POINTS.items()])
+        return rules
+
+    def get_round_points(self):
+        """Return a dictionary of round number: points."""
+        if self.pk is None:
+            return dict(DEFAULT_ROUND_POINTS)
+        return {item.round_number: item.points for item in self.round_points.all()}
+
+    def get_seed_points(self):
+        """Return a dictionary of (victor seed, loser seed): points."""
+        if self.pk is None:
+            return dict(DEFAULT_SEED_POINTS)
+        return {(item.victor_seed, item.loser_seed): item.points for item in self.seed_bonuses.all()}
+
+    def compile(self):
+        """Return a ScoringTable for these rules."""
+        return ScoringTable(self.get_round_points(), self.get_seed_points(),
+                            default_round_points=self.default_round_points,
+                            default_seed_points=self.default_seed_points,
+                            seed_difference_points=self.seed_difference_points)
+
+
+class RoundPoints(models.Model):
+    rules = models.ForeignKey(ScoringRules, on_delete=models.CASCADE, related_name="round_points")
+    round_number = models.PositiveIntegerField(validators=[validate_round_match_num])
+    points = models.IntegerField(default=1)
+
+    class Meta:
+        unique_together = ("rules", "round_number")
+        ordering = ("round_number",)
+        verbose_name_plural = "round points"
+
+    def __str__(self):
+        return "Round {} = {}".format(self.round_number, self.points)
+
+
+class SeedBonus(models.Model):
+    rules = models.ForeignKey(ScoringRules, on_delete=models.CASCADE, related_name="seed_bonuses")
+    victor_seed = models.PositiveIntegerField()
+    loser_seed = models.PositiveIntegerField()
+    points = models.IntegerField(default=1)
+
+    class Meta:
+        unique_together = ("rules", "victor_seed", "loser_seed")
+        ordering = ("-points", "victor_seed")
+
+    def __str__(self):
+        return "{} v {} = {}".format(self.victor_seed, self.loser_seed, self.points)
@@ -0,0 +1,74 @@
+from array import array
+
+
+# Round number: points for a correct pick
+DEFAULT_ROUND_POINTS = {
+    1: 2,
+    2: 2,
+    3: 4,
+    4: 6,
+    5: 8,
+    6: 10
+}
+
+# (Victor seed, loser seed): multiplier for the round points
+DEFAULT_SEED_POINTS = {
+    (16, 1): 8,
+    (15, 2): 7,
+    (14, 3): 6,
+    (13, 4): 5,
+    (12, 1): 5,
+    (12, 5): 4,
+    (11, 6): 3,
+    (10, 7): 2,
+    (9, 8): 1,
+}
+
+
+class ScoringTable(object):
+    """Match values compiled into a dense array indexed by (round number, victor seed, loser seed).
+
+    The value of a match is the round points times the seed points. The seed points come from the seed pair bonus if
+    one is given. Otherwise an upset (the victor has the larger seed number) is worth the seed difference times
+    ``seed_difference_points`` when that is larger than ``default_seed_points``.
+
+    Args:
+        round_points (dict): Round number: points dictionary.
+        seed_points (dict): (Victor seed, loser seed): points dictionary.
+        default_round_points (int)[1]: Points for rounds that are not in round_points.
+        default_seed_points (int)[1]: Seed points for seed pairs that are not in seed_points.
+        seed_difference_points (int)[0]: Seed points per seed of difference for upsets. 0 turns this off.
+        max_seed (int)[16]: Largest seed to put in the table. Larger seeds are calculated when they are looked up.
+    """
+    def __init__(self, round_points, seed_points, default_round_points=1, default_seed_points=1,
+                 seed_difference_points=0, max_seed=16):
+        self.round_points = round_points
+        self.seed_points = seed_points
+        self.default_round_points = default_round_points
+        self.default_seed_points = default_seed_points
+        self.seed_difference_points = seed_difference_points
+
+        self.num_rounds = max([0] + list(round_points)) + 1
+        self.num_seeds = max([max_seed] + [max(pair) for pair in seed_points]) + 1
+        self.values = array('i', (self.calculate(rnd, victor, loser)
+                                  for rnd in range(self.num_rounds)
+                                  for victor in range(self.num_seeds)
+                                  for loser in range(self.num_seeds)))
+
+    def calculate(self, round_number, victor_seed, loser_seed):
+        """Calculate the match value without the lookup table."""
+        round_value = self.round_points.get(round_number, self.default_round_points)
+        try:
+            seed_value = self.seed_points[(victor_seed, loser_seed)]
+        except KeyError:
+            seed_value = self.default_seed_points
+            if self.seed_difference_points and victor_seed > loser_seed:
+                seed_value = max(seed_value, (victor_seed - loser_seed) * self.seed_difference_points)
+        return round_value * seed_value
+
+    def get_value(self, round_number, victor_seed, loser_seed):
+        """Return the value of a match from the lookup table."""
+        if 0 <= round_number < self.num_rounds and 0 <= victor_seed < self.num_seeds and \
+                0 <= loser_seed < self.num_seeds:
+            return self.values[(round_number * self.num_seeds + victor_seed) * self.num_seeds + loser_seed]
+        return self.calculate(round_number, victor_seed, loser_seed)
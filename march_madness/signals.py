@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+
+# Sent once for a batch of match results after the victors were moved into the next round.
+# Arguments: tournament, matches (the matches with new results), advanced (the child matches that changed)
+results_changed = Signal()
@@ -0,0 +1,257 @@
+"""Monte Carlo simulation of the undecided matches in a tournament.
+
+Every sample plays out the rest of the bracket. Each user's bracket is scored against all of the samples at once with
+numpy array operations. The samples are split into chunks that can run in a process pool.
+
+Note:
+    Requires numpy (``pip install numpy``).
+
+    The worker processes run ``django.setup()`` before their first task, so the pool works with the "spawn" start
+    method (Windows and macOS) as well as "fork".
+
+Settings:
+    MARCH_MADNESS_SIMULATION_MEMORY (int)[268435456]: Approximate bytes of sample arrays for each chunk. The default
+        chunk size is found from this and the number of users.
+"""
+import math
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import django
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .models import Group, TeamRank, UserPrediction, SimulationResult
+
+
+DEFAULT_SEED = 8
+CHUNK_MEMORY = getattr(settings, "MARCH_MADNESS_SIMULATION_MEMORY", 256 * 2 ** 20)
+
+# Bytes of the user by sample arrays in simulate_chunk for each user and sample: the int32 scores, match points and
+# partitioned scores and a reused bool array.
+BYTES_PER_USER_SAMPLE = 14
+MAX_CHUNK_SIZE = 10000
+MIN_CHUNK_SIZE = 100
+
+
+def get_chunk_size(num_users, memory=None):
+    """Return the number of samples per chunk that keeps a chunk's arrays for num_users within memory bytes."""
+    if memory is None:
+        memory = CHUNK_MEMORY
+    size = memory // (max(num_users, 1) * BYTES_PER_USER_SAMPLE)
+    return int(min(max(size, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE))
+
+
+def get_results(tournament):
+    """Return the SimulationResults of the last simulation of the tournament, best chance to win first."""
+    return SimulationResult.objects.filter(tournament=tournament).select_related('user').order_by('-win', '-expected')
+
+
+def save_results(tournament, results):
+    """Replace the tournament's SimulationResults with the results of PoolSimulation.run."""
+    rows = [SimulationResult(tournament=tournament, user_id=user_id, samples=results['samples'],
+                             win=user['win'], top3=user['top3'], expected=user['expected'], std=user['std'],
+                             group_win=max(user['groups'].values(), default=0), updated=results['updated'])
+            for user_id, user in results['users'].items()]
+    with transaction.atomic():
+        SimulationResult.objects.filter(tournament=tournament).delete()
+        SimulationResult.objects.bulk_create(rows)
+    return rows
+
+
+class PoolSimulation(object):
+    """Arrays describing a tournament's bracket, scoring and every user's picks for the simulation.
+
+    Match win probabilities come from ``Match.team1_probability`` when it is set. Otherwise the team with seed ``a``
+    beats the team with seed ``b`` with probability ``b / (a + b)``.
+
+    Args:
+        tournament (Tournament): Tournament to simulate.
+    """
+    def __init__(self, tournament):
+        if np is None:
+            raise ImportError('The pool simulation requires numpy. Install it with "pip install numpy".')
+
+        self.tournament = tournament
+        bracket = tournament.get_bracket()
+        matches = list(bracket)
+        match_index = {match.pk: i for i, match in enumerate(matches)}
+        teams = bracket.get_teams()
+        team_index = {team.pk: i for i, team in enumerate(teams)}
+        table = tournament.get_scoring_table()
+
+        num_matches = len(matches)
+        seeds = TeamRank.get_seeds(tournament.year)
+        self.team_seeds = np.array([min(max(seeds.get(team.pk, DEFAULT_SEED), 1), table.num_seeds - 1)
+                                    for team in teams], dtype=np.int32)
+        self.slots = np.full((num_matches, 2), -1, dtype=np.int32)
+        self.parents = np.full((num_matches, 2), -1, dtype=np.int32)
+        self.victors = np.full(num_matches, -1, dtype=np.int32)
+        self.values = np.array([match.tournament_value for match in matches], dtype=np.int32)
+        self.probabilities = np.full(num_matches, np.nan)
+
+        # Match value for each (victor seed, loser seed) of the match's round
+        grids = {}
+        for match in matches:
+            round_number = match.round.round_number
+            if round_number not in grids:
+                grids[round_number] = [[table.get_value(round_number, victor, loser)
+                                        for loser in range(table.num_seeds)] for victor in range(table.num_seeds)]
+        self.value_grids = np.array([grids[match.round.round_number] for match in matches], dtype=np.int32)
+
+        for i, match in enumerate(matches):
+            for j, (team, parent) in enumerate(zip((match.team1, match.team2), bracket.parent_matches(match))):
+                if team is not None:
+                    self.slots[i, j] = team_index[team.pk]
+                elif parent is not None:
+                    self.parents[i, j] = match_index[parent.pk]
+                elif match.victor_id is None:
+                    raise ValueError('{} is missing a team'.format(match))
+            if match.victor_id is not None:
+                self.victors[i] = team_index[match.victor_id]
+            if match.team1_probability is not None:
+                self.probabilities[i] = match.team1_probability
+
+        # Picks
+        predictions = UserPrediction.objects.filter(match__round__tournament=tournament)
+        predictions = list(predictions.values_list('user', 'match', 'guess'))
+        self.user_ids = sorted({user_id for user_id, _, _ in predictions})
+        user_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        self.picks = np.full((len(self.user_ids), num_matches), -1, dtype=np.int32)
+        for user_id, match_id, guess_id in predictions:
+            self.picks[user_index[user_id], match_index[match_id]] = team_index.get(guess_id, -1)
+
+        # Groups
+        user_field = Group.members.field.m2m_reverse_field_name()
+        members = {}
+        for group_id, user_id in Group.members.through.objects.filter(group__tournament=tournament) \
+                .values_list('group', user_field):
+            if user_id in user_index:
+                members.setdefault(group_id, []).append(user_index[user_id])
+        self.group_ids = sorted(members)
+        self.groups = [np.array(members[group_id], dtype=np.int64) for group_id in self.group_ids]
+
+    def get_data(self):
+        """Return the arrays that a worker process needs."""
+        return {'team_seeds': self.team_seeds, 'slots': self.slots, 'parents': self.parents, 'victors': self.victors,
+                'values': self.values, 'probabilities': self.probabilities, 'value_grids': self.value_grids,
+                'picks': self.picks, 'groups': self.groups}
+
+    def run(self, num_samples, chunk_size=None, workers=None, seed=None):
+        """Simulate the tournament and return the results.
+
+        Args:
+            num_samples (int): Number of tournament completions to sample.
+            chunk_size (int)[None]: Number of samples for each worker task. By default it is found from the number of
+                users and MARCH_MADNESS_SIMULATION_MEMORY (see get_chunk_size).
+            workers (int)[None]: Number of worker processes. None uses every CPU. 1 runs in this process.
+            seed (int)[None]: Random seed.
+
+        Returns:
+            results (dict): {"samples": int, "updated": datetime, "users": {user id: {"win", "top3", "expected",
+                "std", "groups": {group id: win probability}}}}
+        """
+        if chunk_size is None:
+            chunk_size = get_chunk_size(len(self.user_ids))
+        sizes = [chunk_size] * (num_samples // chunk_size)
+        if num_samples % chunk_size:
+            sizes.append(num_samples % chunk_size)
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        data = self.get_data()
+
+        if workers == 1:
+            chunks = [simulate_chunk(data, chunk_seed, size) for chunk_seed, size in zip(seeds, sizes)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+                chunks = list(executor.map(simulate_chunk, repeat(data), seeds, sizes))
+
+        num_users = len(self.user_ids)
+        totals = {key: np.zeros(num_users) for key in ('win', 'top3', 'total', 'total_sq')}
+        group_wins = [np.zeros(len(members)) for members in self.groups]
+        for chunk in chunks:
+            for key in totals:
+                totals[key] += chunk[key]
+            for i, wins in enumerate(chunk['groups']):
+                group_wins[i] += wins
+
+        users = {}
+        for i, user_id in enumerate(self.user_ids):
+            expected = float(totals['total'][i] / num_samples)
+            users[user_id] = {'win': float(totals['win'][i] / num_samples),
+                              'top3': float(totals['top3'][i] / num_samples),
+                              'expected': expected,
+                              'std': math.sqrt(max(float(totals['total_sq'][i] / num_samples) - expected ** 2, 0)),
+                              'groups': {}}
+        for group_id, members, wins in zip(self.group_ids, self.groups, group_wins):
+            for user_i, win in zip(members, wins):
+                users[self.user_ids[user_i]]['groups'][group_id] = float(win / num_samples)
+
+        return {'tournament': self.tournament.pk, 'samples': num_samples, 'updated': timezone.now(), 'users': users}
+
+
+def simulate_chunk(data, seed, num_samples):
+    """Play out the undecided matches num_samples times and score every user's picks against each sample.
+
+    The user by sample arrays are int32 and bool and are reused for every match, so a chunk needs about
+    BYTES_PER_USER_SAMPLE bytes for each user and sample.
+
+    Returns:
+        results (dict): Per user sums over the samples: "win" (ties split), "top3", "total" and "total_sq" points, and
+            "groups", a list of per member win sums for each group.
+    """
+    rng = np.random.default_rng(seed)
+    team_seeds, slots, parents, victors = data['team_seeds'], data['slots'], data['parents'], data['victors']
+    picks = data['picks']
+
+    num_matches = len(victors)
+    winners = np.empty((num_matches, num_samples), dtype=np.int32)
+    scores = np.zeros((len(picks), num_samples), dtype=np.int32)
+    hits = np.empty(scores.shape, dtype=bool)
+    points = np.empty(scores.shape, dtype=np.int32)
+    for i in range(num_matches):
+        if victors[i] >= 0:
+            winners[i] = victors[i]
+            value = data['values'][i]
+        else:
+            team1, team2 = [np.full(num_samples, slots[i, j], dtype=np.int32) if slots[i, j] >= 0
+                            else winners[parents[i, j]] for j in range(2)]
+            seed1, seed2 = team_seeds[team1], team_seeds[team2]
+            probability = data['probabilities'][i]
+            if np.isnan(probability):
+                probability = seed2 / (seed1 + seed2)
+            team1_won = rng.random(num_samples) < probability
+            winners[i] = np.where(team1_won, team1, team2)
+            value = data['value_grids'][i][np.where(team1_won, seed1, seed2), np.where(team1_won, seed2, seed1)]
+        np.equal(picks[:, i:i + 1], winners[i], out=hits)
+        np.multiply(hits, value, out=points)
+        scores += points
+    del points
+
+    results = {'total': scores.sum(axis=1, dtype=np.float64),
+               'total_sq': np.einsum('ij,ij->i', scores, scores, dtype=np.float64),
+               'win': np.zeros(len(picks)), 'top3': np.zeros(len(picks)), 'groups': []}
+    if len(picks):
+        results['win'] = _win_shares(scores, hits)
+        place = max(len(picks) - 3, 0)
+        third = np.partition(scores, place, axis=0)[place]
+        np.greater_equal(scores, third, out=hits)
+        results['top3'] = hits.sum(axis=1, dtype=np.float64)
+    results['groups'] = [_win_shares(scores[members]) for members in data['groups']]
+    return results
+
+
+def _win_shares(scores, out=None):
+    """Return the number of samples each row won. Ties split the win.
+
+    Args:
+        scores (np.ndarray): Row by sample scores.
+        out (np.ndarray)[None]: Bool array with the shape of scores to reuse.
+    """
+    is_top = np.equal(scores, scores.max(axis=0), out=out)
+    shares = np.float32(1) / is_top.sum(axis=0, dtype=np.float32)
+    return np.einsum('ij,j->i', is_top, shares, dtype=np.float64)
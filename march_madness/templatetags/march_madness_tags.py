@@ -1,13 +1,62 @@
+import hashlib
 from django import template
+from django.conf import settings
+from django.utils.safestring import mark_safe
+
+from ..caches import get_or_set, get_versions
 from ..forms import UserPredictionForm
-from ..models import UserPrediction
+from ..models import UserPrediction, TeamRank, Match
 
 register = template.Library()
 
 
-@register.inclusion_tag("march_madness/includes/match.html")
-def render_match(match):
-    return {"match": match}
+MATCH_CARD_TIMEOUT = getattr(settings, "MARCH_MADNESS_MATCH_CARD_TIMEOUT", 60 * 60 * 24)
+
+
+def get_card_versions(context):
+    """Return the cache versions the match cards use. They are read once for each page render."""
+    versions = context.render_context.get("match_card_versions", None)
+    if versions is None:
+        versions = context.render_context["match_card_versions"] = get_versions("seeds", "teams", "match_card")
+    return versions
+
+
+def get_match_card_version(match, versions):
+    """Return a digest of everything the match card shows for a match (not a form).
+
+    Args:
+        match (Match): Match with the user's guesses attached.
+        versions (dict): Cache versions from get_card_versions.
+    """
+    guesses = [getattr(match, attr, None) for attr in ("user_guess", "parent_team1_guess", "parent_team2_guess")]
+    state = (match.round_id, match.date, match.team1_id, match.team2_id, match.team1_score, match.team2_score,
+             match.victor_id, [(guess.pk, guess.guess_id) if guess else None for guess in guesses],
+             versions["seeds"], versions["teams"])
+    return hashlib.md5(repr(state).encode("utf-8")).hexdigest()
+
+
+@register.simple_tag(takes_context=True)
+def render_match(context, match):
+    """Render the match card for a match or prediction form.
+
+    Cards for matches are cached by match, user and a version that changes when the match, the user's prediction or
+    the seeds change. Forms are always rendered.
+    """
+    tmpl = context.template.engine.get_template("march_madness/includes/match.html")
+    new_context = context.new({"match": match})
+    csrf_token = context.get("csrf_token", None)
+    if csrf_token is not None:
+        new_context["csrf_token"] = csrf_token
+
+    if not isinstance(match, Match):
+        return tmpl.render(new_context)
+
+    user_guess = getattr(match, "user_guess", None)
+    user_id = getattr(user_guess, "user_id", 0)
+    versions = get_card_versions(context)
+    html = get_or_set("match_card", [match.pk, user_id, get_match_card_version(match, versions)],
+                      lambda: tmpl.render(new_context), MATCH_CARD_TIMEOUT, version=versions["match_card"])
+    return mark_safe(html)
 
 
 @register.inclusion_tag("march_madness/includes/match_form_ajax_func.html")
@@ -33,7 +82,7 @@ def team_rank(team, tournament=None):
     except:
         pass
     try:
-        return team.rankings.get(year=tournament.year).seed
+        return TeamRank.get_seeds(tournament.year).get(team.pk, None)
     except:
         return None
 
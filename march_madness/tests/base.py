@@ -0,0 +1,97 @@
+import os
+import random
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ..benchmarks import make_picks
+from ..bracket import BracketIndex
+from ..models import Tournament, Match, Group, UserPrediction, UserScore, ScoringRules
+from ..utils import load_csv
+
+
+BRACKET_CSV = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'fixtures', 'Bracket2019.csv')
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'march_madness'}}
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class TournamentTestCase(TestCase):
+    """Tournament from the 2019 fixture with six users in two groups and a random full bracket for each user."""
+    seed = 2019
+
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        cls.tournament = Tournament.objects.create(name='March Madness', year=2019)
+        load_csv(BRACKET_CSV)
+        ScoringRules.get_or_create_default(cls.tournament)
+
+        User = get_user_model()
+        cls.users = [User.objects.create_user('user{}'.format(i)) for i in range(6)]
+        group1 = Group.objects.create(tournament=cls.tournament, name='Group 1', captain=cls.users[0])
+        group1.members.set(cls.users[:4])
+        group2 = Group.objects.create(tournament=cls.tournament, name='Group 2', captain=cls.users[3])
+        group2.members.set(cls.users[3:])
+
+        rng = random.Random(cls.seed)
+        bracket = cls.tournament.get_bracket()
+        UserPrediction.objects.bulk_create([UserPrediction(user=user, match_id=match_id, guess=team)
+                                            for user in cls.users
+                                            for match_id, team in make_picks(bracket, rng).items()])
+        UserScore.rebuild(cls.tournament)
+
+    def setUp(self):
+        cache.clear()
+        self.tournament = Tournament.objects.get(pk=self.tournament.pk)
+        self.rng = random.Random(self.seed)
+
+    def get_bracket(self):
+        return BracketIndex(self.tournament)
+
+    def decide(self, matches):
+        """Set a random victor for each match with Match.save."""
+        for match in matches:
+            match = Match.objects.get(pk=match.pk)
+            match.victor_id = self.rng.choice((match.team1_id, match.team2_id))
+            match.save()
+
+    def get_open_matches(self):
+        return [match for match in self.get_bracket()
+                if match.victor_id is None and match.team1_id is not None and match.team2_id is not None]
+
+    def expected_scores(self, users=()):
+        """Return user id: (points, correct, max points, eliminated) recalculated without the stored scores.
+
+        Args:
+            users (list)[()]: Ids of users without predictions to include.
+        """
+        victors = dict(Match.objects.filter(round__tournament=self.tournament).values_list('pk', 'victor'))
+        values = dict(Match.objects.filter(round__tournament=self.tournament).values_list('pk', 'tournament_value'))
+        remaining = Tournament.objects.get(pk=self.tournament.pk).get_remaining_values(self.get_bracket())
+        scores = {user_id: (0, 0) for user_id in users}
+        max_points = {}
+        for user_id, match_id, guess_id in UserPrediction.objects.filter(match__round__tournament=self.tournament) \
+                .values_list('user', 'match', 'guess'):
+            points, correct = scores.get(user_id, (0, 0))
+            if victors[match_id] == guess_id:
+                points, correct = points + values[match_id], correct + 1
+                max_points[user_id] = max_points.get(user_id, 0) + values[match_id]
+            elif victors[match_id] is None:
+                max_points[user_id] = max_points.get(user_id, 0) + remaining.get((match_id, guess_id), 0)
+            scores[user_id] = (points, correct)
+
+        can_win = {}
+        for group in Group.objects.filter(tournament=self.tournament):
+            members = [user.pk for user in group.members.all()]
+            leader = max(scores.get(user_id, (0, 0))[0] for user_id in members)
+            for user_id in members:
+                can_win[user_id] = can_win.get(user_id, False) or max_points.get(user_id, 0) >= leader
+
+        return {user_id: (points, correct, max_points.get(user_id, 0), not can_win.get(user_id, True))
+                for user_id, (points, correct) in scores.items()}
+
+    def assertScoresConsistent(self):
+        stored = {score.user_id: (score.points, score.correct, score.max_points, score.eliminated)
+                  for score in UserScore.objects.filter(tournament=self.tournament)}
+        self.assertEqual(stored, self.expected_scores(stored))
@@ -0,0 +1,60 @@
+from django.urls import reverse
+
+from ..caches import clear_picks
+from ..models import Match, UserPrediction
+from .base import TournamentTestCase
+
+
+class BracketJsonTests(TournamentTestCase):
+    def get(self, url, etag=None):
+        if etag is None:
+            return self.client.get(url)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def assertNotModified(self, url):
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        return etag
+
+    def test_bracket_etag(self):
+        url = reverse('march_madness:bracket_json')
+        etag = self.assertNotModified(url)
+        data = self.get(url).json()
+        self.assertEqual(len(data['matches']), 63)
+
+        # A new result changes the ETag
+        match = Match.objects.get(pk=self.get_open_matches()[0].pk)
+        match.victor_id = match.team1_id
+        match.save()
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        row = next(row for row in response.json()['matches'] if row[0] == match.pk)
+        self.assertEqual(row[5], match.victor_id)
+
+    def test_picks_etag(self):
+        user = self.users[0]
+        url = reverse('march_madness:picks_json', args=[user.username])
+        etag = self.assertNotModified(url)
+        other_etag = self.assertNotModified(reverse('march_madness:picks_json', args=[self.users[1].username]))
+
+        # Changing a pick only changes that user's ETag
+        pred = UserPrediction.objects.filter(user=user).select_related('match').first()
+        pred.guess_id = pred.match.team2_id if pred.guess_id == pred.match.team1_id else pred.match.team1_id
+        pred.save()
+        response = self.get(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn([pred.match_id, pred.guess_id, None, None], response.json()['picks'])
+        self.assertEqual(self.get(reverse('march_madness:picks_json', args=[self.users[1].username]),
+                                  other_etag).status_code, 304)
+
+        # Clearing the tournament's picks changes every user's ETag
+        etag = self.assertNotModified(url)
+        clear_picks(tournament=self.tournament)
+        self.assertEqual(self.get(url, etag).status_code, 200)
+        self.assertEqual(self.get(reverse('march_madness:picks_json', args=[self.users[1].username]),
+                                  other_etag).status_code, 200)
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ..archive import export_tournament, import_tournament, delete_tournament
+from ..caches import get_version
+from ..models import Tournament, Match, Group, UserPrediction, UserScore
+from .base import TournamentTestCase
+
+
+class ArchiveTests(TournamentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'tournament.zip')
+        self.decide(self.get_open_matches()[:10])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_state(self, tournament):
+        """Return the tournament's matches, picks, groups and scores without the primary keys."""
+        matches = sorted(Match.objects.filter(round__tournament=tournament).values_list(
+            'round__round_number', 'match_number', 'team1', 'team2', 'victor', 'tournament_value'))
+        picks = sorted(UserPrediction.objects.filter(match__round__tournament=tournament).values_list(
+            'user', 'match__round__round_number', 'match__match_number', 'guess'))
+        groups = sorted((group.name, group.captain_id, tuple(sorted(user.pk for user in group.members.all())))
+                        for group in Group.objects.filter(tournament=tournament))
+        scores = sorted(UserScore.objects.filter(tournament=tournament).values_list(
+            'user', 'points', 'correct', 'max_points', 'eliminated'))
+        return matches, picks, groups, scores
+
+    def test_round_trip(self):
+        meta = export_tournament(self.tournament, self.filename)
+        self.assertEqual((meta['matches'], meta['users']), (63, 6))
+
+        copy = import_tournament(self.filename, year=2018)
+        self.assertEqual((copy.name, copy.year), (self.tournament.name, 2018))
+        self.assertEqual(self.get_state(copy), self.get_state(self.tournament))
+
+    def test_existing_year(self):
+        export_tournament(self.tournament, self.filename)
+        with self.assertRaises(ValueError):
+            import_tournament(self.filename)
+
+    def test_replace(self):
+        state = self.get_state(self.tournament)
+        export_tournament(self.tournament, self.filename)
+        name = 'picks:tournament:{}'.format(self.tournament.pk)
+        version = get_version(name)
+
+        tournament = import_tournament(self.filename, replace=True)
+        self.assertFalse(Tournament.objects.filter(pk=self.tournament.pk).exists())
+        self.assertEqual(self.get_state(tournament), state)
+
+        # The deleted tournament's cached picks are cleared with one version change
+        self.assertGreater(get_version(name), version)
+
+    def test_delete(self):
+        num_picks = UserPrediction.objects.filter(match__round__tournament=self.tournament).count()
+        self.assertGreater(num_picks, 100)
+        name = 'picks:tournament:{}'.format(self.tournament.pk)
+        version = get_version(name)
+        with CaptureQueriesContext(connection) as queries:
+            delete_tournament(self.tournament)
+        self.assertLess(len(queries), 40)
+        self.assertGreater(get_version(name), version)
+        self.assertFalse(UserPrediction.objects.exists())
+        self.assertFalse(UserScore.objects.exists())
+        self.assertFalse(Tournament.objects.exists())
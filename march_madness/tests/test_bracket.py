@@ -0,0 +1,89 @@
+from ..models import Match
+from ..utils import save_results, load_results
+from .base import TournamentTestCase
+
+
+class BracketTests(TournamentTestCase):
+    def get_child_slot(self, match):
+        bracket = self.get_bracket()
+        child = bracket.child_match(bracket.matches[match.pk])
+        return getattr(Match.objects.get(pk=child.pk), bracket.get_slot(match) + '_id')
+
+    def test_advance(self):
+        bracket = self.get_bracket()
+        match = Match.objects.get(pk=bracket.get_match(1, 3).pk)
+        child_id = bracket.get_match(2, 2).pk
+
+        match.victor_id = match.team1_id
+        match.save()
+        self.assertEqual(Match.objects.get(pk=child_id).team1_id, match.team1_id)
+
+        match.victor_id = match.team2_id
+        match.save()
+        self.assertEqual(Match.objects.get(pk=child_id).team1_id, match.team2_id)
+
+    def test_clear_victor(self):
+        match = Match.objects.get(pk=self.get_bracket().get_match(1, 4).pk)
+        match.victor_id = match.team1_id
+        match.save()
+        self.assertEqual(self.get_child_slot(match), match.team1_id)
+
+        match.victor = None
+        match.save()
+        self.assertIsNone(self.get_child_slot(match))
+
+    def test_change_victor(self):
+        # Decide a path through three rounds
+        bracket = self.get_bracket()
+        path = [bracket.get_match(1, 1), bracket.get_match(2, 1), bracket.get_match(3, 1)]
+        for match in path:
+            match = Match.objects.get(pk=match.pk)
+            match.victor_id = match.team1_id
+            match.save()
+        first = Match.objects.get(pk=path[0].pk)
+        winner_id, loser_id = first.team1_id, first.team2_id
+        self.assertEqual(Match.objects.get(pk=path[2].pk).team1_id, winner_id)
+
+        # Correct the first result. The later matches keep their victor, but it no longer plays in them.
+        first.victor_id = loser_id
+        invalid = save_results(self.tournament, [first])
+        self.assertEqual([match.pk for match in invalid], [path[1].pk])
+        second = Match.objects.get(pk=path[1].pk)
+        self.assertEqual((second.team1_id, second.victor_id), (loser_id, winner_id))
+        self.assertEqual(Match.objects.get(pk=path[2].pk).team1_id, winner_id)
+
+        # Fixing the second result recalculates the rest of the subtree
+        second.victor_id = loser_id
+        self.assertEqual([match.pk for match in save_results(self.tournament, [second])], [path[2].pk])
+        self.assertEqual(Match.objects.get(pk=path[2].pk).team1_id, loser_id)
+        self.assertScoresConsistent()
+
+    def test_load_results_reports_invalid(self):
+        bracket = self.get_bracket()
+        for num in (1, 2):
+            match = Match.objects.get(pk=bracket.get_match(1, num).pk)
+            match.victor_id = match.team1_id
+            match.save()
+        second = Match.objects.get(pk=bracket.get_match(2, 1).pk)
+        second.victor_id = second.team1_id
+        second.save()
+
+        content = 'March Madness 2019\n\nRound, Match, Victor\n1, 1, 2\n'
+        report = load_results('results.csv', content=content)
+        self.assertEqual(report[-1], 'Invalid {} victor {} no longer plays in the match'.format(second, second.victor))
+
+    def test_team_choices(self):
+        bracket = self.get_bracket()
+        first, other = bracket.get_match(1, 1), bracket.get_match(1, 32)
+        child = bracket.child_match(first)
+
+        choices = bracket.get_team_choices({first.pk: first.team1_id})
+        self.assertIn(first.team1_id, [team.pk for team in choices[child.pk]])
+        self.assertNotIn(first.team2_id, [team.pk for team in choices[child.pk]])
+
+        # A parent guess that is not one of the parent's teams is ignored
+        choices = bracket.get_team_choices({first.pk: other.team1_id})
+        child_choices = [team.pk for team in choices[child.pk]]
+        self.assertNotIn(other.team1_id, child_choices)
+        self.assertIn(first.team2_id, child_choices)
+
@@ -0,0 +1,35 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TransactionTestCase, override_settings
+
+from ..caches import get_version, bump_version, get_or_set
+from .base import LOCAL_CACHE
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class CacheVersionTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bump_version(self):
+        self.assertEqual(get_or_set('test', ['a'], lambda: 1), 1)
+        bump_version('test')
+        self.assertEqual(get_or_set('test', ['a'], lambda: 2), 2)
+
+    def test_bump_after_commit(self):
+        version = get_version('test')
+        with transaction.atomic():
+            bump_version('test')
+            self.assertEqual(get_version('test'), version + 1)
+
+            # Another process caches the old rows under the new version before the commit
+            get_or_set('test', ['a'], lambda: 'old')
+        self.assertEqual(get_version('test'), version + 2)
+        self.assertEqual(get_or_set('test', ['a'], lambda: 'new'), 'new')
+
+    def test_rollback(self):
+        version = get_version('test')
+        with transaction.atomic():
+            bump_version('test')
+            transaction.set_rollback(True)
+        self.assertEqual(get_version('test'), version + 1)
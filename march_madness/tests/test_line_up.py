@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+from django.test import TestCase, override_settings
+
+from ..benchmarks import write_csv
+from ..models import Tournament, Round, Match
+from ..utils import load_csv, line_up_matches
+from .base import LOCAL_CACHE
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class LineUpMatchesTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def load(self, year, num_teams):
+        tournament = Tournament.objects.create(name='March Madness', year=year)
+        filename = os.path.join(self.tmpdir, '{}.csv'.format(year))
+        write_csv(filename, tournament.name, year, num_teams=num_teams)
+        load_csv(filename)
+        return tournament
+
+    def get_shape(self, tournament):
+        return [(rnd.round_number, rnd.matches.count()) for rnd in tournament.rounds.order_by('round_number')]
+
+    def test_64_teams(self):
+        tournament = self.load(2019, 64)
+        self.assertEqual(self.get_shape(tournament), [(1, 32), (2, 16), (3, 8), (4, 4), (5, 2), (6, 1)])
+
+    def test_68_teams(self):
+        tournament = self.load(2020, 68)
+        self.assertEqual(self.get_shape(tournament), [(1, 4), (2, 32), (3, 16), (4, 8), (5, 4), (6, 2), (7, 1)])
+
+    def test_idempotent(self):
+        tournament = self.load(2020, 68)
+        num_rounds, num_matches = Round.objects.count(), Match.objects.count()
+
+        with self.assertNumQueries(2):
+            self.assertEqual(line_up_matches(tournament), [])
+        self.assertEqual(Round.objects.count(), num_rounds)
+        self.assertEqual(Match.objects.count(), num_matches)
+
+    def test_missing_matches(self):
+        tournament = self.load(2020, 68)
+        Match.objects.filter(round__tournament=tournament, round__round_number=4, match_number__gt=5).delete()
+        Match.objects.filter(round__tournament=tournament, round__round_number=7).delete()
+        Round.objects.filter(tournament=tournament, round_number=7).delete()
+
+        report = line_up_matches(tournament)
+        self.assertEqual(report, ['Created round Round 7', 'Created 3 matches in Round 4',
+                                  'Created 1 matches in Round 7'])
+        self.assertEqual(self.get_shape(tournament), [(1, 4), (2, 32), (3, 16), (4, 8), (5, 4), (6, 2), (7, 1)])
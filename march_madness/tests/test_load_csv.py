@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+from django.test import TestCase, override_settings
+
+from ..models import Tournament, Round, Match, Team, TeamRank
+from ..utils import load_csv
+from .base import BRACKET_CSV, LOCAL_CACHE
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class LoadCsvTests(TestCase):
+    def setUp(self):
+        self.tournament = Tournament.objects.create(name='March Madness', year=2019)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assertNothingSaved(self):
+        self.assertFalse(Round.objects.filter(tournament=self.tournament).exists())
+        self.assertFalse(Match.objects.exists())
+        self.assertFalse(Team.objects.exists())
+        self.assertFalse(TeamRank.objects.exists())
+
+    def test_load(self):
+        report = load_csv(BRACKET_CSV)
+        self.assertTrue(report)
+        self.assertEqual(Match.objects.filter(round__tournament=self.tournament).count(), 63)
+        self.assertEqual(Team.objects.count(), 64)
+
+        # Loading the same file again changes nothing
+        self.assertEqual(load_csv(BRACKET_CSV), [])
+
+    def test_dry_run(self):
+        report = load_csv(BRACKET_CSV, dry_run=True)
+        self.assertEqual(report, load_csv(BRACKET_CSV, dry_run=True))
+        self.assertIn('Created team Duke Blue Devils', report)
+        self.assertNothingSaved()
+
+    def test_bad_row(self):
+        filename = os.path.join(self.tmpdir, 'bad.csv')
+        with open(BRACKET_CSV) as f:
+            lines = f.read().splitlines()
+        lines.insert(10, '2019,one,1,Bad Team,1,,,1')
+        with open(filename, 'w') as f:
+            f.write('\n'.join(lines))
+
+        with self.assertRaises(ValueError):
+            load_csv(filename)
+        self.assertNothingSaved()
+
+    def test_rollback(self):
+        with mock.patch('march_madness.utils.line_up_matches', side_effect=RuntimeError('failed')):
+            with self.assertRaises(RuntimeError):
+                load_csv(BRACKET_CSV)
+        self.assertNothingSaved()
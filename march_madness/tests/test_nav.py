@@ -0,0 +1,37 @@
+from ..models import Tournament, Round
+from ..views import get_nav_entries
+from .base import TournamentTestCase
+
+
+class NavEntriesTests(TournamentTestCase):
+    def get_labels(self):
+        return [label for url, label, app in get_nav_entries(self.tournament)]
+
+    def test_cached(self):
+        labels = self.get_labels()
+        self.assertIn(str(Round.objects.filter(tournament=self.tournament).first()), labels)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_labels(), labels)
+
+    def test_invalidated(self):
+        self.get_labels()
+
+        # A new tournament and a renamed round show up
+        other = Tournament.objects.create(name='March Madness', year=2018)
+        self.assertIn(str(other), self.get_labels())
+
+        rnd = Round.objects.get(tournament=self.tournament, round_number=6)
+        rnd.name = 'Championship'
+        rnd.save()
+        self.assertIn(str(rnd), self.get_labels())
+
+        other.delete()
+        self.assertNotIn(str(other), self.get_labels())
+
+    def test_user_entry(self):
+        self.client.force_login(self.users[0])
+        response = self.client.get('/')
+        self.assertContains(response, 'My Bracket')
+        self.client.force_login(self.users[1])
+        response = self.client.get('/')
+        self.assertContains(response, '/bracket/{}/'.format(self.users[1].username))
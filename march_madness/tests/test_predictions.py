@@ -0,0 +1,56 @@
+import json
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from ..models import Team, UserPrediction
+from .base import TournamentTestCase
+
+
+class BatchPredictionTests(TournamentTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user('batch')
+        self.client.force_login(self.user)
+        self.bracket = self.get_bracket()
+
+    def post(self, data):
+        return self.client.post(reverse('march_madness:batch_predictions'), json.dumps(data),
+                                content_type='application/json')
+
+    def get_picks(self):
+        return dict(UserPrediction.objects.filter(user=self.user).values_list('match', 'guess'))
+
+    def test_invalid_json(self):
+        for data in ({'picks': 5}, {'user': 'abc', 'picks': []}, [1]):
+            self.assertEqual(self.post(data).status_code, 400)
+
+    def test_rejected_pick_is_not_followed(self):
+        first = self.bracket.get_match(1, 1)
+        child = self.bracket.child_match(first)
+        kentucky = Team.objects.get(name='Kentucky Wildcats').pk
+
+        response = self.post({'picks': [[first.pk, kentucky], [child.pk, kentucky],
+                                        [self.bracket.get_match(4, 1).pk, kentucky]]})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertFalse(data['success'])
+        self.assertEqual(data['saved'], 0)
+        self.assertEqual(self.get_picks(), {})
+
+        # The stored pick is used for a match whose new pick was rejected
+        self.post({'picks': [[first.pk, first.team1_id]]})
+        data = json.loads(self.post({'picks': [[first.pk, kentucky], [child.pk, first.team2_id]]})
+                          .content.decode('utf-8'))
+        self.assertEqual(set(data['errors']), {str(first.pk), str(child.pk)})
+        self.assertEqual(self.get_picks(), {first.pk: first.team1_id})
+
+    def test_remove_impossible_picks(self):
+        first = self.bracket.get_match(1, 1)
+        child = self.bracket.child_match(first)
+        self.post({'picks': [[first.pk, first.team1_id], [child.pk, first.team1_id]]})
+        self.assertEqual(self.get_picks(), {first.pk: first.team1_id, child.pk: first.team1_id})
+
+        data = json.loads(self.post({'picks': [[first.pk, first.team2_id]]}).content.decode('utf-8'))
+        self.assertTrue(data['success'])
+        self.assertEqual(data['removed'], [child.pk])
+        self.assertEqual(self.get_picks(), {first.pk: first.team2_id})
+        self.assertScoresConsistent()
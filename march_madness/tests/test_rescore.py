@@ -0,0 +1,19 @@
+from ..models import Match, TeamRank
+from ..utils import rescore_tournament, get_match_value
+from .base import TournamentTestCase
+
+
+class RescoreTournamentTests(TournamentTestCase):
+    def test_rescore_tournament(self):
+        self.decide(self.get_open_matches())
+        changed = rescore_tournament(self.tournament)
+        self.assertTrue(changed)
+        self.assertScoresConsistent()
+
+        table = self.tournament.get_scoring_table()
+        seeds = TeamRank.get_seeds(self.tournament.year)
+        for match in Match.objects.filter(round__tournament=self.tournament, victor__isnull=False).select_related('round'):
+            self.assertEqual(match.tournament_value, get_match_value(match, seeds, table))
+
+        # Nothing changes the second time
+        self.assertEqual(rescore_tournament(self.tournament), [])
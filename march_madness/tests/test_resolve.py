@@ -0,0 +1,46 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from ..models import Tournament
+from .base import LOCAL_CACHE, TournamentTestCase
+
+
+class TournamentResolveTests(TournamentTestCase):
+    def test_resolve(self):
+        pk = self.tournament.pk
+        Tournament.resolve()
+        with self.assertNumQueries(0):
+            self.assertEqual(Tournament.resolve().pk, pk)
+            self.assertEqual(Tournament.resolve('march madness 2019').pk, pk)
+            self.assertEqual(Tournament.resolve('March Madness').pk, pk)
+            self.assertEqual(Tournament.resolve(str(pk)).pk, pk)
+            self.assertEqual(Tournament.resolve(2019).pk, pk)
+            self.assertEqual(Tournament.resolve('unknown').pk, pk)
+
+    def test_invalidated(self):
+        self.assertEqual(Tournament.resolve().pk, self.tournament.pk)
+
+        # A newer tournament becomes the current one
+        newer = Tournament.objects.create(name='March Madness', year=2020)
+        self.assertEqual(Tournament.resolve().pk, newer.pk)
+        self.assertEqual(Tournament.resolve('March Madness').pk, newer.pk)
+        self.assertEqual(Tournament.resolve(2019).pk, self.tournament.pk)
+
+        newer.name = 'Big Dance'
+        newer.save()
+        self.assertEqual(Tournament.resolve('big dance 2020').pk, newer.pk)
+        self.assertEqual(Tournament.resolve('March Madness').pk, self.tournament.pk)
+
+        newer.delete()
+        self.assertEqual(Tournament.resolve(2020).pk, self.tournament.pk)
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class EmptyResolveTests(TestCase):
+    def test_no_tournaments(self):
+        cache.clear()
+        self.assertIsNone(Tournament.resolve())
+        self.assertIsNone(Tournament.resolve('March Madness'))
+
+        tournament = Tournament.objects.create(name='March Madness', year=2019)
+        self.assertEqual(Tournament.resolve().pk, tournament.pk)
@@ -0,0 +1,37 @@
+from ..models import Match, TeamRank
+from ..utils import save_results, load_results, get_match_value
+from .base import TournamentTestCase
+
+
+class SaveResultsTests(TournamentTestCase):
+    def assertValues(self, matches):
+        table = self.tournament.get_scoring_table()
+        seeds = TeamRank.get_seeds(self.tournament.year)
+        for match in Match.objects.filter(pk__in=[match.pk for match in matches]).select_related('round'):
+            self.assertEqual(match.tournament_value, get_match_value(match, seeds, table))
+
+    def test_save_results(self):
+        bracket = self.get_bracket()
+        matches = [match for match in bracket if match.round.round_number == 1]
+        for match in matches:
+            match.victor_id = self.rng.choice((match.team1_id, match.team2_id))
+        save_results(self.tournament, matches, bracket)
+        self.assertValues(matches)
+        self.assertScoresConsistent()
+
+    def test_load_results(self):
+        bracket = self.get_bracket()
+        matches = bracket.get_round_matches(1)[:8]
+        lines = ['March Madness 2019', '', 'Round, Match, Team 1 Score, Team 2 Score, Victor']
+        lines.extend('1, {}, 70, 60, 2'.format(match.match_number) for match in matches)
+        report = load_results('results.csv', content='\n'.join(lines))
+        self.assertEqual(len(report), 8)
+        self.assertEqual({match.victor_id for match in Match.objects.filter(pk__in=[m.pk for m in matches])},
+                         {match.team2_id for match in matches})
+        self.assertValues(matches)
+        self.assertScoresConsistent()
+
+        # A dry run changes nothing
+        lines[3] = '1, {}, 70, 60, 1'.format(matches[0].match_number)
+        load_results('results.csv', content='\n'.join(lines), dry_run=True)
+        self.assertEqual(Match.objects.get(pk=matches[0].pk).victor_id, matches[0].team2_id)
@@ -0,0 +1,150 @@
+import itertools
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from ..models import Match, Group, TeamRank, UserPrediction, UserScore, RoundPoints
+from ..utils import rescore_tournament
+from .base import TournamentTestCase
+
+
+class UserScoreTests(TournamentTestCase):
+    def test_rebuild(self):
+        self.assertScoresConsistent()
+
+    def test_match_save(self):
+        self.decide(self.get_open_matches()[:20])
+        self.assertScoresConsistent()
+
+        # Change, remove and revalue a result
+        match = Match.objects.filter(round__tournament=self.tournament, victor__isnull=False).first()
+        match.victor_id = match.team2_id if match.victor_id == match.team1_id else match.team1_id
+        match.save()
+        self.assertScoresConsistent()
+
+        match.tournament_value = 12
+        match.save()
+        self.assertScoresConsistent()
+
+        match.victor = None
+        match.save()
+        self.assertScoresConsistent()
+
+    def test_prediction_changes(self):
+        user = get_user_model().objects.create_user('late')
+        Group.objects.get(name='Group 1').members.add(user)
+        match = self.get_open_matches()[0]
+        pred = UserPrediction.objects.create(user=user, match=match, guess_id=match.team1_id)
+        self.assertScoresConsistent()
+        self.assertGreater(UserScore.objects.get(user=user, tournament=self.tournament).max_points, 0)
+
+        pred.guess_id = match.team2_id
+        pred.save()
+        self.assertScoresConsistent()
+
+        pred.delete()
+        self.assertScoresConsistent()
+
+        # A pick on a decided match moves the points too
+        self.decide(self.get_open_matches()[:4])
+        match = Match.objects.filter(round__tournament=self.tournament, victor__isnull=False).first()
+        pred = UserPrediction.objects.create(user=user, match=match, guess_id=match.victor_id)
+        self.assertScoresConsistent()
+        self.assertEqual(UserScore.objects.get(user=user, tournament=self.tournament).correct, 1)
+
+        pred.guess_id = match.team1_id if match.victor_id == match.team2_id else match.team2_id
+        pred.save()
+        self.assertScoresConsistent()
+
+        # A pick saved without its loaded state is recalculated in full
+        UserPrediction(pk=pred.pk, user=user, match=match, guess_id=match.victor_id).save()
+        self.assertScoresConsistent()
+
+    def test_prediction_queries(self):
+        user = self.users[1]
+        pred = UserPrediction.objects.filter(user=user, match__victor__isnull=True).select_related('match').first()
+        self.tournament.get_remaining_values()
+        pred.guess_id = pred.match.team1_id if pred.guess_id != pred.match.team1_id else pred.match.team2_id
+        with CaptureQueriesContext(connection) as queries:
+            pred.save()
+        self.assertLessEqual(len(queries), 8)
+        self.assertScoresConsistent()
+
+    def test_remaining_values_cache(self):
+        values = self.tournament.get_remaining_values()
+        self.assertEqual(values, self.tournament.get_remaining_values(self.get_bracket()))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.tournament.get_remaining_values(), values)
+
+        # Results and scoring rules changes are priced again
+        self.decide(self.get_open_matches()[:1])
+        values = self.tournament.get_remaining_values()
+        self.assertEqual(values, self.tournament.get_remaining_values(self.get_bracket()))
+
+        points = RoundPoints.objects.get(rules__tournament=self.tournament, round_number=6)
+        points.points = 100
+        points.save()
+        self.tournament.get_scoring_table(refresh=True)
+        self.assertNotEqual(self.tournament.get_remaining_values(), values)
+
+    def test_max_points(self):
+        rescore_tournament(self.tournament)
+        table = self.tournament.get_scoring_table()
+        round_points = table.round_points
+
+        # Every alive pick is worth at least its round points
+        self.decide(self.get_open_matches()[:20])
+        eliminated = self.tournament.get_eliminated_teams()
+        for score in UserScore.objects.filter(tournament=self.tournament):
+            picks = UserPrediction.objects.filter(user=score.user_id, match__round__tournament=self.tournament,
+                                                  match__victor__isnull=True).exclude(guess__in=eliminated)
+            least = score.points + sum(round_points[number] for number in
+                                       picks.values_list('match__round__round_number', flat=True))
+            self.assertGreaterEqual(score.max_points, least)
+
+        # The max points are at least the best score of every way the bracket can finish
+        while len([match for match in self.get_bracket() if match.victor_id is None]) > 10:
+            self.decide(self.get_open_matches()[:1])
+        rescore_tournament(self.tournament)
+        self.assertScoresConsistent()
+
+        best = self.best_scores(table)
+        scores = {score.user_id: score for score in UserScore.objects.filter(tournament=self.tournament)}
+        for user_id, points in best.items():
+            self.assertGreaterEqual(scores[user_id].max_points, points)
+        for group in Group.objects.filter(tournament=self.tournament):
+            members = [user.pk for user in group.members.all()]
+            leader = max(scores[user_id].points for user_id in members)
+            for user_id in members:
+                if best[user_id] >= leader:
+                    self.assertFalse(scores[user_id].eliminated)
+
+    def best_scores(self, table):
+        """Return user id: best score over every way the undecided matches can finish."""
+        bracket = self.get_bracket()
+        seeds = TeamRank.get_seeds(self.tournament.year)
+        picks = {}
+        for user_id, match_id, guess_id in UserPrediction.objects.filter(match__round__tournament=self.tournament) \
+                .values_list('user', 'match', 'guess'):
+            picks.setdefault(user_id, {})[match_id] = guess_id
+
+        undecided = [match for match in bracket if match.victor_id is None]
+        best = {}
+        for outcome in itertools.product((0, 1), repeat=len(undecided)):
+            outcome = dict(zip((match.pk for match in undecided), outcome))
+            winners, values = {}, {}
+            for match in bracket:
+                if match.victor_id is not None:
+                    winners[match.pk], values[match.pk] = match.victor_id, match.tournament_value
+                    continue
+                teams = [winners[parent.pk] if parent is not None else team_id for team_id, parent in
+                         zip((match.team1_id, match.team2_id), bracket.parent_matches(match))]
+                victor, loser = teams[outcome[match.pk]], teams[1 - outcome[match.pk]]
+                winners[match.pk] = victor
+                values[match.pk] = table.get_value(match.round.round_number, seeds[victor], seeds[loser])
+            for user_id, user_picks in picks.items():
+                points = sum(values[match_id] for match_id, guess_id in user_picks.items()
+                             if winners[match_id] == guess_id)
+                best[user_id] = max(best.get(user_id, 0), points)
+        return best
+
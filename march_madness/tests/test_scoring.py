@@ -0,0 +1,60 @@
+import itertools
+from django.test import SimpleTestCase, TestCase
+
+from ..models import Tournament, ScoringRules, RoundPoints, SeedBonus
+from ..scoring import ScoringTable, DEFAULT_ROUND_POINTS, DEFAULT_SEED_POINTS
+
+
+class ScoringTableTests(SimpleTestCase):
+    def test_lookup_matches_calculate(self):
+        table = ScoringTable(DEFAULT_ROUND_POINTS, DEFAULT_SEED_POINTS, seed_difference_points=1)
+        for rnd, victor, loser in itertools.product(range(8), range(18), range(18)):
+            self.assertEqual(table.get_value(rnd, victor, loser), table.calculate(rnd, victor, loser))
+
+    def test_defaults(self):
+        table = ScoringTable(DEFAULT_ROUND_POINTS, DEFAULT_SEED_POINTS)
+        self.assertEqual(table.get_value(1, 1, 16), 2)
+        self.assertEqual(table.get_value(6, 1, 2), 10)
+        self.assertEqual(table.get_value(7, 1, 2), 1)  # Default round points
+        self.assertEqual(table.get_value(1, 12, 5), 8)  # Seed bonus
+        self.assertEqual(table.get_value(2, 16, 1), 16)
+        self.assertEqual(table.get_value(1, 11, 3), 2)  # No seed difference points
+
+    def test_seed_difference(self):
+        table = ScoringTable({1: 1}, {(9, 8): 1}, default_seed_points=2, seed_difference_points=3)
+        self.assertEqual(table.get_value(1, 11, 3), 24)
+        self.assertEqual(table.get_value(1, 3, 11), 2)
+        self.assertEqual(table.get_value(1, 5, 4), 3)
+        self.assertEqual(table.get_value(1, 9, 8), 1)  # The bonus wins over the seed difference
+
+    def test_out_of_range(self):
+        table = ScoringTable({1: 2}, {(20, 1): 5}, seed_difference_points=1, max_seed=4)
+        self.assertEqual(table.num_seeds, 21)
+        self.assertEqual(table.get_value(1, 20, 1), 10)
+        self.assertEqual(table.get_value(1, 30, 1), 58)
+        self.assertEqual(table.get_value(9, 2, 1), 1)
+        self.assertEqual(table.get_value(-1, 2, 1), 1)
+
+
+class ScoringRulesTests(TestCase):
+    def setUp(self):
+        self.tournament = Tournament.objects.create(name='March Madness', year=2019)
+
+    def test_unsaved_rules(self):
+        table = self.tournament.get_scoring_table()
+        self.assertEqual(table.round_points, DEFAULT_ROUND_POINTS)
+        self.assertEqual(table.seed_points, DEFAULT_SEED_POINTS)
+
+    def test_saved_rules(self):
+        rules = ScoringRules.get_or_create_default(self.tournament)
+        self.assertEqual(self.tournament.get_scoring_table().seed_points, DEFAULT_SEED_POINTS)
+
+        RoundPoints.objects.filter(rules=rules, round_number=1).update(points=3)
+        SeedBonus.objects.create(rules=rules, victor_seed=11, loser_seed=3, points=9)
+        rules.seed_difference_points = 2
+        rules.save()
+
+        self.assertEqual(self.tournament.get_scoring_table().get_value(1, 11, 3), 2)  # Kept on the instance
+        table = self.tournament.get_scoring_table(refresh=True)
+        self.assertEqual(table.get_value(1, 11, 3), 27)
+        self.assertEqual(table.get_value(1, 10, 3), 42)
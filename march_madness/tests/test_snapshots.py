@@ -0,0 +1,33 @@
+from django.urls import reverse
+
+from ..models import Match, Group, ScoreSnapshot
+from .base import TournamentTestCase
+
+
+class ScoreSnapshotTests(TournamentTestCase):
+    def test_capture(self):
+        first_round = [match for match in self.get_bracket() if match.round.round_number == 1]
+        self.decide(first_round)
+        snapshots = ScoreSnapshot.objects.filter(round__tournament=self.tournament, group__isnull=True)
+        self.assertEqual(dict(snapshots.values_list('user', 'points')),
+                         {user_id: points for user_id, (points, _, _, _) in self.expected_scores().items()})
+
+        # Recaptured when a result of the round changes
+        match = Match.objects.get(pk=first_round[0].pk)
+        match.victor_id = match.team2_id if match.victor_id == match.team1_id else match.team1_id
+        match.save()
+        self.assertEqual(dict(snapshots.values_list('user', 'points')),
+                         {user_id: points for user_id, (points, _, _, _) in self.expected_scores().items()})
+
+    def test_group_history(self):
+        group = Group.objects.get(name='Group 1')
+        url = reverse('march_madness:group_history_json', args=[group.pk])
+        self.assertEqual(self.client.get(url).json()['rounds'], [])
+
+        self.decide([match for match in self.get_bracket() if match.round.round_number == 1])
+        data = self.client.get(url).json()
+        self.assertEqual([number for number, name in data['rounds']], [1])
+        expected = self.expected_scores()
+        members = {int(user_id): member['history'][0][0] for user_id, member in data['members'].items()}
+        self.assertEqual(members, {user.pk: expected[user.pk][0] for user in group.members.all()})
+        self.assertEqual(data['total'][0][0], sum(members.values()))
@@ -7,9 +7,17 @@ app_name = "march_madness"
 urlpatterns = [
     path('', views.view_group_scores, name="home"),
     path('group_scores/', views.view_group_scores, name="group_scores"),
+    path('group_scores/events/', views.score_events, name="score_events"),
     path('tournament_standings/', views.tournament_standings, name="tournament_standings"),
+    path('simulation/', views.view_simulation, name="simulation"),
     path('round/<int:pk>/', views.view_round, name="round"),
     path('bracket/<str:user>/captain/', views.captain_view_bracket, name="captain_bracket"),
     path('bracket/<str:user>/', views.view_bracket, name="bracket"),
-    path('user_prediction/', views.user_prediction, name="user_prediction")
+    path('user_prediction/', views.user_prediction, name="user_prediction"),
+    path('api/bracket/', views.bracket_json, name="bracket_json"),
+    path('api/bracket/<str:user>/', views.picks_json, name="picks_json"),
+    path('api/predictions/', views.batch_predictions, name="batch_predictions"),
+    path('api/groups/<int:pk>/history/', views.group_history_json, name="group_history_json"),
+    path('instrumentation/', views.view_instrumentation, name="instrumentation"),
+    path('api/instrumentation/', views.instrumentation_json, name="instrumentation_json"),
 ]
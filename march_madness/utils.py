@@ -1,13 +1,61 @@
 import collections
-from django.db.models import ManyToManyField, DateTimeField
+import json
+import os
+from django.db import transaction
+from django.db.models import ManyToManyField, DateTimeField, Count
 
-from .models import Round, Match, Team, TeamRank, Tournament
+from .models import Round, Match, Team, TeamRank, Tournament, UserScore, ScoreSnapshot
+from .caches import clear_seeds, clear_results, clear_tournaments
+from .signals import results_changed
+from .live import publish_reload
 
 
-def load_csv(filename):
+def read_csv_matches(filename):
+    """Read a match csv file (see load_csv). Return the tournament name, year and a list of row dictionaries."""
+    name, year = None, None
+    columns = None
+    rows = []
+
+    def get_item(items, column):
+        try:
+            return items[columns[column]].strip()
+        except (KeyError, IndexError):
+            return ''
+
+    with open(filename) as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if i == 0:
+                name, year = [j.strip() for j in line.rsplit(' ', 1)]
+                year = int(year)
+            elif columns is None:
+                if ',' in line:
+                    columns = {c.strip(): j for j, c in enumerate(line.split(','))}
+            elif line:
+                items = line.split(',')
+                row = {'year': int(get_item(items, 'Year')),
+                       'round': int(get_item(items, 'Round')),
+                       'match': int(get_item(items, 'Match')),
+                       'tournament_value': int(get_item(items, 'Tournament Value') or 1)}
+                for key in ('Team 1', 'Team 2'):
+                    field = key.lower().replace(' ', '')
+                    row[field] = get_item(items, key) or None
+                    try:
+                        row[field + '_seed'] = int(get_item(items, key + ' Seed'))
+                    except ValueError:
+                        row[field + '_seed'] = None
+                rows.append(row)
+
+    return name, year, rows
+
+
+def load_csv(filename, dry_run=False):
     """Load a csv file with the first line being the exact tournament name and the next lines be comma separated
     columns of year, team name, seed.
 
+    The whole file is read first. The existing rounds, matches, teams and ranks are found with a few queries and the
+    changes are written with bulk inserts and updates in one transaction.
+
     Note:
         The tournament must exist and must be "<name> <year>" separated by a space.
         The teams and rounds will be created if given.
@@ -18,71 +66,308 @@ def load_csv(filename):
         Year, Round, Match, Team 1, Team 1 Seed, Team 2, Team 2 Seed, Tournament Value
         2018, 1, 1, UMBC Retrievers, 16, Virginia Cavaliers, 1, 1
         2018, 1, 2, Kansas State Wildcats, 9,,,
+
+    Args:
+        filename (str): CSV filename to load.
+        dry_run (bool)[False]: If True roll back the changes after they are made.
+
+    Returns:
+        report (list): List of change descriptions.
     """
-    tourney = None
-    columns = None
+    name, year, rows = read_csv_matches(filename)
+    tourney = Tournament.objects.get(name=name, year=year)
+    report = []
 
-    with open(filename) as f:
-        for i, line in enumerate(f):
+    with transaction.atomic():
+        # Rounds
+        round_nums = sorted({row['round'] for row in rows})
+        rounds = Round.objects.filter(tournament=tourney, round_number__in=round_nums)
+        new_rounds = [Round(tournament=tourney, round_number=num, name='Round ' + str(num))
+                      for num in round_nums if num not in {rnd.round_number for rnd in rounds}]
+        if new_rounds:
+            Round.objects.bulk_create(new_rounds)
+            clear_tournaments()
+            report.extend('Created round {}'.format(rnd) for rnd in new_rounds)
+        rounds = {rnd.round_number: rnd for rnd in rounds.all()}
+        for rnd in rounds.values():
+            rnd.tournament = tourney
+
+        # Teams
+        names = {row[key] for row in rows for key in ('team1', 'team2') if row[key]}
+        teams = {team.name: team for team in Team.objects.filter(name__in=names)}
+        new_teams = [Team(name=n) for n in sorted(names) if n not in teams]
+        if new_teams:
+            Team.objects.bulk_create(new_teams)
+            report.extend('Created team {}'.format(team) for team in new_teams)
+            teams = {team.name: team for team in Team.objects.filter(name__in=names)}
+        team_names = {team.pk: team.name for team in teams.values()}
+
+        # Team ranks (seeds)
+        seeds = {(teams[row[key]].pk, row['year']): row[key + '_seed']
+                 for row in rows for key in ('team1', 'team2') if row[key] and row[key + '_seed'] is not None}
+        ranks = {(rank.team_id, rank.year): rank
+                 for rank in TeamRank.objects.filter(team__in={k[0] for k in seeds}, year__in={k[1] for k in seeds})
+                 .select_related('team')}
+        new_ranks, changed_ranks = [], []
+        for (team_id, rank_year), seed in seeds.items():
+            rank = ranks.get((team_id, rank_year), None)
+            if rank is None:
+                new_ranks.append(TeamRank(team_id=team_id, year=rank_year, seed=seed))
+            elif rank.seed != seed:
+                report.append('Changed {} seed {} to {}'.format(rank, rank.seed, seed))
+                rank.seed = seed
+                changed_ranks.append(rank)
+        TeamRank.objects.bulk_create(new_ranks)
+        TeamRank.objects.bulk_update(changed_ranks, ['seed'])
+        report.extend('Created rank {} {} - {}'.format(rank.year, team_names[rank.team_id], rank.seed)
+                      for rank in new_ranks)
+        if new_ranks or changed_ranks:
+            clear_seeds()
+
+        # Matches
+        matches = {(match.round_id, match.match_number): match
+                   for match in Match.objects.filter(round__in=rounds.values())}
+        new_matches, changed_matches = [], []
+        for row in rows:
+            rnd = rounds[row['round']]
+            match = matches.get((rnd.pk, row['match']), None)
+            if match is None:
+                match = Match(round=rnd, match_number=row['match'])
+                matches[(rnd.pk, row['match'])] = match
+                new_matches.append(match)
+
+            changes = []
+            values = {'tournament_value': row['tournament_value']}
+            for key in ('team1', 'team2'):
+                if row[key]:
+                    values[key + '_id'] = teams[row[key]].pk
+            for attr, value in values.items():
+                if getattr(match, attr) != value:
+                    setattr(match, attr, value)
+                    changes.append(attr)
+            if match.pk is not None and changes:
+                report.append('Changed {} {}'.format(match, ', '.join(changes)))
+                changed_matches.append(match)
+
+        Match.objects.bulk_create(new_matches)
+        Match.objects.bulk_update(changed_matches, ['tournament_value', 'team1', 'team2'])
+        report.extend('Created match {}'.format(match) for match in new_matches)
+
+        report.extend(line_up_matches(tourney))
+        if report:
+            clear_results()
+
+        if dry_run:
+            transaction.set_rollback(True)
+
+    return report
+
+
+def save_results(tournament, matches, bracket=None):
+    """Save the scores and victors of many matches of a tournament at once.
+
+    The tournament value of each decided match is calculated from the scoring rules (see get_match_value). The matches
+    are saved with one bulk update without calling ``Match.save``. The victors are advanced through the bracket, the
+    user scores and score snapshots are rebuilt once, the caches are invalidated and the live score pages are told to
+    reload.
+
+    Args:
+        tournament (Tournament): Tournament of the matches.
+        matches (list): Matches with their new team1_score, team2_score and victor.
+        bracket (BracketIndex)[None]: Bracket that the matches came from. By default the tournament's bracket is used.
+
+    Returns:
+        invalid (list): Decided matches after the given matches whose victor no longer plays in them.
+    """
+    matches = list(matches)
+    if bracket is None:
+        bracket = tournament.get_bracket()
+    table = tournament.get_scoring_table()
+    seeds = TeamRank.get_seeds(tournament.year)
+    for match in matches:
+        value = get_match_value(match, seeds, table)
+        if value is not None:
+            match.tournament_value = value
+
+    with transaction.atomic():
+        Match.objects.bulk_update(matches, ['team1_score', 'team2_score', 'victor', 'tournament_value'])
+        advanced, invalid = bracket.advance(matches)
+        UserScore.rebuild(tournament)
+        ScoreSnapshot.capture(tournament)
+        clear_results()
+        publish_reload(tournament)
+    return invalid
+
+
+RESULT_FIELDS = ('round', 'match', 'team1', 'team2', 'team1_score', 'team2_score', 'victor')
+
+
+def read_results(filename, content=None):
+    """Read a results csv or json file (see load_results). Return the tournament name, year and a list of rows.
+
+    Each row is a dictionary of the RESULT_FIELDS. Missing values are None.
+
+    Args:
+        filename (str): Results filename. Files ending in ".json" are read as json.
+        content (str)[None]: File contents. If given the file is not opened.
+    """
+    if content is None:
+        with open(filename) as f:
+            content = f.read()
+
+    def to_int(value):
+        value = str(value).strip() if value is not None else ''
+        return int(value) if value else None
+
+    def to_name(value):
+        value = str(value).strip() if value is not None else ''
+        return value or None
+
+    if os.path.splitext(filename)[1].lower() == '.json':
+        data = json.loads(content)
+        name, year = [item.strip() for item in data['tournament'].rsplit(' ', 1)]
+        items = data['results']
+    else:
+        lines = content.splitlines()
+        name, year = [item.strip() for item in lines[0].strip().rsplit(' ', 1)]
+        columns = None
+        items = []
+        for line in lines[1:]:
             line = line.strip()
-            if i == 0:
-                # Tournament must exist
-                n, y = [j.strip() for j in line.rsplit(' ', 1)]
-                tourney = Tournament.objects.get(name=n, year=int(y))
-            elif columns is None:
+            if columns is None:
                 if ',' in line:
-                    columns = {c.strip(): j for j, c in enumerate(line.split(','))}
+                    columns = [c.strip().lower().replace(' ', '') for c in line.split(',')]
+            elif line:
+                items.append(dict(zip(columns, line.split(','))))
+
+    rows = []
+    for item in items:
+        item = {str(key).lower().replace(' ', '').replace('_', ''): value for key, value in item.items()}
+        rows.append({'round': to_int(item.get('round', None)), 'match': to_int(item.get('match', None)),
+                     'team1': to_name(item.get('team1', None)), 'team2': to_name(item.get('team2', None)),
+                     'team1_score': to_int(item.get('team1score', None)),
+                     'team2_score': to_int(item.get('team2score', None)),
+                     'victor': to_name(item.get('victor', None))})
+    return name, int(year), rows
+
+
+def load_results(filename, content=None, dry_run=False):
+    """Set the scores and victors of many matches at once from a results csv or json file.
+
+    A row finds its match by round and match number or by the names of the two teams. The victor is a team name or
+    "1" / "2". Without a victor the team with the higher score wins. The rows are applied round by round, so the
+    victors that advance can be named in the rows of the next round.
+
+    Everything runs in one transaction. The matches are saved with one bulk update per round, the victors are advanced
+    through the bracket, the user scores and score snapshots are rebuilt once and the caches are invalidated.
+
+    Note:
+        The tournament values of the decided matches are calculated from the scoring rules (see save_results).
+
+    Example:
+        March Madness 2019
+
+        Round, Match, Team 1, Team 2, Team 1 Score, Team 2 Score, Victor
+        1, 1, , , 85, 62, Duke Blue Devils
+        , , VCU Rams, UCF Bulls, 58, 73,
+
+        {"tournament": "March Madness 2019",
+         "results": [{"round": 1, "match": 1, "team1_score": 85, "team2_score": 62, "victor": "1"}]}
+
+    Args:
+        filename (str): Results filename. Files ending in ".json" are read as json.
+        content (str)[None]: File contents. If given the file is not opened.
+        dry_run (bool)[False]: If True roll back the changes after they are made.
+
+    Returns:
+        report (list): List of change descriptions. Decided matches whose victor no longer plays in them after the
+            changes are reported as "Invalid".
+
+    Raises:
+        ValueError: If a row does not match a match or team. Nothing is saved.
+    """
+    name, year, rows = read_results(filename, content)
+    tournament = Tournament.objects.get(name=name, year=year)
+    report = []
+
+    with transaction.atomic():
+        bracket = tournament.get_bracket()
+        teams = {team.name.lower(): team for team in bracket.get_teams()}
+
+        def get_team(team_name, line):
+            try:
+                return teams[team_name.lower()]
+            except KeyError:
+                raise ValueError('Row {}: Unknown team "{}"'.format(line, team_name)) from None
+
+        # Rows with round numbers are applied in round order. Rows with only team names are applied after them.
+        lines = sorted(range(len(rows)), key=lambda i: rows[i]['round'] or len(bracket.rounds) + 1)
+        changed = {}
+        pending = []
+        for i, line in enumerate(lines):
+            row = rows[line]
+            line += 1
+
+            # Find the match
+            swap = False
+            if row['round'] is not None and row['match'] is not None:
+                match = bracket.get_match(row['round'], row['match'])
+                if match is None:
+                    raise ValueError('Row {}: Round {} match {} does not exist'.format(line, row['round'],
+                                                                                      row['match']))
+            elif row['team1'] and row['team2']:
+                # Earlier rows may have advanced the teams
+                bracket.advance(pending)
+                pending = []
+                pair = {get_team(row['team1'], line).pk, get_team(row['team2'], line).pk}
+                match = next((m for m in bracket if {m.team1_id, m.team2_id} == pair), None)
+                if match is None:
+                    raise ValueError('Row {}: {} and {} do not play each other'.format(line, row['team1'],
+                                                                                      row['team2']))
+                swap = match.team1.name.lower() != row['team1'].lower()
             else:
-                items = [l.strip() for l in line.split(',')]
-                year = int(items[columns['Year']])
-                r_num = int(items[columns['Round']])
-                m_num = int(items[columns['Match']])
-                t_val = int(items[columns.get('Tournament Value', 1)])
-
-                # Create the round and match
-                rnd, created = Round.objects.get_or_create(tournament=tourney, round_number=r_num,
-                                                           name='Round ' + str(r_num))
-                match, created = Match.objects.get_or_create(round=rnd, match_number=m_num)
-
-                # Set the match value
-                match.tournament_value = t_val
-
-                # Setup Team 1 if given
-                try:
-                    t1 = items[columns.get('Team 1', None)]
-                    if t1.strip() == '':
-                        raise KeyError
-
-                    # Make or get Team 1
-                    team1, created = Team.objects.get_or_create(name=t1)
-                    match.team1 = team1
-
-                    # Make the team rank
-                    t1_seed = int(items[columns.get('Team 1 Seed', None)])
-                    team1_r, created = TeamRank.objects.get_or_create(team=team1, year=year, seed=t1_seed)
-                except (IndexError, ValueError, TypeError, KeyError, AttributeError):
-                    pass
-
-                # Setup Team 2 if given
-                try:
-                    t2 = items[columns['Team 2']]
-                    if t2.strip() == '':
-                        raise KeyError
-
-                    # Make or get Team 2
-                    team2, created = Team.objects.get_or_create(name=t2)
-                    match.team2 = team2
-
-                    # Make the team rank
-                    t2_seed = int(items[columns.get('Team 2 Seed', None)])
-                    team2_r, created = TeamRank.objects.get_or_create(team=team2, year=year, seed=t2_seed)
-                except (IndexError, ValueError, TypeError, KeyError, AttributeError):
-                    pass
-
-                # Save the match
-                match.save()
-
-    line_up_matches(tourney)
+                raise ValueError('Row {}: Give the round and match number or both team names'.format(line))
+
+            # Find the victor
+            scores = (row['team2_score'], row['team1_score']) if swap else (row['team1_score'], row['team2_score'])
+            victor = row['victor']
+            if victor in ('1', '2'):
+                victor = match.team2 if (victor == '2') != swap else match.team1
+            elif victor:
+                victor = get_team(victor, line)
+            elif None not in scores and scores[0] != scores[1]:
+                victor = match.team1 if scores[0] > scores[1] else match.team2
+            else:
+                victor = None
+            if victor is not None and victor.pk not in (match.team1_id, match.team2_id):
+                raise ValueError('Row {}: {} does not play in {}'.format(line, victor, match))
+
+            changes = []
+            values = {'team1_score': scores[0], 'team2_score': scores[1], 'victor': victor}
+            for attr, value in values.items():
+                if value is not None and getattr(match, attr) != value:
+                    setattr(match, attr, value)
+                    changes.append(attr)
+            if changes:
+                report.append('Changed {} {}'.format(match, ', '.join(changes)))
+                changed[match.pk] = match
+                pending.append(match)
+
+            # Advance the victors before the next round
+            next_row = rows[lines[i + 1]] if i + 1 < len(lines) else None
+            if next_row is None or next_row['round'] != row['round']:
+                bracket.advance(pending)
+                pending = []
+
+        if changed:
+            invalid = save_results(tournament, changed.values(), bracket=bracket)
+            report.extend('Invalid {} victor {} no longer plays in the match'.format(match, match.victor)
+                          for match in invalid)
+
+        if dry_run:
+            transaction.set_rollback(True)
+
+    return report
 
 
 def model_to_dict(self):
@@ -104,75 +389,124 @@ def model_to_dict(self):
     return data
 
 
+def get_bracket_shape(num_matches):
+    """Return the number of matches in each round of a bracket that starts with the given number of matches.
+
+    Example:
+        >>> get_bracket_shape(32)
+        [32, 16, 8, 4, 2, 1]
+    """
+    shape = [num_matches]
+    while shape[-1] > 1:
+        shape.append((shape[-1] + 1) // 2)
+    return shape
+
+
 def line_up_matches(tournament):
-    """If the first round is completely filled out. This function will go through the next rounds and make up the
-    matches.
+    """Create the rounds and matches that follow the largest round of the tournament.
+
+    The bracket shape is calculated in memory from the number of matches in the largest round. Rounds before the
+    largest round (play-in rounds) are left alone. The missing rounds are created with one bulk insert and the missing
+    matches with one bulk insert per round, so running this again does not change anything.
+
+    Returns:
+        report (list): Descriptions of the created rounds and matches.
     """
-    prev_round = tournament.rounds.all()[0]
-    round_num = prev_round.round_number
-    matches = prev_round.matches.all()
-    num_rounds = 1
-    num_matches = len(matches)
-    while num_matches > 1:
-        num_matches = num_matches / 2
-        num_rounds += 1
-
-    for r in range(1, num_rounds):
-        next_round, created = Round.objects.get_or_create(tournament=tournament, round_number=round_num+r)
-        for i in range(0, len(prev_round.matches.all()), 2):
-            try:
-                match1 = matches[i]
-                match2 = matches[i+1]
-            except IndexError:
-                break
+    rounds = {rnd.round_number: rnd
+              for rnd in tournament.rounds.annotate(num_matches=Count('matches')).order_by('round_number')}
+    if not rounds:
+        return []
 
-            try:
-                next_match = Match.objects.get(round=next_round, match_number=int(i//2)+1)
-            except Match.DoesNotExist:
-                # Create the match
-                next_match = Match.objects.create(round=next_round, match_number=int(i//2)+1)
-
-            # next_match.team1.clear()
-            # if match1.victor:
-            #     next_match.team1.add(match1.victor)
-            # else:
-            #     next_match.team1.add(*match1.teams.all())
-            #
-            # next_match.team2.clear()
-            # if match2.victor:
-            #     next_match.team2.add(match2.victor)
-            # else:
-            #     next_match.team2.add(*match2.teams.all())
-            # next_match.save()
-        prev_round = next_round
-
-
-def calculate_points(match, round_mapping=None, seed_mapping=None):
-    """If Higher Seed wins give multiplier else normal"""
-    if round_mapping is None:
-        round_mapping = {}
+    first = max(rounds.values(), key=lambda rnd: (rnd.num_matches, -rnd.round_number))
+    shape = {first.round_number + i: num for i, num in enumerate(get_bracket_shape(first.num_matches))}
+    report = []
 
-    if seed_mapping is None:
-        seed_mapping = {}
+    new_rounds = [Round(tournament=tournament, round_number=num, name='Round ' + str(num))
+                  for num in shape if num not in rounds]
+    if new_rounds:
+        Round.objects.bulk_create(new_rounds)
+        clear_tournaments()
+        report.extend('Created round {}'.format(rnd) for rnd in new_rounds)
+        rounds = {rnd.round_number: rnd for rnd in tournament.rounds.filter(round_number__in=shape)}
 
-    round_value = round_mapping.get(match.round.round_number, 1)
-    year = match.round.tournament.year
-    team1 = match.victor
-    if team1 is None:
-        return
-    if team1 == match.team1:
-        team2 = match.team2
+    existing = set(Match.objects.filter(round__tournament=tournament, round__round_number__in=shape)
+                   .values_list('round__round_number', 'match_number'))
+    for num, num_matches in shape.items():
+        new_matches = [Match(round=rounds[num], match_number=i) for i in range(1, num_matches + 1)
+                       if (num, i) not in existing]
+        if new_matches:
+            Match.objects.bulk_create(new_matches)
+            report.append('Created {} matches in {}'.format(len(new_matches), rounds[num]))
+
+    return report
+
+
+def get_match_value(match, seeds, table):
+    """Return the tournament value for a match with a victor or None if it cannot be calculated.
+
+    Args:
+        match (Match): Match with a victor and round.
+        seeds (dict): Team id: seed dictionary for the tournament year.
+        table (ScoringTable): Compiled scoring rules.
+    """
+    if match.victor_id is None:
+        return None
+    if match.victor_id == match.team1_id:
+        loser_id = match.team2_id
     else:
-        team2 = match.team1
+        loser_id = match.team1_id
 
     try:
-        seed1 = team1.rankings.get(year=year).seed
-        seed2 = team2.rankings.get(year=year).seed
-        seed_match = "{seed1} v {seed2}".format(seed1=seed1, seed2=seed2)
-        seed_value = seed_mapping.get(seed_match, 1)  # Creating Seed Value from documented Seed Details
+        return table.get_value(match.round.round_number, seeds[match.victor_id], seeds[loser_id])
+    except KeyError:
+        return None
 
-        match.tournament_value = round_value * seed_value
-        match.save()
-    except:
+
+def calculate_points(match, table=None):
+    """If Higher Seed wins give multiplier else normal"""
+    if match.victor_id is None:
         return
+    tournament = match.round.tournament
+    if table is None:
+        table = tournament.get_scoring_table()
+    value = get_match_value(match, TeamRank.get_seeds(tournament.year), table)
+    if value is not None:
+        match.tournament_value = value
+        match.save()
+
+
+def rescore_tournament(tournament, table=None):
+    """Calculate the tournament value of every decided match and save the changed values.
+
+    The seeds for the year are loaded with one query, the values are read from the tournament's compiled scoring
+    rules and the changed matches are saved with one bulk update. The stored user scores and score snapshots are
+    rebuilt if any value changed.
+
+    Args:
+        tournament (Tournament): Tournament to rescore.
+        table (ScoringTable)[None]: Scoring rules to use. By default the tournament's rules are used.
+
+    Returns:
+        changed (list): List of (match, old value, new value) for each match whose value changed.
+    """
+    if table is None:
+        table = tournament.get_scoring_table()
+    seeds = TeamRank.get_seeds(tournament.year)
+    matches = Match.objects.filter(round__tournament=tournament, victor__isnull=False).select_related('round')
+
+    changed = []
+    for match in matches:
+        match.round.tournament = tournament
+        value = get_match_value(match, seeds, table)
+        if value is not None and value != match.tournament_value:
+            changed.append((match, match.tournament_value, value))
+            match.tournament_value = value
 
+    if changed:
+        with transaction.atomic():
+            Match.objects.bulk_update([item[0] for item in changed], ['tournament_value'])
+            UserScore.rebuild(tournament)
+            ScoreSnapshot.capture(tournament)
+        results_changed.send(sender=Match, tournament=tournament, matches=[item[0] for item in changed], advanced=[])
+        publish_reload(tournament)
+    return changed
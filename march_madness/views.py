@@ -1,16 +1,25 @@
 from django.contrib.auth import get_user_model
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.utils import timezone
-from django.db.models import Q
-from django.http import JsonResponse, Http404
+from django.http import JsonResponse, Http404, StreamingHttpResponse
+from django.db import transaction
+from django.views.decorators.http import condition, require_POST
+import hashlib
+import json
 import urllib.parse
 
 from materialize_nav import NavView, SearchView
 
-from .models import current_year, Tournament, Round, Match, Team
+from .caches import get_or_set, get_version, get_versions, clear_picks
+from .models import current_year, Tournament, Round, Match, Team, TeamRank, UserPrediction, Group, ScoreSnapshot, \
+    UserScore
 from .forms import UserPredictionForm
+from .simulate import get_results
+from .middleware import request_stats
+from . import live
 
 
 class MarchMadnessNav(NavView):
@@ -24,6 +33,7 @@ class MarchMadnessNav(NavView):
 MarchMadnessNav.add_navigation_header("Tournaments")
 MarchMadnessNav.add_navigation_header("March Madness")
 MarchMadnessNav.add_navigation("march_madness:group_scores", "Group Scores", app="March Madness")
+MarchMadnessNav.add_navigation("march_madness:simulation", "Pool Simulation", app="March Madness")
 
 
 def reverse_params(view, *args, url_kwargs=None, **kwargs):
@@ -39,29 +49,36 @@ def reverse_params(view, *args, url_kwargs=None, **kwargs):
 def get_tournament_or_404(request):
     """Return the tournament requested for the given params.
 
+    The "tournament" param can be the tournament name, pk or year. The newest tournament is used if it is missing or
+    does not match. The tournament comes from a cached index, so this does not run a query.
+
     Args:
         request: Request object containing the get parameters
     """
-    try:
-        return Tournament.objects.get(Q(name__iexact=request.GET.get("tournament", None)) |
-                                      Q(pk=request.GET.get("tournament", None)))
-    except Tournament.DoesNotExist:
-        pass
-    try:
-        t = list(Tournament.objects.filter().order_by('-year'))[0]
-        return t
-    except (IndexError, ValueError, TypeError, KeyError):
-        pass
-    raise Http404
+    tourney = Tournament.resolve(request.GET.get("tournament", None))
+    if tourney is None:
+        raise Http404
+    return tourney
+
+
+def get_nav_entries(tourney):
+    """Return the cached list of (url, label, app) nav entries for the other tournaments and the tournament's rounds.
+
+    The list is cached until a tournament or round is saved or deleted.
+    """
+    def build():
+        entries = [(reverse_params("march_madness:group_scores", tournament=t.pk), str(t), "Tournaments")
+                   for t in Tournament.objects.all() if t != tourney]
+        entries.extend((reverse_params(rnd, tournament=tourney.pk), str(rnd), "March Madness")
+                       for rnd in tourney.rounds.all())
+        return entries
+
+    return get_or_set('tournaments', ['nav', tourney.pk], build)
 
 
 def get_nav_items(request, view, tourney):
     """Return a context with all of the proper nav items."""
-    nav_items = [view.NavItem(reverse_params("march_madness:group_scores", tournament=t.pk), str(t), app="Tournaments")
-                 for t in Tournament.objects.all() if t != tourney]
-
-    nav_items.extend([view.NavItem(reverse_params(rnd, tournament=tourney.pk), str(rnd), app="March Madness")
-                      for rnd in tourney.rounds.all()])
+    nav_items = [view.NavItem(url, label, app=app) for url, label, app in get_nav_entries(tourney)]
 
     if request.user and request.user.is_authenticated:
         url = reverse_params("march_madness:bracket", url_kwargs={"user": request.user.username}, tournament=tourney.pk)
@@ -72,49 +89,86 @@ def get_nav_items(request, view, tourney):
     return context
 
 
-def get_form_or_match(request, user, match, rnd, *args, num_rounds=None, check_captain=False, **kwargs):
+def get_form_or_match(request, user, match, rnd, *args, num_rounds=None, check_captain=False, is_captain=None,
+                      predictions=None, **kwargs):
+    """Return a prediction form if the user can vote on the match else return the match.
+
+    Args:
+        request: Request object for the current user.
+        user (User): User whose bracket is being displayed.
+        match (Match): Match to display.
+        rnd (Round): Round of the match.
+        num_rounds (int)[None]: Number of rounds in the tournament.
+        check_captain (bool)[False]: If True the request user may vote for the user when they are the group captain.
+        is_captain (bool)[None]: Precomputed captain check. If None and check_captain the captain is looked up.
+        predictions (dict)[None]: Preloaded match id: UserPrediction dictionary for the user.
+    """
     now = timezone.now().date()
 
     match.num_rounds = num_rounds
 
-    is_captain = check_captain and match.get_captain_for_user(user) == request.user
+    if is_captain is None:
+        is_captain = check_captain and match.get_captain_for_user(user) == request.user
     can_user_vote = request.user.is_authenticated and (user == request.user or is_captain)
 
     if user is None:
         return match
     elif match.victor or not can_user_vote or (rnd and (rnd.start_date and now >= rnd.start_date)):
-        match.user_guess = match.prediction(user)
+        match.user_guess = match.prediction(user, predictions)
 
         parent1, parent2 = match.parent_matches()
         if parent1:
-            match.parent_team1_guess = parent1.prediction(user)
+            match.parent_team1_guess = parent1.prediction(user, predictions)
             if not match.team1 and parent1.victor:
                 match.team1 = parent1.victor
                 match.save()
         if parent2:
-            match.parent_team2_guess = parent2.prediction(user)
+            match.parent_team2_guess = parent2.prediction(user, predictions)
             if not match.team2 and parent2.victor:
                 match.team2 = parent2.victor
                 match.save()
 
         return match
 
-    form = UserPredictionForm(user, match, *args, **kwargs)
+    form = UserPredictionForm(user, match, *args, predictions=predictions, **kwargs)
     if match and match.date:
         form.date = match.date
     return form
 
 
+def get_bracket_matches(request, user, tourney, rounds=None, check_captain=False):
+    """Return a dictionary of round: list of forms or matches for the user's bracket.
+
+    The bracket and all of the user's predictions are loaded up front, so the number of queries does not grow with
+    the number of matches.
+
+    Args:
+        request: Request object for the current user.
+        user (User): User whose bracket is being displayed. None shows the matches without predictions.
+        tourney (Tournament): Tournament to display.
+        rounds (list)[None]: Rounds to display. By default all rounds are displayed.
+        check_captain (bool)[False]: If True the request user may vote for the user when they are the group captain.
+    """
+    bracket = tourney.get_bracket()
+    num_rounds = len(bracket.rounds)
+    predictions = bracket.get_predictions(user)
+    is_captain = check_captain and user is not None and tourney.get_captain_for_user(user) == request.user
+    if rounds is None:
+        rounds = bracket.rounds
+
+    return {rnd: [get_form_or_match(request, user, match, rnd, num_rounds=num_rounds, is_captain=is_captain,
+                                    predictions=predictions)
+                  for match in bracket.get_round_matches(rnd)]
+            for rnd in rounds}
+
+
 def tournament_standings(request):
     tourney = get_tournament_or_404(request)
 
     view = MarchMadnessNav(title=str(tourney), page_title="Tournament Standings")
     context = get_nav_items(request, view, tourney)
 
-    num_rounds = tourney.rounds.count()
-    context["matches"] = {rnd: [get_form_or_match(request, None, mtch, rnd, num_rounds=num_rounds)
-                                for mtch in rnd.matches.all()]
-                          for rnd in tourney.rounds.all().select_related()}
+    context["matches"] = get_bracket_matches(request, None, tourney)
     return render(request, "march_madness/bracket.html", context)
 
 
@@ -133,9 +187,7 @@ def view_bracket(request, user=None):
     context = get_nav_items(request, view, tourney)
 
     context["user"] = user
-    num_rounds = tourney.rounds.count()
-    context["matches"] = {rnd: [get_form_or_match(request, user, mtch, rnd, num_rounds=num_rounds) for mtch in rnd.matches.all()]
-                          for rnd in tourney.rounds.all().select_related()}
+    context["matches"] = get_bracket_matches(request, user, tourney)
     return render(request, "march_madness/bracket.html", context)
 
 
@@ -154,10 +206,7 @@ def captain_view_bracket(request, user=None):
     context = get_nav_items(request, view, tourney)
 
     context["user"] = user
-    num_rounds = tourney.rounds.count()
-    context["matches"] = {rnd: [get_form_or_match(request, user, mtch, rnd, num_rounds=num_rounds, check_captain=True)
-                                for mtch in rnd.matches.all()]
-                          for rnd in tourney.rounds.all().select_related()}
+    context["matches"] = get_bracket_matches(request, user, tourney, check_captain=True)
     return render(request, "march_madness/bracket.html", context)
 
 
@@ -172,8 +221,7 @@ def view_round(request, pk):
     context = get_nav_items(request, view, tourney)
 
     context["rnd"] = rnd
-    num_rounds = tourney.rounds.count()
-    context["matches"] = [get_form_or_match(request, user, match, rnd, num_rounds=num_rounds) for match in rnd.matches.all()]
+    context["matches"] = get_bracket_matches(request, user, tourney, rounds=[rnd])[rnd]
 
     return render(request, "march_madness/round.html", context)
 
@@ -200,22 +248,270 @@ def user_prediction(request):
     return redirect("march_madness:home")
 
 
+@login_required
+@require_POST
+def batch_predictions(request):
+    """Save many of a user's picks at once.
+
+    The request body is JSON ``{"user": <user id>, "picks": [[match, guess, team1_score, team2_score], ...]}`` where
+    the scores are optional. The picks are checked against the bracket in memory and the valid picks are saved in one
+    transaction. The user's open picks that the new picks make impossible are removed. Returns
+    ``{"success": bool, "saved": <count>, "removed": [match id], "errors": {match id: message}}``.
+    """
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        picks = data['picks']
+        user_id = int(data.get('user', request.user.pk))
+        if not isinstance(picks, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return compact_json({'success': False, 'saved': 0, 'removed': [], 'errors': {'picks': 'Invalid JSON picks'}},
+                            status=400)
+
+    tourney = get_tournament_or_404(request)
+    user = get_object_or_404(get_user_model(), pk=user_id)
+    if user != request.user and tourney.get_captain_for_user(user) != request.user:
+        return compact_json({'success': False, 'saved': 0, 'removed': [],
+                             'errors': {'user': 'Cannot vote for this user'}}, status=403)
+
+    bracket = tourney.get_bracket()
+    predictions = bracket.get_predictions(user)
+    now = timezone.now().date()
+    errors = {}
+
+    def is_locked(match):
+        return match.victor_id is not None or (match.round.start_date and now >= match.round.start_date)
+
+    # Read the picks
+    new_picks = {}
+    for pick in picks:
+        try:
+            match_id, guess_id = int(pick[0]), int(pick[1])
+            scores = [None if score in (None, '') else int(score) for score in (list(pick[2:4]) + [None, None])[:2]]
+            if any(score is not None and score < 0 for score in scores):
+                raise ValueError
+        except (ValueError, TypeError, IndexError, KeyError):
+            errors[str(pick)] = 'Invalid pick'
+            continue
+
+        match = bracket.matches.get(match_id, None)
+        if match is None:
+            errors[match_id] = 'Match is not in {}'.format(tourney)
+        elif is_locked(match):
+            errors[match_id] = 'You cannot set or change a prediction after the round has started!'
+        else:
+            new_picks[match_id] = (guess_id, scores)
+
+    # Check the picks against the bracket with the new picks in place. A rejected pick can change the choices of the
+    # matches after it, so check again without the rejected picks until every remaining pick is valid.
+    old_guesses = {match_id: pred.guess_id for match_id, pred in predictions.items()}
+    guesses = dict(old_guesses)
+    guesses.update({match_id: pick[0] for match_id, pick in new_picks.items()})
+    while True:
+        choices = bracket.get_team_choices(guesses)
+        rejected = [match_id for match_id, (guess_id, scores) in new_picks.items()
+                    if guess_id not in {team.pk for team in choices[match_id]}]
+        if not rejected:
+            break
+        for match_id in rejected:
+            errors[match_id] = 'Invalid guess for {}'.format(bracket.matches[match_id])
+            del new_picks[match_id]
+            guesses.pop(match_id)
+            if match_id in old_guesses:
+                guesses[match_id] = old_guesses[match_id]
+
+    # Remove the open picks that are no longer possible with the new picks
+    removed = [pred for match_id, pred in predictions.items()
+               if match_id not in new_picks and not is_locked(pred.match) and
+               pred.guess_id not in {team.pk for team in choices[match_id]}]
+
+    created, changed = [], []
+    for match_id, (guess_id, (team1_score, team2_score)) in new_picks.items():
+        pred = predictions.get(match_id, None)
+        if pred is None:
+            created.append(UserPrediction(user=user, match_id=match_id, guess_id=guess_id,
+                                          team1_score=team1_score, team2_score=team2_score))
+        elif (pred.guess_id, pred.team1_score, pred.team2_score) != (guess_id, team1_score, team2_score):
+            pred.guess_id, pred.team1_score, pred.team2_score = guess_id, team1_score, team2_score
+            changed.append(pred)
+
+    with transaction.atomic():
+        UserPrediction.objects.bulk_create(created)
+        UserPrediction.objects.bulk_update(changed, ['guess', 'team1_score', 'team2_score'])
+        UserPrediction.objects.filter(pk__in=[pred.pk for pred in removed]).delete()
+    if created or changed or removed:
+        clear_picks(user_ids=[user.pk])
+        UserScore.update_users(tourney, [user.pk])
+
+    return compact_json({'success': not errors, 'saved': len(created) + len(changed),
+                         'removed': sorted(pred.match_id for pred in removed),
+                         'errors': {str(key): value for key, value in errors.items()}})
+
+
 def view_group_scores(request):
     tourney = get_tournament_or_404(request)
     view = MarchMadnessNav(title=str(tourney), page_title="Group Scores")
     context = get_nav_items(request, view, tourney)
 
-    def modify_user(mem, tourney):
-        mem.score = tourney.get_user_score(mem) or 0
-        return mem
+    context["groups"] = tourney.get_leaderboard()
+    context["live_scores"] = live.ENABLED
 
-    context["groups"] = [{"name": group.name, "captain": group.captain, "score": 0,
-                          "members": [modify_user(mem, tourney)
-                                      for mem in group.members.all()]}
-                         for group in tourney.groups.all()]
+    return render(request, "march_madness/group_scores.html", context)
 
-    for group in context["groups"]:
-        for user in group["members"]:
-            group["score"] += user.score
 
-    return render(request, "march_madness/group_scores.html", context)
+def score_events(request):
+    """Stream the tournament's live score changes as Server-Sent Events.
+
+    Note:
+        This is a regular (sync) streaming view, so each connected client holds a worker thread until the stream times
+        out and the browser reconnects. It is only available when MARCH_MADNESS_LIVE_SCORES is set.
+    """
+    if not live.ENABLED:
+        raise Http404("Live scores are turned off")
+    tourney = get_tournament_or_404(request)
+    try:
+        last_id = int(request.META.get("HTTP_LAST_EVENT_ID", ""))
+    except ValueError:
+        last_id = None
+
+    response = StreamingHttpResponse(live.event_stream(live.get_channel(tourney), last_id),
+                                     content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def compact_json(data, **kwargs):
+    """Return a JsonResponse without whitespace."""
+    return JsonResponse(data, json_dumps_params={'separators': (',', ':')}, **kwargs)
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def bracket_etag(request):
+    tourney = get_tournament_or_404(request)
+    return make_etag(tourney.pk, get_version('results'), get_version('seeds'), get_version('teams'))
+
+
+@condition(etag_func=bracket_etag)
+def bracket_json(request):
+    """Return the tournament rounds, matches and results as compact JSON.
+
+    Teams are sent once in the teams table as [name, seed] keyed by id. The matches are lists in the order of
+    match_fields. Supports ETag and If-None-Match.
+    """
+    tourney = get_tournament_or_404(request)
+
+    def make_payload():
+        bracket = tourney.get_bracket()
+        seeds = TeamRank.get_seeds(tourney.year)
+        teams = {}
+        matches = []
+        for match in bracket:
+            for team in (match.team1, match.team2, match.victor):
+                if team is not None:
+                    teams[team.pk] = [team.name, seeds.get(team.pk, None)]
+            matches.append([match.pk, match.round.round_number, match.match_number, match.team1_id, match.team2_id,
+                            match.victor_id, match.team1_score, match.team2_score, match.tournament_value])
+
+        return {'tournament': [tourney.pk, tourney.name, tourney.year],
+                'rounds': [[rnd.pk, rnd.round_number, rnd.name, rnd.start_date and rnd.start_date.isoformat()]
+                           for rnd in bracket.rounds],
+                'teams': teams,
+                'match_fields': ['id', 'round', 'match', 'team1', 'team2', 'victor', 'team1_score', 'team2_score',
+                                 'value'],
+                'matches': matches}
+
+    return compact_json(get_or_set('bracket_json', [tourney.pk, bracket_etag(request)], make_payload))
+
+
+def group_history_etag(request, pk):
+    return make_etag(pk, get_version('results'))
+
+
+@condition(etag_func=group_history_etag)
+def group_history_json(request, pk):
+    """Return the group's points and rank after every complete round as compact JSON.
+
+    The total and each member's history are lists of [points, rank] in the order of rounds. A member without a
+    snapshot for a round has null. Supports ETag and If-None-Match.
+    """
+    def make_payload():
+        group = get_object_or_404(Group, pk=pk)
+        rounds = []
+        total = []
+        members = {}
+        snapshots = ScoreSnapshot.objects.filter(group=group).order_by('round__round_number').values_list(
+            'round__round_number', 'round__name', 'user', 'user__username', 'points', 'rank')
+        for round_number, round_name, user_id, username, points, rank in snapshots:
+            if not rounds or rounds[-1][0] != round_number:
+                rounds.append([round_number, round_name])
+            if user_id is None:
+                total.append([points, rank])
+            else:
+                member = members.setdefault(user_id, {'username': username, 'history': []})
+                member['history'].extend([None] * (len(rounds) - 1 - len(member['history'])))
+                member['history'].append([points, rank])
+        for member in members.values():
+            member['history'].extend([None] * (len(rounds) - len(member['history'])))
+
+        return {'group': [group.pk, group.name, group.tournament_id], 'rounds': rounds, 'total': total,
+                'members': members}
+
+    return compact_json(get_or_set('group_history', [pk, group_history_etag(request, pk)], make_payload))
+
+
+def picks_etag(request, user):
+    tourney = get_tournament_or_404(request)
+    user = get_object_or_404(get_user_model(), username__iexact=str(user))
+    versions = get_versions('picks:{}'.format(user.pk), 'picks:tournament:{}'.format(tourney.pk))
+    return make_etag(tourney.pk, user.pk, versions['picks:{}'.format(user.pk)],
+                     versions['picks:tournament:{}'.format(tourney.pk)])
+
+
+@condition(etag_func=picks_etag)
+def picks_json(request, user):
+    """Return the user's picks for the tournament as compact JSON.
+
+    The picks are lists in the order of pick_fields. Team ids match the teams table of bracket_json. Supports ETag
+    and If-None-Match.
+    """
+    tourney = get_tournament_or_404(request)
+    user = get_object_or_404(get_user_model(), username__iexact=str(user))
+    predictions = tourney.get_bracket().get_predictions(user)
+    return compact_json({'tournament': tourney.pk, 'user': [user.pk, user.username],
+                         'pick_fields': ['match', 'guess', 'team1_score', 'team2_score'],
+                         'picks': [[pred.match_id, pred.guess_id, pred.team1_score, pred.team2_score]
+                                   for pred in predictions.values()]})
+
+
+def view_simulation(request):
+    """Show the last pool simulation results for the tournament."""
+    tourney = get_tournament_or_404(request)
+    view = MarchMadnessNav(title=str(tourney), page_title="Pool Simulation")
+    context = get_nav_items(request, view, tourney)
+
+    context["results"] = list(get_results(tourney))
+
+    return render(request, "march_madness/simulation.html", context)
+
+
+@staff_member_required
+def view_instrumentation(request):
+    """Show the request query and timing aggregates of this server process. POST resets them."""
+    if request.method == "POST":
+        request_stats.reset()
+        return redirect("march_madness:instrumentation")
+
+    view = MarchMadnessNav(title="Instrumentation", page_title="Request Instrumentation")
+    context = view.get_context(request)
+    context["stats"] = request_stats.summary()
+    return render(request, "march_madness/instrumentation.html", context)
+
+
+@staff_member_required
+def instrumentation_json(request):
+    """Return the request query and timing aggregates of this server process."""
+    return JsonResponse(request_stats.summary())
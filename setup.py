@@ -82,6 +82,7 @@ if __name__ == "__main__":
               'django_reversion>=3.0.3',
               ],
           extras_require={
+              'simulate': ['numpy>=1.17'],
               },
 
           # entry_points={